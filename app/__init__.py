@@ -1,5 +1,5 @@
+import click
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_mail import Mail
@@ -10,12 +10,19 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-# Initialize extensions
-db = SQLAlchemy()
+# Initialize extensions (the models module owns the SQLAlchemy instance)
+from app.models.models import db
+from app.utils.sqlite import configure_sqlite
 migrate = Migrate()
 login_manager = LoginManager()
 mail = Mail()
 
+def _serving():
+    # False under ``flask <command>`` (db upgrade, shell, the CLI jobs), True
+    # for ``flask run`` and for a WSGI server importing the app
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.info_name == 'run'
+
 def create_app():
     app = Flask(__name__)
     
@@ -23,9 +30,29 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'medicore-secret-key-2024')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///medicore_library.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Read replicas: comma-separated URLs, each registered as a replica_N bind
+    replica_urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': url for i, url in enumerate(replica_urls)}
+    app.config['SQLALCHEMY_REPLICA_BINDS'] = list(app.config['SQLALCHEMY_BINDS'])
+    app.config['DB_READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+    app.config['POINTS_COMPACTION_INTERVAL'] = int(os.environ.get('POINTS_COMPACTION_INTERVAL', 30))  # seconds, 0 = off
+    app.config['TOPIC_ACCESS_FLUSH_INTERVAL'] = int(os.environ.get('TOPIC_ACCESS_FLUSH_INTERVAL', 10))  # seconds, 0 = only at exit
+    app.config['LEADERBOARD_REBUILD_SECONDS'] = int(os.environ.get('LEADERBOARD_REBUILD_SECONDS', 600))  # resync with other workers
+    app.config['QUIZ_AUTOSAVE_FLUSH_INTERVAL'] = int(os.environ.get('QUIZ_AUTOSAVE_FLUSH_INTERVAL', 5))  # seconds, 0 = only at exit
+    app.config['QUIZ_EXPIRY_SWEEP_INTERVAL'] = int(os.environ.get('QUIZ_EXPIRY_SWEEP_INTERVAL', 30))  # seconds, 0 = off
+    app.config['QUIZ_DEADLINE_GRACE_SECONDS'] = int(os.environ.get('QUIZ_DEADLINE_GRACE_SECONDS', 30))  # network slack
+    # Background threads and startup warm-up; off by default under CLI commands
+    app.config['BACKGROUND_WORKERS'] = os.environ.get('BACKGROUND_WORKERS', '1' if _serving() else '0').lower() in ['1', 'true', 'yes']
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
     
+    # SQLite production profile (WAL + tuned pragmas); ignored for other databases
+    app.config['SQLITE_PRODUCTION_MODE'] = os.environ.get('SQLITE_PRODUCTION_MODE', 'true').lower() in ['true', 'on', '1']
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB
+    
     # Email configuration
     app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
@@ -38,6 +65,7 @@ def create_app():
     
     # Initialize extensions with app
     db.init_app(app)
+    configure_sqlite(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     mail.init_app(app)
@@ -50,8 +78,8 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models.models import User
-        return User.query.get(int(user_id))
+        from app.services.user_cache import load_cached_user
+        return load_cached_user(int(user_id))
     
     # Create upload directory if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -75,6 +103,22 @@ def create_app():
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(ai_bp, url_prefix='/ai')
     
+    # CLI commands
+    from app.utils.query_plans import check_query_plans_command
+    app.cli.add_command(check_query_plans_command)
+    from app.services.badges import award_badges_command
+    app.cli.add_command(award_badges_command)
+    from app.services.points import compact_points_command, start_compactor
+    app.cli.add_command(compact_points_command)
+    from app.services.grading import regrade_quizzes_command
+    app.cli.add_command(regrade_quizzes_command)
+    from app.services.item_analysis import analyze_quizzes_command
+    app.cli.add_command(analyze_quizzes_command)
+    from app.services.quiz_sessions import submit_expired_command
+    app.cli.add_command(submit_expired_command)
+    from app.services.question_bank import import_questions_command
+    app.cli.add_command(import_questions_command)
+    
     # Create database tables
     with app.app_context():
         db.create_all()
@@ -93,4 +137,23 @@ def create_app():
             db.session.add(admin)
             db.session.commit()
     
+    if app.config['BACKGROUND_WORKERS']:
+        # Fold the points ledger into user totals and flush buffered topic
+        # access times in the background
+        start_compactor(app)
+        from app.services.topic_access import start_access_flusher
+        start_access_flusher(app)
+        
+        # Write quiz autosaves and auto-submit attempts past their time limit
+        from app.services.quiz_sessions import start_session_workers
+        start_session_workers(app)
+        
+        # Load today's word/quiz now and again after each midnight
+        from app.services.daily_content import start_prewarmer
+        start_prewarmer(app)
+        
+        # Load the drug catalog the pharmacology pages are served from
+        from app.services.drug_catalog import warm_catalog
+        warm_catalog(app)
+    
     return app
@@ -3,13 +3,17 @@ from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
+from app.utils.db_routing import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession can send opted-in reads to replicas configured in create_app
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Association tables for many-to-many relationships
 user_bookmarks = db.Table('user_bookmarks',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('resource_id', db.Integer, db.ForeignKey('resource.id'), primary_key=True)
+    db.Column('resource_id', db.Integer, db.ForeignKey('resource.id'), primary_key=True),
+    db.Column('created_at', db.DateTime, default=datetime.utcnow),
+    db.Index('ix_user_bookmarks_user_created', 'user_id', 'created_at', 'resource_id')
 )
 
 user_badges = db.Table('user_badges',
@@ -83,6 +87,8 @@ class Module(db.Model):
     
     # Relationships
     topics = db.relationship('Topic', backref='module', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_module_course_active_order', 'course_id', 'is_active', 'order_index'),)
 
 class Topic(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -105,6 +111,8 @@ class Topic(db.Model):
     progress_records = db.relationship('UserProgress', backref='topic', lazy=True, cascade='all, delete-orphan')
     quizzes = db.relationship('Quiz', backref='topic', lazy=True, cascade='all, delete-orphan')
     flashcards = db.relationship('Flashcard', backref='topic', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_topic_module_active_order', 'module_id', 'is_active', 'order_index'),)
 
 class Resource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -127,6 +135,14 @@ class Resource(db.Model):
     # Relationships
     ratings = db.relationship('ResourceRating', backref='resource', lazy=True, cascade='all, delete-orphan')
     
+    # Indexes for the library listing, "popular" and per-topic queries
+    __table_args__ = (
+        db.Index('ix_resource_active_type_created', 'is_active', 'resource_type', 'created_at'),
+        db.Index('ix_resource_active_created', 'is_active', 'created_at'),
+        db.Index('ix_resource_active_views', 'is_active', 'view_count'),
+        db.Index('ix_resource_topic_active', 'topic_id', 'is_active'),
+    )
+    
     def get_average_rating(self):
         ratings = [r.rating for r in self.ratings]
         return sum(ratings) / len(ratings) if ratings else 0
@@ -153,7 +169,10 @@ class UserProgress(db.Model):
     completed_at = db.Column(db.DateTime)
     
     # Unique constraint to prevent duplicate progress records
-    __table_args__ = (db.UniqueConstraint('user_id', 'topic_id', name='unique_user_topic_progress'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'topic_id', name='unique_user_topic_progress'),
+        db.Index('ix_user_progress_user_accessed', 'user_id', 'last_accessed'),
+    )
 
 class Badge(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -166,6 +185,36 @@ class Badge(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class UserCounters(db.Model):
+    """Running per-user totals that badge rules are evaluated against"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    topics_completed = db.Column(db.Integer, default=0, nullable=False)
+    quizzes_passed = db.Column(db.Integer, default=0, nullable=False)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)  # consecutive active days
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_active_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PointsEvent(db.Model):
+    """Append-only points ledger; folded into User.total_points by the compactor"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(30), nullable=False)  # topic_completed, quiz_passed, badge
+    source_id = db.Column(db.Integer)  # topic, quiz or badge id
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_points_event_user_created', 'user_id', 'created_at'),
+        db.Index('ix_points_event_created', 'created_at'),
+    )
+
+class LedgerCheckpoint(db.Model):
+    """Highest ledger event id already folded into user totals"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -180,6 +229,8 @@ class Quiz(db.Model):
     # Relationships
     questions = db.relationship('QuizQuestion', backref='quiz', lazy=True, cascade='all, delete-orphan')
     attempts = db.relationship('QuizAttempt', backref='quiz', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_quiz_topic_active', 'topic_id', 'is_active'),)
 
 class QuizQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -202,6 +253,33 @@ class QuizAttempt(db.Model):
     completed = db.Column(db.Boolean, default=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)  # started_at + quiz.time_limit; None = untimed
+    mode = db.Column(db.String(20), default='standard', server_default='standard', nullable=False)  # standard, adaptive
+    served_question_id = db.Column(db.Integer)  # adaptive: the question awaiting an answer
+    
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_user_quiz_started', 'user_id', 'quiz_id', 'started_at'),
+        db.Index('ix_quiz_attempt_open_expires', 'completed', 'expires_at'),
+    )
+
+class TopicMastery(db.Model):
+    """A user's estimated ability on a topic (logit scale) and its uncertainty"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), primary_key=True)
+    rating = db.Column(db.Float, default=0.0, nullable=False)
+    variance = db.Column(db.Float, default=1.0, nullable=False)
+    answers_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QuizItemAnalysis(db.Model):
+    """Running item statistics for one quiz, folded in up to last_attempt_id"""
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), primary_key=True)
+    key_fingerprint = db.Column(db.String(64), nullable=False)  # answer key the sums were graded against
+    last_attempt_id = db.Column(db.Integer, default=0, nullable=False)
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)
+    sums = db.Column(db.Text)  # JSON sufficient statistics
+    results = db.Column(db.Text)  # JSON per-item metrics and alpha
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Flashcard(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -211,6 +289,25 @@ class Flashcard(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_flashcard_topic_active', 'topic_id', 'is_active'),)
+
+class FlashcardState(db.Model):
+    """A user's spaced-repetition schedule for one flashcard"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    flashcard_id = db.Column(db.Integer, db.ForeignKey('flashcard.id'), primary_key=True)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)  # copied from the card for per-topic queues
+    ease = db.Column(db.Float, default=2.5, nullable=False)
+    interval = db.Column(db.Integer, default=0, nullable=False)  # in days
+    repetitions = db.Column(db.Integer, default=0, nullable=False)  # successful reviews in a row
+    lapses = db.Column(db.Integer, default=0, nullable=False)
+    due = db.Column(db.DateTime, nullable=False)
+    last_reviewed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_flashcard_state_user_due', 'user_id', 'due'),
+        db.Index('ix_flashcard_state_user_topic_due', 'user_id', 'topic_id', 'due'),
+    )
 
 class DrugClass(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -258,6 +355,8 @@ class NewsArticle(db.Model):
     
     # Relationships
     author = db.relationship('User', backref='articles')
+    
+    __table_args__ = (db.Index('ix_news_article_published', 'is_published', 'published_at'),)
 
 class WordOfTheDay(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -268,6 +367,8 @@ class WordOfTheDay(db.Model):
     category = db.Column(db.String(50))  # medical, pharmacy, nursing
     date = db.Column(db.Date, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_word_of_the_day_date_category', 'date', 'category'),)
 
 class QuizOfTheDay(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -278,6 +379,8 @@ class QuizOfTheDay(db.Model):
     category = db.Column(db.String(50))  # medical, pharmacy, nursing
     date = db.Column(db.Date, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_quiz_of_the_day_date_category', 'date', 'category'),)
 
 class FAQ(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -310,3 +413,5 @@ class SearchLog(db.Model):
     
     # Relationships
     user = db.relationship('User', backref='search_logs')
+    
+    __table_args__ = (db.Index('ix_search_log_created', 'created_at'),)
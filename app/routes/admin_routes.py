@@ -1,10 +1,21 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import (Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response,
+                   stream_with_context)
 from flask_login import login_required, current_user
 from app.models.models import (db, User, Course, Module, Topic, Resource, Quiz, QuizQuestion, 
                               Flashcard, DrugClass, Drug, NewsArticle, WordOfTheDay, QuizOfTheDay, 
-                              FAQ, ContactMessage, Badge, UserProgress)
+                              FAQ, ContactMessage, Badge, UserProgress, QuizItemAnalysis)
+from app.services.daily_content import invalidate_daily_content
+from app.services.facets import invalidate_facets
+from app.services.grading import invalidate_answer_key, regrade_attempts
+from app.services.item_analysis import analysis_summaries, analyze_quiz
+from app.services.outline import rebuild_outline
+from app.services.question_bank import FORMATS, detect_format, export_questions, import_questions
+from app.utils.db_routing import replica_reads
+from app.utils.pagination import keyset_paginate, USER_SORTS
 from datetime import datetime, date
+from functools import wraps
 from werkzeug.utils import secure_filename
+import io
 import os
 import json
 
@@ -12,6 +23,7 @@ admin_bp = Blueprint('admin', __name__)
 
 def admin_required(f):
     """Decorator to require admin access"""
+    @wraps(f)
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin:
             flash('Access denied. Admin privileges required.', 'error')
@@ -22,6 +34,7 @@ def admin_required(f):
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
+@replica_reads
 def dashboard():
     # Get statistics
     stats = {
@@ -48,14 +61,14 @@ def dashboard():
                          recent_users=recent_users,
                          recent_resources=recent_resources,
                          recent_messages=recent_messages,
-                         user_distribution=user_distribution)
+                         user_distribution=user_distribution,
+                         quiz_analyses=analysis_summaries())
 
 # User Management
 @admin_bp.route('/users')
 @login_required
 @admin_required
 def users():
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     track = request.args.get('track', '')
     
@@ -72,8 +85,11 @@ def users():
     if track:
         query = query.filter_by(track=track)
     
-    users = query.order_by(User.created_at.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
+    users = keyset_paginate(query, USER_SORTS, 'created_at',
+                            after=request.args.get('after'),
+                            before=request.args.get('before'),
+                            per_page=20,
+                            count_key=('admin.users', search, track))
     
     tracks = ['Medical', 'Nursing', 'Pharmacy']
     
@@ -189,6 +205,7 @@ def add_course():
             
             db.session.add(course)
             db.session.commit()
+            rebuild_outline()
             
             if request.is_json:
                 return jsonify({'success': True, 'message': 'Course created successfully'})
@@ -245,6 +262,7 @@ def add_module():
             
             db.session.add(module)
             db.session.commit()
+            rebuild_outline()
             
             if request.is_json:
                 return jsonify({'success': True, 'message': 'Module created successfully'})
@@ -312,6 +330,7 @@ def add_topic():
             
             db.session.add(topic)
             db.session.commit()
+            rebuild_outline()
             
             if request.is_json:
                 return jsonify({'success': True, 'message': 'Topic created successfully'})
@@ -410,6 +429,7 @@ def add_resource():
             
             db.session.add(resource)
             db.session.commit()
+            invalidate_facets()
             
             flash('Resource added successfully!', 'success')
             return redirect(url_for('admin.resources'))
@@ -547,6 +567,7 @@ def add_word_of_day():
             db.session.add(word_entry)
         
         db.session.commit()
+        invalidate_daily_content()
         
         if request.is_json:
             return jsonify({'success': True, 'message': 'Word of the day saved successfully'})
@@ -596,6 +617,92 @@ def mark_message_read(message_id):
         db.session.rollback()
         return jsonify({'success': False}), 500
 
+# Quiz grading
+@admin_bp.route('/quizzes/<int:quiz_id>/regrade', methods=['POST'])
+@login_required
+@admin_required
+def regrade_quiz(quiz_id):
+    """Re-score a quiz's completed attempts against its current answer key"""
+    Quiz.query.get_or_404(quiz_id)
+    invalidate_answer_key(quiz_id)
+    
+    try:
+        result = regrade_attempts(quiz_id)
+        return jsonify({'success': True, 'checked': result.checked, 'updated': result.changed})
+    except Exception:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to regrade attempts'}), 500
+
+@admin_bp.route('/quizzes/<int:quiz_id>/analysis', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def quiz_analysis(quiz_id):
+    """Stored item statistics for a quiz; POST folds in attempts completed since the last run"""
+    Quiz.query.get_or_404(quiz_id)
+    
+    if request.method == 'POST':
+        try:
+            analysis = analyze_quiz(quiz_id, full=request.args.get('full') == '1')
+        except Exception:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'Failed to analyse quiz'}), 500
+    else:
+        analysis = QuizItemAnalysis.query.get(quiz_id)
+        if analysis is None:
+            return jsonify({'success': False, 'message': 'Quiz has not been analysed yet'}), 404
+    
+    return jsonify({
+        'success': True,
+        'quiz_id': quiz_id,
+        'last_attempt_id': analysis.last_attempt_id,
+        'updated_at': analysis.updated_at.isoformat() if analysis.updated_at else None,
+        **json.loads(analysis.results or '{}')
+    })
+
+# Question bank import / export
+@admin_bp.route('/quizzes/questions/import', methods=['POST'])
+@login_required
+@admin_required
+def import_quiz_questions():
+    """Import questions from an uploaded CSV, JSONL or GIFT file; ?dry_run=1 only validates"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'No file uploaded'}), 400
+    
+    fmt = (request.form.get('format') or detect_format(secure_filename(upload.filename))).lower()
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f'Unsupported format: {fmt}'}), 400
+    quiz_id = request.form.get('quiz_id', type=int)
+    dry_run = (request.form.get('dry_run') or request.args.get('dry_run')) in ('1', 'true', 'on')
+    
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = import_questions(stream, fmt, default_quiz_id=quiz_id, dry_run=dry_run)
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'File must be UTF-8 encoded'}), 400
+    except Exception:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to import questions'}), 500
+    
+    return jsonify({'success': True, **report.as_dict()})
+
+@admin_bp.route('/quizzes/<int:quiz_id>/questions/export')
+@login_required
+@admin_required
+def export_quiz_questions(quiz_id):
+    """Download a quiz's questions as CSV, JSONL or GIFT"""
+    Quiz.query.get_or_404(quiz_id)
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f'Unsupported format: {fmt}'}), 400
+    
+    mimetypes = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'gift': 'text/plain'}
+    return Response(
+        stream_with_context(export_questions(fmt, quiz_id)),
+        mimetype=mimetypes[fmt],
+        headers={'Content-Disposition': f'attachment; filename=quiz-{quiz_id}-questions.{fmt}'}
+    )
+
 # FAQ Management
 @admin_bp.route('/faq')
 @login_required
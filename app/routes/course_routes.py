@@ -1,8 +1,23 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, abort
 from flask_login import login_required, current_user
-from app.models.models import db, Course, Module, Topic, Resource, UserProgress, Quiz, QuizAttempt, Flashcard, WordOfTheDay, QuizOfTheDay
-from datetime import date, datetime
+from sqlalchemy.orm import joinedload, selectinload
+from app.models.models import db, Course, Module, Topic, UserProgress, Quiz, QuizAttempt, Flashcard, TopicMastery
+from app.services.adaptive import (begin_session, get_difficulty_index, record_answer, session_finished,
+                                   session_score)
+from app.services.badges import record_event
+from app.services.daily_content import get_daily_content
+from app.services.flashcards import DECK_SIZE, build_deck, parse_rating, review, topic_states
+from app.services.grading import decode_answers, get_answer_key, grade
+from app.services.outline import (NO_PROGRESS, active_modules, active_topics, get_outline, module_summary,
+                                  progress_for)
+from app.services.points import award_points, current_points, level_for
+from app.services.quiz_sessions import (QUIZ_PASS_POINTS, attempt_meta, autosave, claim_attempts, deadline_for, forget,
+                                        is_expired, saved_answers, seconds_left)
+from app.services.topic_access import record_access
+from app.utils.queries import quiz_attempts as attempts_for, topic_neighbours, topic_resources
+from datetime import datetime
 import json
+import math
 
 course_bp = Blueprint('course', __name__)
 
@@ -21,9 +36,9 @@ def index():
     user_track = current_user.track
     
     # Get word of the day and quiz of the day
-    today = date.today()
-    word_of_day = WordOfTheDay.query.filter_by(date=today).first()
-    quiz_of_day = QuizOfTheDay.query.filter_by(date=today).first()
+    daily = get_daily_content()
+    word_of_day = daily.word()
+    quiz_of_day = daily.quiz()
     
     return render_template('courses/index.html',
                          courses_by_track=courses_by_track,
@@ -41,14 +56,20 @@ def track_courses(track):
     # Get courses for the selected track
     courses = Course.query.filter_by(track=track, is_active=True).all()
     
-    # Get user's progress for this track
+    # Get user's progress for this track: topic counts from the outline, one progress query
+    outline = get_outline()
+    course_topics = {}
+    for course in courses:
+        course_outline = outline.course(course.id)
+        modules = active_modules(course_outline) if course_outline else ()
+        course_topics[course.id] = [topic.id for module in modules for topic in active_topics(module)]
+    progress = progress_for(current_user.id, [tid for tids in course_topics.values() for tid in tids])
+    
     progress_data = []
     for course in courses:
-        total_topics = Topic.query.join(Module).filter(Module.course_id == course.id).count()
-        completed_topics = UserProgress.query.join(Topic).join(Module)\
-            .filter(Module.course_id == course.id,
-                    UserProgress.user_id == current_user.id,
-                    UserProgress.completed == True).count()
+        topic_ids = course_topics[course.id]
+        total_topics = len(topic_ids)
+        completed_topics = sum(1 for tid in topic_ids if progress.get(tid, NO_PROGRESS).completed)
         
         progress_percentage = (completed_topics / total_topics * 100) if total_topics > 0 else 0
         
@@ -59,15 +80,10 @@ def track_courses(track):
             'progress_percentage': progress_percentage
         })
     
-    # Get word of the day and quiz of the day
-    today = date.today()
-    word_of_day = WordOfTheDay.query.filter_by(date=today, category=track.lower()).first()
-    if not word_of_day:
-        word_of_day = WordOfTheDay.query.filter_by(date=today).first()
-    
-    quiz_of_day = QuizOfTheDay.query.filter_by(date=today, category=track.lower()).first()
-    if not quiz_of_day:
-        quiz_of_day = QuizOfTheDay.query.filter_by(date=today).first()
+    # Get word of the day and quiz of the day (track category, else any)
+    daily = get_daily_content()
+    word_of_day = daily.word(track.lower())
+    quiz_of_day = daily.quiz(track.lower())
     
     return render_template('courses/track.html',
                          track=track,
@@ -85,26 +101,13 @@ def course_detail(course_id):
         flash('You don\'t have access to this course.', 'error')
         return redirect(url_for('course.index'))
     
-    # Get modules with their topics
-    modules = Module.query.filter_by(course_id=course_id, is_active=True)\
-        .order_by(Module.order_index).all()
+    # Get modules with their topics from the outline cache
+    course_outline = get_outline().course(course_id)
+    modules = active_modules(course_outline) if course_outline else ()
     
     # Get user's progress for each module
-    module_progress = {}
-    for module in modules:
-        total_topics = len(module.topics)
-        completed_topics = UserProgress.query.join(Topic)\
-            .filter(Topic.module_id == module.id,
-                    UserProgress.user_id == current_user.id,
-                    UserProgress.completed == True).count()
-        
-        progress_percentage = (completed_topics / total_topics * 100) if total_topics > 0 else 0
-        
-        module_progress[module.id] = {
-            'total_topics': total_topics,
-            'completed_topics': completed_topics,
-            'progress_percentage': progress_percentage
-        }
+    progress = progress_for(current_user.id, [topic.id for module in modules for topic in active_topics(module)])
+    module_progress = {module.id: module_summary(module, progress) for module in modules}
     
     # Get recent activity for this course
     recent_activity = UserProgress.query.join(Topic).join(Module)\
@@ -113,9 +116,9 @@ def course_detail(course_id):
         .order_by(UserProgress.last_accessed.desc()).limit(5).all()
     
     # Get word of the day and quiz of the day
-    today = date.today()
-    word_of_day = WordOfTheDay.query.filter_by(date=today, category=course.track.lower()).first()
-    quiz_of_day = QuizOfTheDay.query.filter_by(date=today, category=course.track.lower()).first()
+    daily = get_daily_content()
+    word_of_day = daily.word(course.track.lower(), fallback=False)
+    quiz_of_day = daily.quiz(course.track.lower(), fallback=False)
     
     return render_template('courses/course_detail.html',
                          course=course,
@@ -137,17 +140,11 @@ def module_detail(module_id):
         return redirect(url_for('course.index'))
     
     # Get topics with user progress
-    topics = Topic.query.filter_by(module_id=module_id, is_active=True)\
-        .order_by(Topic.order_index).all()
-    
-    topic_progress = {}
-    for topic in topics:
-        progress = UserProgress.query.filter_by(user_id=current_user.id, topic_id=topic.id).first()
-        topic_progress[topic.id] = {
-            'completed': progress.completed if progress else False,
-            'progress_percentage': progress.progress_percentage if progress else 0,
-            'last_accessed': progress.last_accessed if progress else None
-        }
+    module_outline = get_outline().module(module_id)
+    topics = active_topics(module_outline) if module_outline else ()
+    
+    progress = progress_for(current_user.id, [topic.id for topic in topics])
+    topic_progress = {topic.id: progress.get(topic.id, NO_PROGRESS)._asdict() for topic in topics}
     
     return render_template('courses/module_detail.html',
                          module=module,
@@ -155,10 +152,25 @@ def module_detail(module_id):
                          topics=topics,
                          topic_progress=topic_progress)
 
+def _topic_neighbours(topic):
+    """Previous and next active topics in the module, fetched with one windowed query"""
+    neighbours = topic_neighbours(topic).all()
+    
+    found = {row.Topic.id: row.Topic for row in neighbours if row.Topic is not None}
+    if not neighbours:
+        return None, None
+    return found.get(neighbours[0].prev_id), found.get(neighbours[0].next_id)
+
 @course_bp.route('/topic/<int:topic_id>')
 @login_required
 def topic_detail(topic_id):
-    topic = Topic.query.get_or_404(topic_id)
+    # Topic, its module/course and its resources, flashcards and quizzes in four queries
+    topic = Topic.query.options(
+        joinedload(Topic.module).joinedload(Module.course),
+        selectinload(Topic.resources),
+        selectinload(Topic.flashcards),
+        selectinload(Topic.quizzes)
+    ).filter_by(id=topic_id).first_or_404()
     module = topic.module
     course = module.course
     
@@ -167,19 +179,18 @@ def topic_detail(topic_id):
         flash('You don\'t have access to this topic.', 'error')
         return redirect(url_for('course.index'))
     
-    # Get or create user progress
+    # Record the visit in the access buffer; the page itself does no writes
+    now = datetime.utcnow()
+    record_access(current_user.id, topic_id, now)
+    
+    # Existing progress, or an unsaved placeholder until the buffer is flushed
     progress = UserProgress.query.filter_by(user_id=current_user.id, topic_id=topic_id).first()
     if not progress:
-        progress = UserProgress(user_id=current_user.id, topic_id=topic_id)
-        db.session.add(progress)
-        db.session.commit()
-    
-    # Update last accessed
-    progress.last_accessed = datetime.utcnow()
-    db.session.commit()
+        progress = UserProgress(user_id=current_user.id, topic_id=topic_id, completed=False,
+                                progress_percentage=0, time_spent=0, last_accessed=now)
     
     # Get resources for this topic
-    resources = Resource.query.filter_by(topic_id=topic_id, is_active=True).all()
+    resources = [resource for resource in topic.resources if resource.is_active]
     
     # Organize resources by type
     resources_by_type = {}
@@ -189,17 +200,17 @@ def topic_detail(topic_id):
         resources_by_type[resource.resource_type].append(resource)
     
     # Get flashcards for this topic
-    flashcards = Flashcard.query.filter_by(topic_id=topic_id, is_active=True).all()
+    flashcards = [flashcard for flashcard in topic.flashcards if flashcard.is_active]
     
     # Get quizzes for this topic
-    quizzes = Quiz.query.filter_by(topic_id=topic_id, is_active=True).all()
+    quizzes = [quiz for quiz in topic.quizzes if quiz.is_active]
     
-    # Get quiz attempts for this user
-    quiz_attempts = {}
-    for quiz in quizzes:
-        attempts = QuizAttempt.query.filter_by(user_id=current_user.id, quiz_id=quiz.id)\
-            .order_by(QuizAttempt.started_at.desc()).all()
-        quiz_attempts[quiz.id] = attempts
+    # Get quiz attempts for this user, all quizzes in one query
+    quiz_attempts = {quiz.id: [] for quiz in quizzes}
+    if quizzes:
+        attempts = attempts_for(current_user.id, quiz_attempts).all()
+        for attempt in attempts:
+            quiz_attempts[attempt.quiz_id].append(attempt)
     
     # Parse illustrations if they exist
     illustrations = []
@@ -210,12 +221,7 @@ def topic_detail(topic_id):
             illustrations = []
     
     # Get navigation (previous/next topics)
-    all_topics = Topic.query.filter_by(module_id=module.id, is_active=True)\
-        .order_by(Topic.order_index).all()
-    
-    current_index = next((i for i, t in enumerate(all_topics) if t.id == topic_id), -1)
-    prev_topic = all_topics[current_index - 1] if current_index > 0 else None
-    next_topic = all_topics[current_index + 1] if current_index < len(all_topics) - 1 else None
+    prev_topic, next_topic = _topic_neighbours(topic)
     
     return render_template('courses/topic_detail.html',
                          topic=topic,
@@ -255,25 +261,34 @@ def quiz_detail(quiz_id):
                          questions=questions,
                          attempts_count=attempts_count)
 
-@course_bp.route('/quiz/<int:quiz_id>/start', methods=['POST'])
-@login_required
-def start_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    
-    # Check access and attempts
+def _attempt_denied(quiz):
+    """Error response if the current user may not start an attempt at ``quiz``"""
     topic = quiz.topic
     if topic.module.course.track != current_user.track and not current_user.is_admin:
         return jsonify({'success': False, 'message': 'Access denied'}), 403
     
-    attempts_count = QuizAttempt.query.filter_by(user_id=current_user.id, quiz_id=quiz_id).count()
+    attempts_count = QuizAttempt.query.filter_by(user_id=current_user.id, quiz_id=quiz.id).count()
     if attempts_count >= quiz.max_attempts:
         return jsonify({'success': False, 'message': 'Maximum attempts exceeded'}), 400
+    return None
+
+@course_bp.route('/quiz/<int:quiz_id>/start', methods=['POST'])
+@login_required
+def start_quiz(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    
+    # Check access and attempts
+    denied = _attempt_denied(quiz)
+    if denied:
+        return denied
     
-    # Create new attempt
+    # Create new attempt; timed quizzes are submitted automatically at the deadline
+    started_at = datetime.utcnow()
     attempt = QuizAttempt(
         user_id=current_user.id,
         quiz_id=quiz_id,
-        started_at=datetime.utcnow()
+        started_at=started_at,
+        expires_at=deadline_for(started_at, quiz.time_limit)
     )
     
     try:
@@ -283,6 +298,8 @@ def start_quiz(quiz_id):
         return jsonify({
             'success': True,
             'attempt_id': attempt.id,
+            'expires_at': attempt.expires_at.isoformat() if attempt.expires_at else None,
+            'seconds_left': seconds_left(attempt.expires_at),
             'message': 'Quiz started successfully'
         })
     except Exception as e:
@@ -301,55 +318,226 @@ def submit_quiz(attempt_id):
     if attempt.completed:
         return jsonify({'success': False, 'message': 'Quiz already completed'}), 400
     
-    data = request.get_json()
+    if attempt.mode == 'adaptive':
+        return jsonify({'success': False, 'message': 'Adaptive quizzes are answered one question at a time'}), 400
+    
+    data = request.get_json(silent=True) or {}
     answers = data.get('answers', {})
+    if not isinstance(answers, dict):
+        return jsonify({'success': False, 'message': 'Answers must be an object keyed by question id'}), 400
     
-    # Calculate score
-    quiz = attempt.quiz
-    questions = quiz.questions
-    correct_answers = 0
-    total_questions = len(questions)
+    # Past the deadline only what was saved in time counts
+    expired = is_expired(attempt.expires_at)
+    if expired:
+        answers = saved_answers(attempt.id, attempt.answers)
     
-    for question in questions:
-        user_answer = answers.get(str(question.id), '')
-        if user_answer.lower().strip() == question.correct_answer.lower().strip():
-            correct_answers += 1
+    # Calculate score against the quiz's compiled answer key
+    quiz = attempt.quiz
+    result = grade(get_answer_key(quiz.id), answers)
+    
+    return _finish_attempt(attempt, quiz, answers, result.score, {
+        'correct_answers': result.correct_answers,
+        'total_questions': result.total_questions,
+        'earned_points': result.earned_points,
+        'possible_points': result.total_points,
+        'expired': expired
+    })
+
+@course_bp.route('/quiz-attempt/<int:attempt_id>/autosave', methods=['POST'])
+@login_required
+def autosave_quiz(attempt_id):
+    """Buffer the attempt's current answers (the full set, not a diff)"""
+    meta = attempt_meta(attempt_id)
+    if meta is None:
+        abort(404)
+    if meta.user_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    if meta.completed:
+        return jsonify({'success': False, 'message': 'Quiz already completed'}), 400
+    if meta.mode == 'adaptive':
+        return jsonify({'success': False, 'message': 'Adaptive quizzes are answered one question at a time'}), 400
+    if is_expired(meta.expires_at):
+        return jsonify({'success': False, 'message': 'Time is up for this quiz'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers')
+    if not isinstance(answers, dict):
+        return jsonify({'success': False, 'message': 'Answers must be an object keyed by question id'}), 400
+    
+    autosave(attempt_id, answers)
+    return jsonify({'success': True, 'seconds_left': seconds_left(meta.expires_at)})
+
+@course_bp.route('/quiz-attempt/<int:attempt_id>/session')
+@login_required
+def quiz_session(attempt_id):
+    """Saved answers and time left, for resuming an attempt after a reload"""
+    attempt = QuizAttempt.query.get_or_404(attempt_id)
+    if attempt.user_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
     
-    score = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+    return jsonify({
+        'success': True,
+        'completed': bool(attempt.completed),
+        'answers': saved_answers(attempt.id, attempt.answers),
+        'expires_at': attempt.expires_at.isoformat() if attempt.expires_at else None,
+        'seconds_left': seconds_left(attempt.expires_at)
+    })
+
+def _finish_attempt(attempt, quiz, answers, score, details):
+    """Complete the attempt, grant pass rewards and commit; ``details`` are added to the response"""
+    # The expiry sweeper may be submitting this attempt right now; only the
+    # caller whose guarded UPDATE flips ``completed`` goes on to grant rewards
+    if not claim_attempts([attempt.id]):
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Quiz already completed'}), 400
     
-    # Update attempt
     attempt.answers = json.dumps(answers)
     attempt.score = score
     attempt.completed = True
     attempt.completed_at = datetime.utcnow()
     attempt.time_taken = int((datetime.utcnow() - attempt.started_at).total_seconds() / 60)
     
+    # Only the first pass of a quiz counts towards quizzes_passed
+    passed_before = db.session.query(QuizAttempt.id).filter(
+        QuizAttempt.user_id == current_user.id,
+        QuizAttempt.quiz_id == quiz.id,
+        QuizAttempt.id != attempt.id,
+        QuizAttempt.completed == True,
+        QuizAttempt.score >= quiz.passing_score
+    ).first() is not None
+    
     # Award points if passed
+    badges_awarded = []
     if score >= quiz.passing_score:
-        points_awarded = 20  # Base points for passing a quiz
-        current_user.total_points += points_awarded
+        points_awarded = QUIZ_PASS_POINTS  # Base points for passing a quiz
+        # Ledger append; the compactor folds it into total_points and level
+        award_points(current_user.id, points_awarded, 'quiz_passed', quiz.id)
         
-        # Check for level up
-        new_level = (current_user.total_points // 100) + 1
-        if new_level > current_user.level:
-            current_user.level = new_level
+        badges_awarded = record_event(current_user.id, quizzes_passed=0 if passed_before else 1, points=points_awarded)
     
     try:
         db.session.commit()
+        forget(attempt.id)
+        total_points = current_points(current_user.id)
         
         return jsonify({
             'success': True,
             'score': score,
             'passed': score >= quiz.passing_score,
-            'correct_answers': correct_answers,
-            'total_questions': total_questions,
-            'new_level': current_user.level,
-            'total_points': current_user.total_points
+            **details,
+            'new_level': max(current_user.level, level_for(total_points)),
+            'total_points': total_points,
+            'badges_awarded': [badge.name for badge in badges_awarded]
         })
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to submit quiz'}), 500
 
+def _question_payload(question):
+    try:
+        options = json.loads(question.options) if question.options else None
+    except ValueError:
+        options = None
+    return {
+        'id': question.id,
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'options': options
+    }
+
+def _mastery_payload(mastery):
+    return {'mastery': round(mastery.rating, 3), 'standard_error': round(math.sqrt(mastery.variance), 3)}
+
+@course_bp.route('/quiz/<int:quiz_id>/adaptive/start', methods=['POST'])
+@login_required
+def start_adaptive_quiz(quiz_id):
+    """Start an attempt that serves one question at a time, matched to the user's mastery"""
+    quiz = Quiz.query.get_or_404(quiz_id)
+    
+    denied = _attempt_denied(quiz)
+    if denied:
+        return denied
+    
+    index = get_difficulty_index(quiz_id)
+    if not len(index):
+        return jsonify({'success': False, 'message': 'This quiz has no questions'}), 400
+    
+    mastery = begin_session(current_user.id, quiz.topic_id)
+    question = index.questions[index.nearest(mastery.rating, set())]
+    attempt = QuizAttempt(
+        user_id=current_user.id,
+        quiz_id=quiz_id,
+        answers='{}',
+        mode='adaptive',
+        served_question_id=question.id,
+        started_at=datetime.utcnow()
+    )
+    
+    try:
+        db.session.add(attempt)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to start quiz'}), 500
+    
+    return jsonify({
+        'success': True,
+        'attempt_id': attempt.id,
+        'question': _question_payload(question),
+        **_mastery_payload(mastery)
+    })
+
+@course_bp.route('/quiz-attempt/<int:attempt_id>/adaptive/answer', methods=['POST'])
+@login_required
+def answer_adaptive_question(attempt_id):
+    attempt = QuizAttempt.query.get_or_404(attempt_id)
+    
+    if attempt.user_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    if attempt.completed:
+        return jsonify({'success': False, 'message': 'Quiz already completed'}), 400
+    
+    if attempt.mode != 'adaptive':
+        return jsonify({'success': False, 'message': 'Not an adaptive quiz attempt'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    question_id = data.get('question_id')
+    index = get_difficulty_index(attempt.quiz_id)
+    answers = decode_answers(attempt.answers)
+    # Only the question that was served can be answered
+    if question_id != attempt.served_question_id or question_id not in index.questions:
+        return jsonify({'success': False, 'message': 'Answer the question that was served'}), 400
+    
+    mastery = db.session.get(TopicMastery, (current_user.id, index.topic_id)) or \
+        begin_session(current_user.id, index.topic_id)
+    answer = data.get('answer')
+    correct = record_answer(index, mastery, question_id, answer)
+    answers[str(question_id)] = answer
+    attempt.answers = json.dumps(answers)
+    
+    progress = {'correct': correct, 'answered': len(answers), **_mastery_payload(mastery)}
+    if not session_finished(index, len(answers), mastery.variance):
+        next_id = index.nearest(mastery.rating, {int(key) for key in answers})
+        attempt.served_question_id = next_id
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'Failed to save answer'}), 500
+        return jsonify({'success': True, 'finished': False,
+                        'question': _question_payload(index.questions[next_id]), **progress})
+    
+    # Converged (or out of questions): score as the expected result on the whole quiz
+    attempt.served_question_id = None
+    result = grade(index.key, answers)
+    return _finish_attempt(attempt, attempt.quiz, answers, session_score(index, answers), {
+        'finished': True,
+        'correct_answers': result.correct_answers,
+        'total_questions': len(answers),
+        **progress
+    })
+
 @course_bp.route('/flashcards/<int:topic_id>')
 @login_required
 def flashcards(topic_id):
@@ -361,36 +549,99 @@ def flashcards(topic_id):
     
     flashcards = Flashcard.query.filter_by(topic_id=topic_id, is_active=True).all()
     
+    # Unseen and due cards first, then the rest by when they fall due
+    now = datetime.utcnow()
+    card_states = topic_states(current_user.id, topic_id)
+    flashcards.sort(key=lambda card: card_states[card.id].due if card.id in card_states else now)
+    
     return render_template('courses/flashcards.html',
                          topic=topic,
-                         flashcards=flashcards)
+                         flashcards=flashcards,
+                         card_states=card_states,
+                         now=now)
+
+@course_bp.route('/flashcards/deck')
+@login_required
+def flashcard_deck():
+    """Today's review deck: due cards across all topics (or one topic) plus a few new ones"""
+    topic_id = request.args.get('topic_id', type=int)
+    limit = min(max(request.args.get('limit', DECK_SIZE, type=int), 1), 200)
+    
+    if topic_id is not None:
+        topic = Topic.query.get_or_404(topic_id)
+        if topic.module.course.track != current_user.track and not current_user.is_admin:
+            return jsonify({'error': 'Access denied'}), 403
+    
+    deck = build_deck(current_user.id, topic_id=topic_id, limit=limit)
+    return jsonify({
+        'cards': [{
+            'id': card.flashcard_id,
+            'topic_id': card.topic_id,
+            'front_text': card.front_text,
+            'back_text': card.back_text,
+            'due': card.due.isoformat() if card.due else None,
+            'interval': card.interval,
+            'is_new': card.is_new
+        } for card in deck]
+    })
+
+@course_bp.route('/flashcards/review', methods=['POST'])
+@login_required
+def review_flashcard():
+    data = request.get_json(silent=True) or {}
+    rating = parse_rating(data.get('rating'))
+    flashcard_id = data.get('flashcard_id')
+    if rating is None or not isinstance(flashcard_id, int):
+        return jsonify({'success': False, 'message': 'flashcard_id and a rating (0-5 or again/hard/good/easy) are required'}), 400
+    
+    card = db.session.get(Flashcard, flashcard_id)
+    if card is None:
+        return jsonify({'success': False, 'message': 'Flashcard not found'}), 404
+    if card.topic.module.course.track != current_user.track and not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        state = review(current_user.id, flashcard_id, rating)
+        if state is None:
+            return jsonify({'success': False, 'message': 'Flashcard not found'}), 404
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to record review'}), 500
+    
+    return jsonify({
+        'success': True,
+        'due': state.due.isoformat(),
+        'interval': state.interval,
+        'ease': round(state.ease, 2),
+        'repetitions': state.repetitions
+    })
 
 @course_bp.route('/api/modules/<int:course_id>')
 @login_required
 def api_course_modules(course_id):
     """API endpoint to get modules for a course"""
-    course = Course.query.get_or_404(course_id)
+    course = get_outline().course(course_id)
+    if course is None:
+        abort(404)
     
     # Check access
     if course.track != current_user.track and not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
     
-    modules = Module.query.filter_by(course_id=course_id, is_active=True)\
-        .order_by(Module.order_index).all()
+    modules = active_modules(course)
+    progress = progress_for(current_user.id, [topic.id for module in modules for topic in active_topics(module)])
     
     modules_data = []
     for module in modules:
-        topics = Topic.query.filter_by(module_id=module.id, is_active=True)\
-            .order_by(Topic.order_index).all()
-        
         topics_data = []
-        for topic in topics:
-            progress = UserProgress.query.filter_by(user_id=current_user.id, topic_id=topic.id).first()
+        for topic in active_topics(module):
+            topic_progress = progress.get(topic.id, NO_PROGRESS)
             topics_data.append({
                 'id': topic.id,
                 'title': topic.title,
-                'completed': progress.completed if progress else False,
-                'progress_percentage': progress.progress_percentage if progress else 0
+                'completed': topic_progress.completed,
+                'progress_percentage': topic_progress.progress_percentage
             })
         
         modules_data.append({
@@ -412,7 +663,7 @@ def api_topic_resources(topic_id):
     if topic.module.course.track != current_user.track and not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
     
-    resources = Resource.query.filter_by(topic_id=topic_id, is_active=True).all()
+    resources = topic_resources(topic_id).all()
     
     resources_data = []
     for resource in resources:
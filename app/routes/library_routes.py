@@ -1,90 +1,95 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, abort, current_app
 from flask_login import login_required, current_user
 from app.models.models import db, Resource, ResourceRating, Topic, Module, Course, User
+from app.services.bookmarks import bookmarked_ids, is_bookmarked, toggle_bookmark, invalidate_bookmarks
+from app.services.facets import get_facets
+from app.utils.db_routing import replica_reads
+from app.utils.pagination import keyset_paginate, RESOURCE_SORTS
+from app.utils.queries import popular_resources, resource_listing
 from datetime import datetime
 import os
 from werkzeug.utils import secure_filename
 
 library_bp = Blueprint('library', __name__)
 
+def _resource_listing_filters():
+    """Read the library listing filters from the query string"""
+    return {
+        'type': request.args.get('type', 'all'),
+        'author': request.args.get('author', ''),
+        'year': request.args.get('year', ''),
+        'q': request.args.get('q', ''),
+        'sort': request.args.get('sort', 'created_at')
+    }
+
+def _listing_count_key(filters):
+    # Sorting doesn't change the total, so it is left out of the cache key
+    return ('library.resources',) + tuple(sorted((k, v) for k, v in filters.items() if k != 'sort'))
+
+def _resource_summary(resource):
+    return {
+        'id': resource.id,
+        'title': resource.title,
+        'description': resource.description,
+        'resource_type': resource.resource_type,
+        'author': resource.author,
+        'year_published': resource.year_published,
+        'view_count': resource.view_count,
+        'created_at': resource.created_at.isoformat() if resource.created_at else None,
+        'url': url_for('library.resource_detail', resource_id=resource.id)
+    }
+
 @library_bp.route('/')
 @login_required
+@replica_reads
 def index():
-    # Get filter parameters
-    resource_type = request.args.get('type', 'all')
-    author = request.args.get('author', '')
-    year = request.args.get('year', '')
-    search_query = request.args.get('q', '')
-    sort_by = request.args.get('sort', 'created_at')
-    page = request.args.get('page', 1, type=int)
-    
-    # Build query
-    query = Resource.query.filter_by(is_active=True)
-    
-    # Apply filters
-    if resource_type != 'all':
-        query = query.filter(Resource.resource_type == resource_type)
-    
-    if author:
-        query = query.filter(Resource.author.contains(author))
-    
-    if year:
-        query = query.filter(Resource.year_published == int(year))
-    
-    if search_query:
-        query = query.filter(
-            db.or_(
-                Resource.title.contains(search_query),
-                Resource.description.contains(search_query),
-                Resource.author.contains(search_query)
-            )
-        )
-    
-    # Apply sorting
-    if sort_by == 'title':
-        query = query.order_by(Resource.title)
-    elif sort_by == 'author':
-        query = query.order_by(Resource.author)
-    elif sort_by == 'year':
-        query = query.order_by(Resource.year_published.desc())
-    elif sort_by == 'popular':
-        query = query.order_by(Resource.view_count.desc())
-    elif sort_by == 'rating':
-        # This would require a more complex query with joins
-        query = query.order_by(Resource.created_at.desc())
-    else:  # created_at
-        query = query.order_by(Resource.created_at.desc())
-    
-    # Paginate results
-    resources = query.paginate(page=page, per_page=12, error_out=False)
-    
-    # Get filter options
-    resource_types = db.session.query(Resource.resource_type.distinct()).filter(Resource.is_active == True).all()
-    resource_types = [rt[0] for rt in resource_types if rt[0]]
-    
-    authors = db.session.query(Resource.author.distinct()).filter(Resource.is_active == True, Resource.author != None).all()
-    authors = [author[0] for author in authors if author[0]][:50]  # Limit to top 50 authors
-    
-    years = db.session.query(Resource.year_published.distinct()).filter(Resource.is_active == True, Resource.year_published != None).order_by(Resource.year_published.desc()).all()
-    years = [year[0] for year in years if year[0]]
+    filters = _resource_listing_filters()
+    query = resource_listing(filters)
+    
+    # Seek pagination: ?after=<cursor> / ?before=<cursor> instead of ?page=N
+    resources = keyset_paginate(query, RESOURCE_SORTS, filters['sort'],
+                                after=request.args.get('after'),
+                                before=request.args.get('before'),
+                                per_page=12,
+                                count_key=_listing_count_key(filters))
+    
+    # Get filter options (counts honour the other active filters)
+    facets = get_facets(filters['type'], filters['author'], filters['year'], filters['q'])
+    resource_types = [value for value, count in facets['types']]
+    authors = [value for value, count in facets['authors']]  # Top 50 authors by resource count
+    years = [value for value, count in facets['years']]
     
     # Get featured/recommended resources
-    featured_resources = Resource.query.filter_by(is_active=True)\
-        .order_by(Resource.view_count.desc()).limit(6).all()
+    featured_resources = popular_resources(6).all()
     
     return render_template('library/index.html',
                          resources=resources,
                          resource_types=resource_types,
                          authors=authors,
                          years=years,
+                         facets=facets,
+                         bookmarked_ids=bookmarked_ids(current_user.id),
                          featured_resources=featured_resources,
-                         current_filters={
-                             'type': resource_type,
-                             'author': author,
-                             'year': year,
-                             'q': search_query,
-                             'sort': sort_by
-                         })
+                         current_filters=filters)
+
+@library_bp.route('/api/resources')
+@login_required
+@replica_reads
+def api_resources():
+    """JSON listing of library resources using the same filters and cursors as the index page"""
+    filters = _resource_listing_filters()
+    query = resource_listing(filters)
+    
+    per_page = min(max(request.args.get('per_page', 12, type=int), 1), 100)
+    with_total = request.args.get('total', '').lower() in ['1', 'true', 'yes']
+    
+    page = keyset_paginate(query, RESOURCE_SORTS, filters['sort'],
+                           after=request.args.get('after'),
+                           before=request.args.get('before'),
+                           per_page=per_page,
+                           count_key=_listing_count_key(filters) if with_total else None)
+    
+    return jsonify(page.to_dict(_resource_summary))
 
 @library_bp.route('/resource/<int:resource_id>')
 @login_required
@@ -132,7 +137,7 @@ def resource_detail(resource_id):
         related_resources.extend(additional_resources)
     
     # Check if resource is bookmarked by current user
-    is_bookmarked = resource in current_user.bookmarked_resources
+    bookmarked = is_bookmarked(current_user.id, resource_id)
     
     return render_template('library/resource_detail.html',
                          resource=resource,
@@ -142,7 +147,7 @@ def resource_detail(resource_id):
                          total_ratings=total_ratings,
                          avg_rating=avg_rating,
                          related_resources=related_resources,
-                         is_bookmarked=is_bookmarked)
+                         is_bookmarked=bookmarked)
 
 @library_bp.route('/resource/<int:resource_id>/rate', methods=['POST'])
 @login_required
@@ -223,45 +228,27 @@ def download_resource(resource_id):
 @library_bp.route('/books')
 @login_required
 def books():
-    page = request.args.get('page', 1, type=int)
     search_query = request.args.get('q', '')
     author = request.args.get('author', '')
     year = request.args.get('year', '')
     
-    query = Resource.query.filter_by(resource_type='book', is_active=True)
-    
-    if search_query:
-        query = query.filter(
-            db.or_(
-                Resource.title.contains(search_query),
-                Resource.description.contains(search_query),
-                Resource.author.contains(search_query)
-            )
-        )
-    
-    if author:
-        query = query.filter(Resource.author.contains(author))
+    query = resource_listing({'type': 'book', 'q': search_query, 'author': author, 'year': year})
     
-    if year:
-        query = query.filter(Resource.year_published == int(year))
-    
-    books = query.order_by(Resource.created_at.desc())\
-        .paginate(page=page, per_page=12, error_out=False)
+    books = keyset_paginate(query, RESOURCE_SORTS, 'created_at',
+                             after=request.args.get('after'),
+                             before=request.args.get('before'),
+                             per_page=12)
     
     # Get filter options
-    authors = db.session.query(Resource.author.distinct())\
-        .filter(Resource.resource_type == 'book', Resource.is_active == True, Resource.author != None).all()
-    authors = [author[0] for author in authors if author[0]]
-    
-    years = db.session.query(Resource.year_published.distinct())\
-        .filter(Resource.resource_type == 'book', Resource.is_active == True, Resource.year_published != None)\
-        .order_by(Resource.year_published.desc()).all()
-    years = [year[0] for year in years if year[0]]
+    facets = get_facets('book', author, year, search_query, author_limit=None)
+    authors = [value for value, count in facets['authors']]
+    years = [value for value, count in facets['years']]
     
     return render_template('library/books.html',
                          books=books,
                          authors=authors,
                          years=years,
+                         facets=facets,
                          current_filters={
                              'q': search_query,
                              'author': author,
@@ -271,26 +258,15 @@ def books():
 @library_bp.route('/articles')
 @login_required
 def articles():
-    page = request.args.get('page', 1, type=int)
     search_query = request.args.get('q', '')
     author = request.args.get('author', '')
     
-    query = Resource.query.filter_by(resource_type='article', is_active=True)
+    query = resource_listing({'type': 'article', 'q': search_query, 'author': author})
     
-    if search_query:
-        query = query.filter(
-            db.or_(
-                Resource.title.contains(search_query),
-                Resource.description.contains(search_query),
-                Resource.author.contains(search_query)
-            )
-        )
-    
-    if author:
-        query = query.filter(Resource.author.contains(author))
-    
-    articles = query.order_by(Resource.created_at.desc())\
-        .paginate(page=page, per_page=12, error_out=False)
+    articles = keyset_paginate(query, RESOURCE_SORTS, 'created_at',
+                             after=request.args.get('after'),
+                             before=request.args.get('before'),
+                             per_page=12)
     
     return render_template('library/articles.html',
                          articles=articles,
@@ -302,7 +278,6 @@ def articles():
 @library_bp.route('/magazines')
 @login_required
 def magazines():
-    page = request.args.get('page', 1, type=int)
     search_query = request.args.get('q', '')
     
     query = Resource.query.filter_by(resource_type='magazine', is_active=True)
@@ -315,8 +290,10 @@ def magazines():
             )
         )
     
-    magazines = query.order_by(Resource.created_at.desc())\
-        .paginate(page=page, per_page=12, error_out=False)
+    magazines = keyset_paginate(query, RESOURCE_SORTS, 'created_at',
+                             after=request.args.get('after'),
+                             before=request.args.get('before'),
+                             per_page=12)
     
     return render_template('library/magazines.html',
                          magazines=magazines,
@@ -334,8 +311,7 @@ def recommendations():
         .order_by(Resource.view_count.desc()).limit(12).all()
     
     # Get popular resources overall
-    popular_resources = Resource.query.filter_by(is_active=True)\
-        .order_by(Resource.view_count.desc()).limit(12).all()
+    popular = popular_resources(12).all()
     
     # Get recently added resources
     recent_resources = Resource.query.filter_by(is_active=True)\
@@ -348,7 +324,7 @@ def recommendations():
     
     return render_template('library/recommendations.html',
                          track_resources=track_resources,
-                         popular_resources=popular_resources,
+                         popular_resources=popular,
                          recent_resources=recent_resources,
                          highly_rated=highly_rated,
                          user_track=user_track)
@@ -430,15 +406,11 @@ def api_search_suggestions():
 def api_toggle_bookmark(resource_id):
     resource = Resource.query.get_or_404(resource_id)
     
-    if resource in current_user.bookmarked_resources:
-        current_user.bookmarked_resources.remove(resource)
-        action = 'removed'
-    else:
-        current_user.bookmarked_resources.append(resource)
-        action = 'added'
+    action = toggle_bookmark(current_user.id, resource.id)
     
     try:
         db.session.commit()
+        invalidate_bookmarks(current_user.id)
         return jsonify({
             'success': True,
             'action': action,
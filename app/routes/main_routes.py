@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import current_user
-from app.models.models import db, Course, NewsArticle, WordOfTheDay, QuizOfTheDay, FAQ, ContactMessage, Resource, Topic
-from datetime import date, datetime
+from app.models.models import db, Course, NewsArticle, FAQ, ContactMessage, Resource, Topic
+from app.services.daily_content import get_daily_content
+from app.utils.db_routing import replica_reads
+from app.utils.queries import popular_resources, published_news
+from datetime import datetime
 import json
 
 main_bp = Blueprint('main', __name__)
@@ -10,16 +13,13 @@ main_bp = Blueprint('main', __name__)
 def index():
     # Get featured content for home page
     featured_courses = Course.query.filter_by(is_active=True).limit(3).all()
-    latest_news = NewsArticle.query.filter_by(is_published=True)\
-        .order_by(NewsArticle.published_at.desc()).limit(3).all()
+    latest_news = published_news().limit(3).all()
     
     # Get word of the day
-    today = date.today()
-    word_of_day = WordOfTheDay.query.filter_by(date=today).first()
+    word_of_day = get_daily_content().word()
     
     # Get popular resources
-    popular_resources = Resource.query.filter_by(is_active=True)\
-        .order_by(Resource.view_count.desc()).limit(6).all()
+    popular = popular_resources(6).all()
     
     # Statistics for the homepage
     stats = {
@@ -34,7 +34,7 @@ def index():
                          featured_courses=featured_courses,
                          latest_news=latest_news,
                          word_of_day=word_of_day,
-                         popular_resources=popular_resources,
+                         popular_resources=popular,
                          stats=stats)
 
 @main_bp.route('/about')
@@ -151,12 +151,7 @@ def news():
     page = request.args.get('page', 1, type=int)
     category = request.args.get('category', '')
     
-    query = NewsArticle.query.filter_by(is_published=True)
-    
-    if category:
-        query = query.filter_by(category=category)
-    
-    news_articles = query.order_by(NewsArticle.published_at.desc())\
+    news_articles = published_news(category)\
         .paginate(page=page, per_page=10, error_out=False)
     
     # Get available categories
@@ -188,6 +183,7 @@ def news_article(article_id):
                          related_articles=related_articles)
 
 @main_bp.route('/search')
+@replica_reads
 def search():
     query = request.args.get('q', '').strip()
     category = request.args.get('category', 'all')
@@ -285,12 +281,11 @@ def search():
 
 @main_bp.route('/word-of-the-day')
 def word_of_the_day():
-    today = date.today()
-    word = WordOfTheDay.query.filter_by(date=today).first()
+    daily = get_daily_content()
+    word = daily.word()
     
     # Get previous words
-    previous_words = WordOfTheDay.query.filter(WordOfTheDay.date < today)\
-        .order_by(WordOfTheDay.date.desc()).limit(10).all()
+    previous_words = daily.previous_words
     
     return render_template('main/word_of_the_day.html',
                          word=word,
@@ -298,8 +293,7 @@ def word_of_the_day():
 
 @main_bp.route('/quiz-of-the-day')
 def quiz_of_the_day():
-    today = date.today()
-    quiz = QuizOfTheDay.query.filter_by(date=today).first()
+    quiz = get_daily_content().quiz()
     
     return render_template('main/quiz_of_the_day.html', quiz=quiz)
 
@@ -327,8 +321,7 @@ def api_stats():
 @main_bp.route('/api/word-of-the-day')
 def api_word_of_the_day():
     """API endpoint for getting word of the day"""
-    today = date.today()
-    word = WordOfTheDay.query.filter_by(date=today).first()
+    word = get_daily_content().word()
     
     if word:
         return jsonify({
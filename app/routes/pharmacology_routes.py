@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import (Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response,
+                   stream_with_context, abort)
 from flask_login import login_required, current_user
-from app.models.models import db, DrugClass, Drug
-import math
+from app.services.drug_catalog import find_class, find_drug, get_catalog
+from app.services.drug_search import search_drug_names
+from app.services.calculators import (CALCULATORS, MAX_BATCH_ROWS, CalculationError, calculate, stream_csv,
+                                      stream_json)
+import csv
+import io
+import json
+from itertools import islice
 from datetime import datetime, date
 
 pharma_bp = Blueprint('pharma', __name__)
@@ -9,11 +16,9 @@ pharma_bp = Blueprint('pharma', __name__)
 @pharma_bp.route('/')
 @login_required
 def index():
-    # Get all drug classes
-    drug_classes = DrugClass.query.order_by(DrugClass.name).all()
-    
-    # Get recently added drugs
-    recent_drugs = Drug.query.order_by(Drug.created_at.desc()).limit(6).all()
+    catalog = get_catalog()
+    drug_classes = catalog.classes
+    recent_drugs = catalog.recent(6)
     
     # Get popular calculators
     calculators = [
@@ -71,17 +76,8 @@ def index():
 def drug_classes():
     search = request.args.get('search', '')
     
-    query = DrugClass.query
-    
-    if search:
-        query = query.filter(
-            db.or_(
-                DrugClass.name.contains(search),
-                DrugClass.description.contains(search)
-            )
-        )
-    
-    drug_classes = query.order_by(DrugClass.name).all()
+    catalog = get_catalog()
+    drug_classes = catalog.search_classes(search) if search else catalog.classes
     
     return render_template('pharmacology/drug_classes.html',
                          drug_classes=drug_classes,
@@ -90,8 +86,10 @@ def drug_classes():
 @pharma_bp.route('/drug-class/<int:class_id>')
 @login_required
 def drug_class_detail(class_id):
-    drug_class = DrugClass.query.get_or_404(class_id)
-    drugs = Drug.query.filter_by(drug_class_id=class_id).order_by(Drug.name).all()
+    drug_class = find_class(class_id)
+    if drug_class is None:
+        abort(404)
+    drugs = get_catalog().drugs_in_class(class_id)
     
     return render_template('pharmacology/drug_class_detail.html',
                          drug_class=drug_class,
@@ -100,35 +98,17 @@ def drug_class_detail(class_id):
 @pharma_bp.route('/drug/<int:drug_id>')
 @login_required
 def drug_detail(drug_id):
-    drug = Drug.query.get_or_404(drug_id)
-    
-    # Parse JSON fields
-    import json
-    brand_names = []
-    dosage_forms = []
+    drug = find_drug(drug_id)
+    if drug is None:
+        abort(404)
     
-    try:
-        if drug.brand_names:
-            brand_names = json.loads(drug.brand_names)
-    except:
-        brand_names = []
-    
-    try:
-        if drug.dosage_forms:
-            dosage_forms = json.loads(drug.dosage_forms)
-    except:
-        dosage_forms = []
-    
-    # Get related drugs (same class)
-    related_drugs = Drug.query.filter(
-        Drug.drug_class_id == drug.drug_class_id,
-        Drug.id != drug_id
-    ).limit(6).all()
+    # Related drugs (same class)
+    related_drugs = get_catalog().drugs_in_class(drug.drug_class_id, exclude=drug_id, limit=6)
     
     return render_template('pharmacology/drug_detail.html',
                          drug=drug,
-                         brand_names=brand_names,
-                         dosage_forms=dosage_forms,
+                         brand_names=list(drug.brand_names),
+                         dosage_forms=list(drug.dosage_forms),
                          related_drugs=related_drugs)
 
 @pharma_bp.route('/search')
@@ -140,17 +120,15 @@ def search():
     results = []
     
     if query:
-        # Search in drug names
+        catalog = get_catalog()
+        
+        # Fuzzy match on drug, generic and brand names, then descriptions containing the query
         if category in ['all', 'drugs']:
-            drugs = Drug.query.filter(
-                db.or_(
-                    Drug.name.contains(query),
-                    Drug.generic_name.contains(query),
-                    Drug.description.contains(query)
-                )
-            ).limit(20).all()
+            drugs = [match.drug for match in search_drug_names(query, limit=20)]
+            found = {drug.id for drug in drugs}
+            drugs += [drug for drug in catalog.search_drugs(query, limit=20) if drug.id not in found]
             
-            for drug in drugs:
+            for drug in drugs[:20]:
                 results.append({
                     'type': 'drug',
                     'title': drug.name,
@@ -161,18 +139,11 @@ def search():
         
         # Search in drug classes
         if category in ['all', 'classes']:
-            drug_classes = DrugClass.query.filter(
-                db.or_(
-                    DrugClass.name.contains(query),
-                    DrugClass.description.contains(query)
-                )
-            ).limit(10).all()
-            
-            for drug_class in drug_classes:
+            for drug_class in catalog.search_classes(query, limit=10):
                 results.append({
                     'type': 'class',
                     'title': drug_class.name,
-                    'subtitle': f"{len(drug_class.drugs)} drugs",
+                    'subtitle': f"{drug_class.drug_count} drugs",
                     'description': drug_class.description,
                     'url': url_for('pharma.drug_class_detail', class_id=drug_class.id)
                 })
@@ -183,195 +154,45 @@ def search():
                          category=category)
 
 # Calculators
-@pharma_bp.route('/calculators/dose', methods=['GET', 'POST'])
-@login_required
-def dose_calculator():
+def _calculator_view(name, template):
+    """Form/JSON view for one calculation; the arithmetic lives in app.services.calculators"""
     result = None
     
     if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
+        data = request.get_json(silent=True) if request.is_json else request.form
         
         try:
-            weight = float(data.get('weight', 0))
-            dose_per_kg = float(data.get('dose_per_kg', 0))
-            frequency = int(data.get('frequency', 1))
-            
-            if weight <= 0 or dose_per_kg <= 0 or frequency <= 0:
-                raise ValueError("All values must be positive")
-            
-            single_dose = weight * dose_per_kg
-            daily_dose = single_dose * frequency
-            
-            result = {
-                'single_dose': round(single_dose, 2),
-                'daily_dose': round(daily_dose, 2),
-                'weight': weight,
-                'dose_per_kg': dose_per_kg,
-                'frequency': frequency
-            }
+            result = calculate(name, data if isinstance(data, dict) or not request.is_json else {})
             
             if request.is_json:
                 return jsonify({'success': True, 'result': result})
                 
-        except (ValueError, TypeError) as e:
-            error = 'Please enter valid numeric values'
+        except CalculationError as e:
             if request.is_json:
-                return jsonify({'success': False, 'message': error}), 400
-            flash(error, 'error')
+                return jsonify({'success': False, 'message': str(e)}), 400
+            flash(str(e), 'error')
     
-    return render_template('pharmacology/calculators/dose.html', result=result)
+    return render_template(template, result=result)
+
+@pharma_bp.route('/calculators/dose', methods=['GET', 'POST'])
+@login_required
+def dose_calculator():
+    return _calculator_view('dose', 'pharmacology/calculators/dose.html')
 
 @pharma_bp.route('/calculators/drip', methods=['GET', 'POST'])
 @login_required
 def drip_calculator():
-    result = None
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        
-        try:
-            volume = float(data.get('volume', 0))  # mL
-            time_hours = float(data.get('time_hours', 0))  # hours
-            drop_factor = int(data.get('drop_factor', 20))  # drops/mL
-            
-            if volume <= 0 or time_hours <= 0 or drop_factor <= 0:
-                raise ValueError("All values must be positive")
-            
-            ml_per_hour = volume / time_hours
-            ml_per_minute = ml_per_hour / 60
-            drops_per_minute = ml_per_minute * drop_factor
-            
-            result = {
-                'ml_per_hour': round(ml_per_hour, 1),
-                'ml_per_minute': round(ml_per_minute, 2),
-                'drops_per_minute': round(drops_per_minute, 0),
-                'volume': volume,
-                'time_hours': time_hours,
-                'drop_factor': drop_factor
-            }
-            
-            if request.is_json:
-                return jsonify({'success': True, 'result': result})
-                
-        except (ValueError, TypeError) as e:
-            error = 'Please enter valid numeric values'
-            if request.is_json:
-                return jsonify({'success': False, 'message': error}), 400
-            flash(error, 'error')
-    
-    return render_template('pharmacology/calculators/drip.html', result=result)
+    return _calculator_view('drip', 'pharmacology/calculators/drip.html')
 
 @pharma_bp.route('/calculators/bmi', methods=['GET', 'POST'])
 @login_required
 def bmi_calculator():
-    result = None
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        
-        try:
-            weight = float(data.get('weight', 0))  # kg
-            height = float(data.get('height', 0))  # cm
-            
-            if weight <= 0 or height <= 0:
-                raise ValueError("Weight and height must be positive")
-            
-            height_m = height / 100  # convert to meters
-            bmi = weight / (height_m ** 2)
-            
-            # BMI categories
-            if bmi < 18.5:
-                category = 'Underweight'
-                color = '#1a6ac3'
-            elif bmi < 25:
-                category = 'Normal weight'
-                color = '#28a745'
-            elif bmi < 30:
-                category = 'Overweight'
-                color = '#ffc107'
-            else:
-                category = 'Obese'
-                color = '#dc3545'
-            
-            result = {
-                'bmi': round(bmi, 1),
-                'category': category,
-                'color': color,
-                'weight': weight,
-                'height': height
-            }
-            
-            if request.is_json:
-                return jsonify({'success': True, 'result': result})
-                
-        except (ValueError, TypeError) as e:
-            error = 'Please enter valid numeric values'
-            if request.is_json:
-                return jsonify({'success': False, 'message': error}), 400
-            flash(error, 'error')
-    
-    return render_template('pharmacology/calculators/bmi.html', result=result)
+    return _calculator_view('bmi', 'pharmacology/calculators/bmi.html')
 
 @pharma_bp.route('/calculators/creatinine', methods=['GET', 'POST'])
 @login_required
 def creatinine_calculator():
-    result = None
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        
-        try:
-            age = int(data.get('age', 0))
-            weight = float(data.get('weight', 0))  # kg
-            creatinine = float(data.get('creatinine', 0))  # mg/dL
-            gender = data.get('gender', 'male')
-            
-            if age <= 0 or weight <= 0 or creatinine <= 0:
-                raise ValueError("All values must be positive")
-            
-            # Cockcroft-Gault equation
-            creatinine_clearance = ((140 - age) * weight) / (72 * creatinine)
-            
-            if gender == 'female':
-                creatinine_clearance *= 0.85
-            
-            # Kidney function categories
-            if creatinine_clearance >= 90:
-                category = 'Normal kidney function'
-                color = '#28a745'
-            elif creatinine_clearance >= 60:
-                category = 'Mild decrease in kidney function'
-                color = '#ffc107'
-            elif creatinine_clearance >= 30:
-                category = 'Moderate decrease in kidney function'
-                color = '#fd7e14'
-            elif creatinine_clearance >= 15:
-                category = 'Severe decrease in kidney function'
-                color = '#dc3545'
-            else:
-                category = 'Kidney failure'
-                color = '#6f42c1'
-            
-            result = {
-                'creatinine_clearance': round(creatinine_clearance, 1),
-                'category': category,
-                'color': color,
-                'age': age,
-                'weight': weight,
-                'creatinine': creatinine,
-                'gender': gender
-            }
-            
-            if request.is_json:
-                return jsonify({'success': True, 'result': result})
-                
-        except (ValueError, TypeError) as e:
-            error = 'Please enter valid values'
-            if request.is_json:
-                return jsonify({'success': False, 'message': error}), 400
-            flash(error, 'error')
-    
-    return render_template('pharmacology/calculators/creatinine.html', result=result)
+    return _calculator_view('creatinine', 'pharmacology/calculators/creatinine.html')
 
 @pharma_bp.route('/calculators/pregnancy', methods=['GET', 'POST'])
 @login_required
@@ -434,93 +255,46 @@ def pregnancy_calculator():
 @pharma_bp.route('/calculators/units', methods=['GET', 'POST'])
 @login_required
 def unit_converter():
-    result = None
-    
-    # Conversion factors
-    conversions = {
-        'weight': {
-            'kg_to_lb': 2.20462,
-            'lb_to_kg': 0.453592,
-            'g_to_mg': 1000,
-            'mg_to_g': 0.001,
-            'g_to_mcg': 1000000,
-            'mcg_to_g': 0.000001
-        },
-        'volume': {
-            'l_to_ml': 1000,
-            'ml_to_l': 0.001,
-            'ml_to_cc': 1,
-            'cc_to_ml': 1,
-            'tsp_to_ml': 4.92892,
-            'ml_to_tsp': 0.202884
-        },
-        'temperature': {
-            'c_to_f': lambda c: (c * 9/5) + 32,
-            'f_to_c': lambda f: (f - 32) * 5/9
-        }
-    }
-    
-    if request.method == 'POST':
-        data = request.get_json() if request.is_json else request.form
-        
+    return _calculator_view('units', 'pharmacology/calculators/units.html')
+
+@pharma_bp.route('/calculators/<name>/batch', methods=['POST'])
+@login_required
+def calculator_batch(name):
+    """Run a calculator over many inputs.
+    
+    Accepts a JSON array (or {"inputs": [...]}) or CSV with one input per row, as
+    the request body or an uploaded ``file``. Results stream back as JSON, or as
+    CSV when ``?format=csv`` or the input was CSV.
+    """
+    if name not in CALCULATORS:
+        return jsonify({'success': False, 'message': 'Unknown calculator'}), 404
+    
+    upload = request.files.get('file')
+    if upload is not None:
+        is_csv = not upload.filename.lower().endswith('.json')
+        body = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    else:
+        is_csv = request.mimetype in ('text/csv', 'application/csv')
+        body = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='') if is_csv else None
+    
+    if is_csv:
+        records = csv.DictReader(body)
+        if upload is not None:
+            # Uploaded files are closed when the view returns, before the response streams
+            records = list(islice(records, MAX_BATCH_ROWS + 1))
+    else:
         try:
-            value = float(data.get('value', 0))
-            conversion_type = data.get('conversion_type', '')
-            
-            if not conversion_type:
-                raise ValueError("Please select a conversion type")
-            
-            category, conversion = conversion_type.split('_', 1)
-            
-            if category == 'temperature':
-                if conversion == 'to_f':
-                    converted_value = conversions['temperature']['c_to_f'](value)
-                    from_unit = '°C'
-                    to_unit = '°F'
-                else:  # to_c
-                    converted_value = conversions['temperature']['f_to_c'](value)
-                    from_unit = '°F'
-                    to_unit = '°C'
-            else:
-                factor = conversions[category][conversion]
-                converted_value = value * factor
-                
-                # Determine units based on conversion
-                unit_map = {
-                    'kg_to_lb': ('kg', 'lb'),
-                    'lb_to_kg': ('lb', 'kg'),
-                    'g_to_mg': ('g', 'mg'),
-                    'mg_to_g': ('mg', 'g'),
-                    'g_to_mcg': ('g', 'mcg'),
-                    'mcg_to_g': ('mcg', 'g'),
-                    'l_to_ml': ('L', 'mL'),
-                    'ml_to_l': ('mL', 'L'),
-                    'ml_to_cc': ('mL', 'cc'),
-                    'cc_to_ml': ('cc', 'mL'),
-                    'tsp_to_ml': ('tsp', 'mL'),
-                    'ml_to_tsp': ('mL', 'tsp')
-                }
-                
-                from_unit, to_unit = unit_map[conversion]
-            
-            result = {
-                'original_value': value,
-                'converted_value': round(converted_value, 6),
-                'from_unit': from_unit,
-                'to_unit': to_unit,
-                'conversion_type': conversion_type
-            }
-            
-            if request.is_json:
-                return jsonify({'success': True, 'result': result})
-                
-        except (ValueError, TypeError) as e:
-            error = 'Please enter valid values'
-            if request.is_json:
-                return jsonify({'success': False, 'message': error}), 400
-            flash(error, 'error')
-    
-    return render_template('pharmacology/calculators/units.html', result=result)
+            data = json.load(body) if body is not None else request.get_json(silent=True)
+        except ValueError:
+            data = None
+        records = data.get('inputs') if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            return jsonify({'success': False, 'message': 'Expected a JSON array of inputs'}), 400
+    
+    if request.args.get('format', 'csv' if is_csv else 'json') == 'csv':
+        return Response(stream_with_context(stream_csv(name, records)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={name}-results.csv'})
+    return Response(stream_with_context(stream_json(name, records)), mimetype='application/json')
 
 @pharma_bp.route('/api/drug-suggestions')
 @login_required
@@ -531,20 +305,22 @@ def api_drug_suggestions():
     if len(query) < 2:
         return jsonify([])
     
-    drugs = Drug.query.filter(
-        db.or_(
-            Drug.name.contains(query),
-            Drug.generic_name.contains(query)
-        )
-    ).limit(10).all()
+    # Fuzzy matches first, then names containing the query (stems such as "pril" or "statin")
+    matches = [(match.drug, match.term) for match in search_drug_names(query, limit=10)]
+    found = {drug.id for drug, _ in matches}
+    needle = query.casefold()
+    matches += [(drug, drug.name if needle in drug.name.casefold() else drug.generic_name)
+                for drug in get_catalog().search_drugs(query, limit=10, descriptions=False)
+                if drug.id not in found]
     
     suggestions = []
-    for drug in drugs:
+    for drug, term in matches[:10]:
         suggestions.append({
             'id': drug.id,
             'name': drug.name,
             'generic_name': drug.generic_name,
-            'class_name': drug.drug_class.name
+            'class_name': drug.drug_class.name,
+            'matched': term
         })
     
     return jsonify(suggestions)
\ No newline at end of file
@@ -1,7 +1,12 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
 from app.models.models import db, User, Course, Module, Topic, UserProgress, Badge, Resource, Quiz, QuizAttempt
-from datetime import datetime
+from app.services import bookmarks as bookmark_service
+from app.services.badges import counter_values, get_counters, load_rules, rule_progress
+from app.services import leaderboards
+from app.services import progress as progress_service
+from app.services.points import current_points, level_for, month_start, points_since, week_start
+from app.utils.queries import recent_progress
 import json
 
 user_bp = Blueprint('user', __name__)
@@ -16,8 +21,7 @@ def dashboard():
     courses = Course.query.filter_by(track=current_user.track, is_active=True).all()
     
     # Get recent progress
-    recent_progress = UserProgress.query.filter_by(user_id=current_user.id)\
-        .order_by(UserProgress.last_accessed.desc()).limit(5).all()
+    latest_progress = recent_progress(current_user.id, 5).all()
     
     # Get user's badges
     user_badges = current_user.earned_badges
@@ -38,15 +42,18 @@ def dashboard():
         .order_by(Resource.view_count.desc()).limit(6).all()
     
     # Get bookmarked resources
-    bookmarked_resources = current_user.bookmarked_resources[:6]
+    bookmarked_resources = bookmark_service.recent_bookmarks(current_user.id, limit=6)
     
     # Get quiz attempts stats
     quiz_attempts = QuizAttempt.query.filter_by(user_id=current_user.id, completed=True).all()
     avg_quiz_score = sum(attempt.score for attempt in quiz_attempts) / len(quiz_attempts) if quiz_attempts else 0
     
+    # Includes points still waiting in the ledger
+    total_points = current_points(current_user.id)
+    
     return render_template('user/dashboard.html',
                          courses=courses,
-                         recent_progress=recent_progress,
+                         recent_progress=latest_progress,
                          user_badges=user_badges,
                          overall_progress=overall_progress,
                          recommended_resources=recommended_resources,
@@ -54,8 +61,8 @@ def dashboard():
                          total_topics=total_topics,
                          completed_topics=completed_topics,
                          avg_quiz_score=avg_quiz_score,
-                         total_points=current_user.total_points,
-                         user_level=current_user.level)
+                         total_points=total_points,
+                         user_level=max(current_user.level, level_for(total_points)))
 
 @user_bp.route('/profile')
 @login_required
@@ -136,8 +143,7 @@ def progress():
         })
     
     # Get recent activity
-    recent_activity = UserProgress.query.filter_by(user_id=current_user.id)\
-        .order_by(UserProgress.last_accessed.desc()).limit(10).all()
+    recent_activity = recent_progress(current_user.id, 10).all()
     
     return render_template('user/progress.html',
                          progress_data=progress_data,
@@ -146,7 +152,10 @@ def progress():
 @user_bp.route('/bookmarks')
 @login_required
 def bookmarks():
-    bookmarked_resources = current_user.bookmarked_resources
+    bookmarked_resources = bookmark_service.paginated_bookmarks(current_user.id,
+                                                                after=request.args.get('after'),
+                                                                before=request.args.get('before'),
+                                                                per_page=12)
     return render_template('user/bookmarks.html', resources=bookmarked_resources)
 
 @user_bp.route('/bookmark/<int:resource_id>', methods=['POST'])
@@ -154,15 +163,11 @@ def bookmarks():
 def toggle_bookmark(resource_id):
     resource = Resource.query.get_or_404(resource_id)
     
-    if resource in current_user.bookmarked_resources:
-        current_user.bookmarked_resources.remove(resource)
-        action = 'removed'
-    else:
-        current_user.bookmarked_resources.append(resource)
-        action = 'added'
+    action = bookmark_service.toggle_bookmark(current_user.id, resource.id)
     
     try:
         db.session.commit()
+        bookmark_service.invalidate_bookmarks(current_user.id)
         return jsonify({
             'success': True, 
             'action': action,
@@ -183,14 +188,57 @@ def achievements():
     earned_badges = current_user.earned_badges
     
     # Separate earned and unearned badges
-    earned_badge_ids = [badge.id for badge in earned_badges]
+    earned_badge_ids = {badge.id for badge in earned_badges}
     unearned_badges = [badge for badge in all_badges if badge.id not in earned_badge_ids]
     
+    # Progress towards unearned badges, from the user's running counters
+    total_points = current_points(current_user.id)
+    values = counter_values(get_counters(current_user.id), total_points)
+    badge_progress = {rule.badge_id: rule_progress(rule, values)
+                      for rule in load_rules().rules if rule.badge_id not in earned_badge_ids}
+    
     return render_template('user/achievements.html',
                          earned_badges=earned_badges,
                          unearned_badges=unearned_badges,
-                         total_points=current_user.total_points,
-                         user_level=current_user.level)
+                         badge_progress=badge_progress,
+                         total_points=total_points,
+                         user_level=max(current_user.level, level_for(total_points)))
+
+@user_bp.route('/api/leaderboard')
+@login_required
+def api_leaderboard():
+    """Top of a leaderboard plus the current user's position on it"""
+    scope = request.args.get('scope', 'global')
+    if scope not in ('global', 'track', 'weekly'):
+        return jsonify({'success': False, 'message': 'Unknown leaderboard'}), 400
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    track = current_user.track if scope == 'track' else None
+    
+    entries = leaderboards.top(scope, limit, track=track)
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_([e[1] for e in entries])))
+    me = leaderboards.rank_of(current_user.id, scope, track=track)
+    
+    return jsonify({
+        'success': True,
+        'scope': scope,
+        'track': track,
+        'entries': [{'rank': rank, 'user_id': user_id, 'name': names.get(user_id), 'points': points}
+                    for rank, user_id, points in entries],
+        'me': {'rank': me[0], 'points': me[1], 'out_of': me[2]} if me else None
+    })
+
+@user_bp.route('/api/points')
+@login_required
+def api_points():
+    """Current total plus this week's and this month's points from the ledger"""
+    total_points = current_points(current_user.id)
+    return jsonify({
+        'success': True,
+        'total_points': total_points,
+        'level': max(current_user.level, level_for(total_points)),
+        'week_points': points_since(current_user.id, week_start()),
+        'month_points': points_since(current_user.id, month_start())
+    })
 
 @user_bp.route('/quiz-history')
 @login_required
@@ -235,48 +283,38 @@ def update_progress():
     """Update user's progress for a topic"""
     data = request.get_json()
     topic_id = data.get('topic_id')
-    progress_percentage = data.get('progress_percentage', 0)
-    time_spent = data.get('time_spent', 0)
-    completed = data.get('completed', False)
     
     if not topic_id:
         return jsonify({'success': False, 'message': 'Topic ID is required'}), 400
     
-    topic = Topic.query.get_or_404(topic_id)
+    Topic.query.get_or_404(topic_id)
     
-    # Get or create progress record
-    progress = UserProgress.query.filter_by(user_id=current_user.id, topic_id=topic_id).first()
-    if not progress:
-        progress = UserProgress(user_id=current_user.id, topic_id=topic_id)
-        db.session.add(progress)
-    
-    # Update progress
-    progress.progress_percentage = max(progress.progress_percentage, progress_percentage)
-    progress.time_spent += time_spent
-    progress.last_accessed = datetime.utcnow()
-    
-    # Check if topic is completed
-    if completed and not progress.completed:
-        progress.completed = True
-        progress.completed_at = datetime.utcnow()
-        progress.progress_percentage = 100
-        
-        # Award points for completion
-        points_awarded = 10  # Base points for completing a topic
-        current_user.total_points += points_awarded
-        
-        # Check for level up (every 100 points = 1 level)
-        new_level = (current_user.total_points // 100) + 1
-        if new_level > current_user.level:
-            current_user.level = new_level
+    return _apply_progress_events([data], 'Progress updated successfully')
+
+@user_bp.route('/progress/batch', methods=['POST'])
+@login_required
+def update_progress_batch():
+    """Apply many progress events (heartbeats, completions) in one transaction"""
+    data = request.get_json(silent=True) or {}
+    events = data.get('events')
+    if not isinstance(events, list):
+        return jsonify({'success': False, 'message': 'events must be a list'}), 400
     
+    return _apply_progress_events(events, 'Progress saved')
+
+def _apply_progress_events(events, message):
     try:
+        result = progress_service.apply_progress(current_user.id, progress_service.coalesce_events(events))
         db.session.commit()
+        total_points = current_points(current_user.id)
         return jsonify({
             'success': True, 
-            'message': 'Progress updated successfully',
-            'new_level': current_user.level,
-            'total_points': current_user.total_points
+            'message': message,
+            'topics': result.topic_ids,
+            'completed_topics': result.completed_topic_ids,
+            'new_level': max(current_user.level, level_for(total_points)),
+            'total_points': total_points,
+            'badges_awarded': [badge.name for badge in result.badges_awarded]
         })
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,186 @@
+# Adaptive quiz sessions
+#
+# Ability and question difficulty share one logit scale (a Rasch model): the
+# chance of answering question b correctly at ability theta is
+# 1 / (1 + exp(b - theta)).  TopicMastery keeps each user's ability estimate
+# per topic as a mean and variance; every answer applies one Elo-style update
+# whose step size shrinks as the variance does (a Gaussian approximation of
+# the Bayesian update).
+#
+# Each quiz gets a difficulty index - its questions sorted by difficulty,
+# taken from the item analysis where enough attempts exist (0 otherwise) -
+# cached next to the answer key.  The next question is the unanswered one
+# closest to the current estimate, which is where it is most informative.
+# A session stops once the estimate's standard error falls below TARGET_SE
+# (after MIN_QUESTIONS) or the questions run out.
+#
+# The attempt is scored from this session's answers alone: their maximum-
+# likelihood ability (infinite for an all-correct or all-wrong session) is
+# turned into the expected percentage on the whole quiz.  The mastery prior
+# pulls its estimate towards 0 and would cap a perfect session below 100%.
+# The expected percentage rises with ability, so score >= passing_score is
+# the same as the session ability reaching the quiz's cut on the logit scale.
+import json
+import math
+from bisect import bisect_left
+from collections import namedtuple
+
+from app.models.models import db, Quiz, QuizItemAnalysis, QuizQuestion, TopicMastery
+from app.services.grading import get_answer_key, is_correct
+from app.utils.cache import TTLCache
+
+PRIOR_RATING = 0.0
+PRIOR_VARIANCE = 1.0
+SESSION_DRIFT = 0.1  # variance added at the start of each session; ability moves between sessions
+TARGET_SE = 0.6
+MIN_QUESTIONS = 3
+MIN_CALIBRATION_ATTEMPTS = 5
+P_CLIP = 0.02
+MLE_ITERATIONS = 50
+
+QuestionView = namedtuple('QuestionView', ['id', 'question_text', 'question_type', 'options'])
+
+_index_cache = TTLCache(ttl=600, maxsize=256)
+
+
+class DifficultyIndex:
+    """A quiz's questions ordered by difficulty, plus what is needed to serve and grade them"""
+
+    def __init__(self, quiz_id, topic_id, key, questions, difficulty):
+        self.quiz_id = quiz_id
+        self.topic_id = topic_id
+        self.key = key
+        self.questions = questions  # id -> QuestionView
+        self.compiled = {question.id: question for question in key.questions}
+        self.difficulty = difficulty  # id -> b
+        ordered = sorted(difficulty.items(), key=lambda item: item[1])
+        self._ids = [question_id for question_id, _ in ordered]
+        self._values = [b for _, b in ordered]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def nearest(self, rating, exclude):
+        """The question not in ``exclude`` whose difficulty is closest to ``rating``"""
+        right = bisect_left(self._values, rating)
+        left = right - 1
+        while left >= 0 or right < len(self._ids):
+            take_left = right >= len(self._ids) or (
+                left >= 0 and rating - self._values[left] <= self._values[right] - rating)
+            if take_left:
+                if self._ids[left] not in exclude:
+                    return self._ids[left]
+                left -= 1
+            else:
+                if self._ids[right] not in exclude:
+                    return self._ids[right]
+                right += 1
+        return None
+
+
+def item_difficulty(p_correct, attempts):
+    """Logit difficulty from the share of correct answers; 0 until the item is calibrated"""
+    if p_correct is None or attempts < MIN_CALIBRATION_ATTEMPTS:
+        return 0.0
+    p = min(max(p_correct, P_CLIP), 1 - P_CLIP)
+    return math.log((1 - p) / p)
+
+
+def _build_index(quiz_id, key):
+    topic_id = db.session.query(Quiz.topic_id).filter(Quiz.id == quiz_id).scalar()
+    rows = db.session.query(QuizQuestion.id, QuizQuestion.question_text, QuizQuestion.question_type,
+                            QuizQuestion.options).filter(QuizQuestion.quiz_id == quiz_id)
+    questions = {row.id: QuestionView(*row) for row in rows}
+
+    calibration, attempts = {}, 0
+    analysis = db.session.get(QuizItemAnalysis, quiz_id)
+    if analysis is not None and analysis.results:
+        results = json.loads(analysis.results)
+        attempts = results.get('attempts', 0)
+        calibration = {item['question_id']: item['difficulty'] for item in results.get('items', [])}
+
+    difficulty = {question.id: item_difficulty(calibration.get(question.id), attempts)
+                  for question in key.questions if question.id in questions}
+    return DifficultyIndex(quiz_id, topic_id, key, questions, difficulty)
+
+
+def get_difficulty_index(quiz_id):
+    """The quiz's DifficultyIndex, rebuilt whenever its answer key was"""
+    key = get_answer_key(quiz_id)
+    index = _index_cache.get(quiz_id)
+    if index is None or index.key is not key:
+        index = _build_index(quiz_id, key)
+        _index_cache.set(quiz_id, index)
+    return index
+
+
+def probability(rating, difficulty):
+    return 1.0 / (1.0 + math.exp(difficulty - rating))
+
+
+def update_estimate(rating, variance, difficulty, correct):
+    """``(rating, variance)`` after one answer"""
+    p = probability(rating, difficulty)
+    variance = 1.0 / (1.0 / variance + p * (1 - p))
+    return rating + variance * ((1.0 if correct else 0.0) - p), variance
+
+
+def begin_session(user_id, topic_id):
+    """Load (or create) the user's TopicMastery for a new session; the caller commits"""
+    mastery = db.session.get(TopicMastery, (user_id, topic_id))
+    if mastery is None:
+        mastery = TopicMastery(user_id=user_id, topic_id=topic_id, rating=PRIOR_RATING,
+                               variance=PRIOR_VARIANCE, answers_count=0)
+        db.session.add(mastery)
+    else:
+        mastery.variance = min(mastery.variance + SESSION_DRIFT, PRIOR_VARIANCE)
+    return mastery
+
+
+def record_answer(index, mastery, question_id, answer):
+    """Grade one answer and fold it into ``mastery``; returns whether it was correct"""
+    correct = is_correct(index.compiled[question_id], answer)
+    mastery.rating, mastery.variance = update_estimate(mastery.rating, mastery.variance,
+                                                       index.difficulty[question_id], correct)
+    mastery.answers_count += 1
+    return correct
+
+
+def session_finished(index, answered, variance):
+    if answered >= len(index):
+        return True
+    return answered >= MIN_QUESTIONS and math.sqrt(variance) <= TARGET_SE
+
+
+def expected_score(index, rating):
+    """Expected weighted percentage on the whole quiz at ability ``rating``"""
+    total = index.key.total_points
+    if not total:
+        return 0
+    earned = sum(question.points * probability(rating, index.difficulty[question.id])
+                 for question in index.key.questions)
+    return earned / total * 100
+
+
+def session_ability(results):
+    """Maximum-likelihood ability from ``(difficulty, correct)`` pairs; +-inf when all are right or wrong"""
+    correct = sum(1 for _, right in results if right)
+    if correct == len(results):
+        return math.inf
+    if correct == 0:
+        return -math.inf
+    rating = math.log(correct / (len(results) - correct))
+    for _ in range(MLE_ITERATIONS):
+        p = [probability(rating, difficulty) for difficulty, _ in results]
+        step = (correct - sum(p)) / sum(q * (1 - q) for q in p)
+        rating += max(min(step, 1.0), -1.0)
+        if abs(step) < 1e-6:
+            break
+    return rating
+
+
+def session_score(index, answers):
+    """Score for a finished session's ``{question_id: answer}``: the expected percentage at its ability"""
+    results = [(index.difficulty[int(question_id)], is_correct(index.compiled[int(question_id)], answer))
+               for question_id, answer in answers.items()]
+    return expected_score(index, session_ability(results))
@@ -0,0 +1,294 @@
+# Event-driven badge awarding
+#
+# Badge.criteria is a JSON object mapping a counter to a threshold, e.g.
+#
+#     {"topics_completed": 10}
+#     {"quizzes_passed": {"gte": 5}, "points": {"gte": 500}}
+#
+# Every condition must hold.  A bare number means ">=".  Counters are
+# topics_completed, quizzes_passed, points and streak (consecutive active
+# days).  Criteria are parsed once into compiled rules indexed by counter, so
+# an event only evaluates the rules that mention a counter it changed, and
+# only against the user's UserCounters row - never against their history.
+#
+# Two events for one user can both find a badge unearned; the badge insert
+# skips rows that already exist, and only the transaction that actually
+# inserted a badge reports it and pays its bonus points.
+import json
+import logging
+import operator
+from collections import namedtuple
+from datetime import date, timedelta
+
+import click
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import db, Badge, Quiz, QuizAttempt, User, UserCounters, UserProgress, user_badges
+from app.services.points import award_points, current_points, pending_points_by_user
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('topics_completed', 'quizzes_passed', 'points', 'streak')
+OPERATORS = {'gte': operator.ge, 'gt': operator.gt, 'eq': operator.eq}
+
+# conditions: tuple of (counter, comparison function, threshold)
+BadgeRule = namedtuple('BadgeRule', ['badge_id', 'name', 'points_value', 'conditions'])
+
+_rules_cache = TTLCache(ttl=600, maxsize=1)
+
+
+class RuleSet:
+    """Compiled badge rules plus an index from counter name to the rules using it"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.by_counter = {counter: [] for counter in COUNTERS}
+        for rule in rules:
+            for counter in {condition[0] for condition in rule.conditions}:
+                self.by_counter[counter].append(rule)
+
+    def affected_by(self, counters):
+        seen = {}
+        for counter in counters:
+            for rule in self.by_counter.get(counter, ()):
+                seen[rule.badge_id] = rule
+        return list(seen.values())
+
+
+def compile_criteria(criteria):
+    """Parse a Badge.criteria JSON string into a tuple of conditions, or None if unusable"""
+    if not criteria:
+        return None
+    try:
+        spec = json.loads(criteria)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(spec, dict) or not spec:
+        return None
+
+    conditions = []
+    for counter, test in spec.items():
+        if counter not in COUNTERS:
+            return None
+        if isinstance(test, (int, float)):
+            test = {'gte': test}
+        if not isinstance(test, dict) or not test:
+            return None
+        for op_name, threshold in test.items():
+            if op_name not in OPERATORS or not isinstance(threshold, (int, float)):
+                return None
+            conditions.append((counter, OPERATORS[op_name], threshold))
+    return tuple(conditions)
+
+
+def load_rules():
+    def build():
+        rules = []
+        for badge in Badge.query.filter_by(is_active=True).all():
+            conditions = compile_criteria(badge.criteria)
+            if conditions is None:
+                if badge.criteria:
+                    logger.warning('Ignoring badge %s with unusable criteria %r', badge.id, badge.criteria)
+                continue
+            rules.append(BadgeRule(badge.id, badge.name, badge.points_value or 0, conditions))
+        return RuleSet(rules)
+
+    return _rules_cache.get_or_set('rules', build)
+
+
+def invalidate_badge_rules():
+    """Call after badges are added or their criteria edited"""
+    _rules_cache.clear()
+
+
+def rule_satisfied(rule, values):
+    return all(compare(values[counter], threshold) for counter, compare, threshold in rule.conditions)
+
+
+def rule_progress(rule, values):
+    """Fraction (0-1) of the way towards a badge, using the least complete condition"""
+    fractions = []
+    for counter, compare, threshold in rule.conditions:
+        if threshold <= 0 or compare(values[counter], threshold):
+            fractions.append(1.0)
+        else:
+            fractions.append(max(values[counter], 0) / threshold)
+    return min(fractions) if fractions else 0.0
+
+
+def _backfilled_counters(user_id):
+    # One-off catch-up for users who had history before counters existed
+    topics_completed = UserProgress.query.filter_by(user_id=user_id, completed=True).count()
+    quizzes_passed = db.session.query(db.func.count(db.distinct(QuizAttempt.quiz_id)))\
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)\
+        .filter(QuizAttempt.user_id == user_id,
+                QuizAttempt.completed == True,
+                QuizAttempt.score >= Quiz.passing_score).scalar() or 0
+    return UserCounters(user_id=user_id, topics_completed=topics_completed, quizzes_passed=quizzes_passed,
+                        current_streak=0, longest_streak=0)
+
+
+def get_counters(user_id):
+    """The user's counters row, created (and backfilled) on first use"""
+    counters = db.session.get(UserCounters, user_id)
+    if counters is None:
+        counters = _backfilled_counters(user_id)
+        db.session.add(counters)
+    return counters
+
+
+def counter_values(counters, points):
+    return {
+        'topics_completed': counters.topics_completed,
+        'quizzes_passed': counters.quizzes_passed,
+        'points': points,
+        'streak': counters.current_streak,
+    }
+
+
+def _touch_streak(counters, today):
+    if counters.last_active_date == today:
+        return False
+    if counters.last_active_date == today - timedelta(days=1):
+        counters.current_streak += 1
+    else:
+        counters.current_streak = 1
+    counters.longest_streak = max(counters.longest_streak, counters.current_streak)
+    counters.last_active_date = today
+    return True
+
+
+def _earned_badge_ids(user_id, badge_ids):
+    rows = db.session.execute(
+        db.select(user_badges.c.badge_id).where(
+            user_badges.c.user_id == user_id,
+            user_badges.c.badge_id.in_(badge_ids)
+        )
+    )
+    return {row[0] for row in rows}
+
+
+def _insert_badges(user_id, rules):
+    """Insert the badges of ``rules``, skipping any the user already has; returns the rules inserted"""
+    rows = [{'user_id': user_id, 'badge_id': rule.badge_id} for rule in rules]
+    dialect = db.session.get_bind().dialect
+    insert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(dialect.name)
+
+    if insert is not None and dialect.insert_returning:
+        stmt = insert(user_badges).values(rows).on_conflict_do_nothing().returning(user_badges.c.badge_id)
+        inserted = {row[0] for row in db.session.execute(stmt)}
+    else:
+        # Databases without ON CONFLICT: a savepoint per badge keeps a duplicate
+        # from rolling back the caller's transaction
+        inserted = set()
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(user_badges.insert().values(**row))
+            except IntegrityError:
+                continue
+            inserted.add(row['badge_id'])
+    return [rule for rule in rules if rule.badge_id in inserted]
+
+
+def _award(user_id, rules):
+    """Insert newly earned badges and append their points to the ledger; returns ``(awarded, bonus)``.
+
+    Badges a concurrent event already awarded are left out of ``awarded``.
+    """
+    awarded = _insert_badges(user_id, rules)
+    bonus = 0
+    for rule in awarded:
+        if rule.points_value:
+            award_points(user_id, rule.points_value, 'badge', rule.badge_id)
+            bonus += rule.points_value
+    return awarded, bonus
+
+
+def record_event(user_id, topics_completed=0, quizzes_passed=0, points=0):
+    """Apply an activity event for ``user_id`` and award any badges it unlocks.
+
+    ``points`` is the number of points the caller already appended to the
+    ledger for this event.  The caller commits.  Returns the list of awarded
+    :class:`BadgeRule` objects.
+    """
+    counters = db.session.get(UserCounters, user_id)
+    backfilled = counters is None
+    if backfilled:
+        # The backfill reads the pending progress/attempt rows too, so the
+        # event is already included in it
+        db.session.flush()
+        counters = get_counters(user_id)
+
+    increments = {name: amount for name, amount in (('topics_completed', topics_completed),
+                                                    ('quizzes_passed', quizzes_passed)) if amount}
+    if increments and not backfilled:
+        # Incremented in SQL so concurrent events for one user can't overwrite each other
+        db.session.execute(
+            db.update(UserCounters).where(UserCounters.user_id == user_id)
+            .values({name: getattr(UserCounters, name) + amount for name, amount in increments.items()}),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.refresh(counters, attribute_names=list(increments))
+
+    changed = set(increments)
+    if points:
+        changed.add('points')
+    if _touch_streak(counters, date.today()):
+        changed.add('streak')
+
+    rules = load_rules()
+    awarded = []
+    points_total = None
+    # Badge bonuses add points, which can unlock points badges in turn
+    while changed:
+        candidates = [rule for rule in rules.affected_by(changed)
+                      if rule.badge_id not in {r.badge_id for r in awarded}]
+        if not candidates:
+            break
+        earned = _earned_badge_ids(user_id, [rule.badge_id for rule in candidates])
+        if points_total is None:
+            points_total = current_points(user_id)
+        values = counter_values(counters, points_total)
+        newly = [rule for rule in candidates if rule.badge_id not in earned and rule_satisfied(rule, values)]
+        if not newly:
+            break
+        inserted, bonus = _award(user_id, newly)
+        awarded.extend(inserted)
+        points_total += bonus
+        changed = {'points'} if bonus else set()
+
+    return awarded
+
+
+def evaluate_all_users():
+    """Award every satisfied badge to every user (e.g. after adding a badge); returns awards made"""
+    rules = load_rules()
+    if not rules.rules:
+        return 0
+
+    earned = {}
+    for user_id, badge_id in db.session.execute(db.select(user_badges.c.user_id, user_badges.c.badge_id)):
+        earned.setdefault(user_id, set()).add(badge_id)
+
+    pending = pending_points_by_user()
+    total = 0
+    for user_id, total_points in db.session.query(User.id, User.total_points).all():
+        counters = get_counters(user_id)
+        values = counter_values(counters, (total_points or 0) + pending.get(user_id, 0))
+        user_earned = earned.get(user_id, set())
+        newly = [rule for rule in rules.rules if rule.badge_id not in user_earned and rule_satisfied(rule, values)]
+        if newly:
+            inserted, _ = _award(user_id, newly)
+            total += len(inserted)
+    db.session.commit()
+    return total
+
+
+@click.command('award-badges')
+def award_badges_command():
+    """Evaluate badge rules for every user and award what they have earned."""
+    invalidate_badge_rules()
+    click.echo(f'Awarded {evaluate_all_users()} badge(s)')
@@ -0,0 +1,76 @@
+# Bookmark membership and listing without loading User.bookmarked_resources
+#
+# ``resource in current_user.bookmarked_resources`` loads every bookmarked
+# Resource just to test one id.  Everything here works on the user_bookmarks
+# association table directly; its (user_id, resource_id) primary key makes the
+# EXISTS/INSERT/DELETE statements index lookups.  The cached id sets are
+# dropped on this process's toggles and expire after BOOKMARK_IDS_TTL seconds,
+# which bounds staleness for toggles made by other processes.
+from app.models.models import db, user_bookmarks
+from app.utils import queries
+from app.utils.cache import TTLCache
+from app.utils.pagination import keyset_paginate, BOOKMARK_SORTS
+
+BOOKMARK_IDS_TTL = 30
+
+_bookmark_ids_cache = TTLCache(ttl=BOOKMARK_IDS_TTL, maxsize=10000)
+
+
+def bookmarked_ids(user_id):
+    """Frozen set of resource ids bookmarked by ``user_id``, cached per user"""
+    def load():
+        rows = db.session.execute(
+            db.select(user_bookmarks.c.resource_id).where(user_bookmarks.c.user_id == user_id)
+        )
+        return frozenset(row[0] for row in rows)
+
+    return _bookmark_ids_cache.get_or_set(user_id, load)
+
+
+def is_bookmarked(user_id, resource_id):
+    return resource_id in bookmarked_ids(user_id)
+
+
+def _bookmark_exists(user_id, resource_id):
+    return db.session.execute(
+        db.select(db.exists().where(
+            user_bookmarks.c.user_id == user_id,
+            user_bookmarks.c.resource_id == resource_id
+        ))
+    ).scalar()
+
+
+def toggle_bookmark(user_id, resource_id):
+    """Add or remove a bookmark and return ``'added'`` or ``'removed'``.
+
+    The caller commits and then calls :func:`invalidate_bookmarks`; on a failed
+    commit the cached id set is still accurate.  Existence is checked against
+    the table rather than the cache so a stale cache can't cause a duplicate
+    insert.
+    """
+    if _bookmark_exists(user_id, resource_id):
+        db.session.execute(
+            user_bookmarks.delete().where(
+                user_bookmarks.c.user_id == user_id,
+                user_bookmarks.c.resource_id == resource_id
+            )
+        )
+        return 'removed'
+
+    db.session.execute(user_bookmarks.insert().values(user_id=user_id, resource_id=resource_id))
+    return 'added'
+
+
+def invalidate_bookmarks(user_id):
+    _bookmark_ids_cache.delete(user_id)
+
+
+def recent_bookmarks(user_id, limit=6):
+    """The user's most recently bookmarked resources"""
+    return queries.recent_bookmarks(user_id, limit).all()
+
+
+def paginated_bookmarks(user_id, after=None, before=None, per_page=12):
+    """Keyset-paginated bookmarks listing, most recently bookmarked first"""
+    return keyset_paginate(queries.bookmarked_resources(user_id), BOOKMARK_SORTS, 'created_at',
+                           after=after, before=before, per_page=per_page)
@@ -0,0 +1,265 @@
+# Pharmacology calculators, vectorised
+#
+# Every calculator is a Calculator: a list of input Fields and a compute
+# function over NumPy column arrays.  Inputs are parsed row by row (the only
+# per-row Python work), rows that fail validation are masked out, and the
+# formula plus any category banding (np.searchsorted over the band edges)
+# runs once over the remaining columns.  The single-input calculator routes
+# call calculate(), which is a batch of one, so both paths share one core.
+#
+# Batches are processed in chunks of BATCH_CHUNK rows so a long patient list
+# can be streamed in and out without holding it all in memory.  Each output
+# row carries its input index and either the result fields or an error.
+# Inputs with a unit field (weight_unit, dose_unit, volume_unit, time_unit)
+# accept any compatible unit from app.services.units and are converted
+# column-wise before the formula runs.
+import csv
+import io
+import json
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+from app.services.units import UnitError, registry
+
+BATCH_CHUNK = 5000
+MAX_BATCH_ROWS = 100000
+
+# parse: str -> value; check: vectorised predicate over the parsed column
+Field = namedtuple('Field', ['name', 'parse', 'default', 'check', 'message'])
+Calculator = namedtuple('Calculator', ['name', 'fields', 'compute', 'outputs', 'error'])
+
+
+class CalculationError(ValueError):
+    pass
+
+
+def _positive(values):
+    return values > 0
+
+
+def _number(name, parse=float, default=0, check=_positive, message=None):
+    return Field(name, parse, default, check, message or f'{name} must be positive')
+
+
+def _bands(values, edges, labels, colors):
+    """Category label and colour for each value; ``edges`` are the ascending lower bounds of labels[1:]"""
+    index = np.searchsorted(np.asarray(edges, dtype=float), values, side='right')
+    return np.asarray(labels, dtype=object)[index], np.asarray(colors, dtype=object)[index]
+
+
+def _unit_field(name, default):
+    """Optional unit for another input, e.g. weight in "lb"; must be convertible to ``default``"""
+    def parse(value):
+        value = str(value).strip()
+        registry.check(value, default)
+        return value
+    return Field(name, parse, default, _any, None)
+
+
+def _in(c, name, unit_field, unit):
+    """Column ``name`` converted from the per-row units in ``unit_field`` into ``unit``"""
+    converted, _ = registry.convert_many(c[name], c[unit_field], [unit] * len(c[name]))
+    return converted
+
+
+def _dose(c):
+    single = _in(c, 'weight', 'weight_unit', 'kg') * _in(c, 'dose_per_kg', 'dose_unit', 'mg/kg')
+    return {'single_dose': np.round(single, 2), 'daily_dose': np.round(single * c['frequency'], 2)}
+
+
+def _drip(c):
+    ml_per_hour = _in(c, 'volume', 'volume_unit', 'mL') / _in(c, 'time_hours', 'time_unit', 'h')
+    ml_per_minute = ml_per_hour / 60
+    return {'ml_per_hour': np.round(ml_per_hour, 1), 'ml_per_minute': np.round(ml_per_minute, 2),
+            'drops_per_minute': np.round(ml_per_minute * c['drop_factor'], 0)}
+
+
+def _bmi(c):
+    bmi = c['weight'] / (c['height'] / 100) ** 2
+    category, color = _bands(bmi, [18.5, 25, 30],
+                             ['Underweight', 'Normal weight', 'Overweight', 'Obese'],
+                             ['#1a6ac3', '#28a745', '#ffc107', '#dc3545'])
+    return {'bmi': np.round(bmi, 1), 'category': category, 'color': color}
+
+
+def _creatinine(c):
+    # Cockcroft-Gault, x0.85 for women
+    clearance = (140 - c['age']) * c['weight'] / (72 * c['creatinine'])
+    clearance = np.where(c['gender'] == 'female', clearance * 0.85, clearance)
+    category, color = _bands(clearance, [15, 30, 60, 90],
+                             ['Kidney failure', 'Severe decrease in kidney function',
+                              'Moderate decrease in kidney function', 'Mild decrease in kidney function',
+                              'Normal kidney function'],
+                             ['#6f42c1', '#dc3545', '#fd7e14', '#ffc107', '#28a745'])
+    return {'creatinine_clearance': np.round(clearance, 1), 'category': category, 'color': color}
+
+
+# Conversions offered by the unit converter form: conversion_type -> (from unit, to unit).
+# Any other pair of compatible units can be given as from_unit/to_unit.
+UNIT_CONVERSIONS = {
+    'weight_kg_to_lb': ('kg', 'lb'),
+    'weight_lb_to_kg': ('lb', 'kg'),
+    'weight_g_to_mg': ('g', 'mg'),
+    'weight_mg_to_g': ('mg', 'g'),
+    'weight_g_to_mcg': ('g', 'mcg'),
+    'weight_mcg_to_g': ('mcg', 'g'),
+    'volume_l_to_ml': ('L', 'mL'),
+    'volume_ml_to_l': ('mL', 'L'),
+    'volume_ml_to_cc': ('mL', 'cc'),
+    'volume_cc_to_ml': ('cc', 'mL'),
+    'volume_tsp_to_ml': ('tsp', 'mL'),
+    'volume_ml_to_tsp': ('mL', 'tsp'),
+    'temperature_to_f': ('°C', '°F'),
+    'temperature_to_c': ('°F', '°C'),
+}
+
+
+def _conversion_type(value):
+    value = str(value or '').strip()
+    if value and value not in UNIT_CONVERSIONS:
+        raise ValueError('unknown conversion_type')
+    return value
+
+
+def _units(c):
+    n = len(c['value'])
+    pairs = [UNIT_CONVERSIONS[kind] if kind else (source, target)
+             for kind, source, target in zip(c['conversion_type'], c['from_unit'], c['to_unit'])]
+    errors = np.full(n, None, dtype=object)
+    for k, (source, target) in enumerate(pairs):
+        try:
+            registry.check(source, target)
+        except UnitError as e:
+            errors[k] = str(e)
+    converted, _ = registry.convert_many(c['value'], [pair[0] for pair in pairs], [pair[1] for pair in pairs])
+    return {'original_value': c['value'], 'converted_value': np.round(converted, 6),
+            'from_unit': np.array([pair[0] for pair in pairs], dtype=object),
+            'to_unit': np.array([pair[1] for pair in pairs], dtype=object), 'error': errors}
+
+
+def _any(values):
+    return np.ones(len(values), dtype=bool)
+
+
+CALCULATORS = {calculator.name: calculator for calculator in [
+    Calculator('dose', [_number('weight'), _number('dose_per_kg'), _number('frequency', int, 1),
+                        _unit_field('weight_unit', 'kg'), _unit_field('dose_unit', 'mg/kg')], _dose,
+               ['weight', 'weight_unit', 'dose_per_kg', 'dose_unit', 'frequency', 'single_dose', 'daily_dose'],
+               'Please enter valid numeric values'),
+    Calculator('drip', [_number('volume'), _number('time_hours'), _number('drop_factor', int, 20),
+                        _unit_field('volume_unit', 'mL'), _unit_field('time_unit', 'h')], _drip,
+               ['volume', 'volume_unit', 'time_hours', 'time_unit', 'drop_factor', 'ml_per_hour',
+                'ml_per_minute', 'drops_per_minute'],
+               'Please enter valid numeric values'),
+    Calculator('bmi', [_number('weight'), _number('height')], _bmi,
+               ['weight', 'height', 'bmi', 'category', 'color'],
+               'Please enter valid numeric values'),
+    Calculator('creatinine', [_number('age', int), _number('weight'), _number('creatinine'),
+                              Field('gender', str, 'male', _any, None)], _creatinine,
+               ['age', 'weight', 'creatinine', 'gender', 'creatinine_clearance', 'category', 'color'],
+               'Please enter valid values'),
+    Calculator('units', [Field('value', float, 0, np.isfinite, 'value must be a number'),
+                         Field('conversion_type', _conversion_type, '', _any, None),
+                         Field('from_unit', str, '', _any, None), Field('to_unit', str, '', _any, None)], _units,
+               ['original_value', 'converted_value', 'from_unit', 'to_unit', 'conversion_type'],
+               'Please enter valid values'),
+]}
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _run_chunk(calculator, records):
+    """Results (dict) or errors (str) for one chunk of input records, in order"""
+    n = len(records)
+    errors = [None if isinstance(record, dict) else 'expected an object' for record in records]
+    columns = {}
+    for field in calculator.fields:
+        values = []
+        for i, record in enumerate(records):
+            raw = record.get(field.name) if errors[i] is None else None
+            try:
+                values.append(field.parse(field.default if raw is None or raw == '' else raw))
+            except (TypeError, ValueError):
+                values.append(field.parse(field.default))
+                errors[i] = errors[i] or f'invalid {field.name}'
+        column = np.asarray(values, dtype=object if isinstance(field.default, str) else None)
+        if field.check is not _any:
+            with np.errstate(invalid='ignore'):
+                failed = ~field.check(column.astype(float))
+            for i in np.flatnonzero(failed):
+                errors[i] = errors[i] or field.message
+        columns[field.name] = column
+
+    rows = [i for i in range(n) if errors[i] is None]
+    output = {}
+    if rows:
+        picked = {name: column[rows] for name, column in columns.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            output = dict(picked, **calculator.compute(picked))
+        # compute may reject rows that only fail in combination (e.g. incompatible units)
+        for k, error in zip(range(len(rows)), output.pop('error', [None] * len(rows))):
+            if error is not None:
+                errors[rows[k]] = error
+
+    position = {row: k for k, row in enumerate(rows)}
+    return [errors[i] if errors[i] is not None else
+            {name: _scalar(output[name][position[i]]) for name in calculator.outputs} for i in range(n)]
+
+
+def run_batch(name, records):
+    """Yield ``(index, result dict or error string)`` for an iterable of input records.
+
+    Rows past MAX_BATCH_ROWS are not computed; a single error entry marks where the batch was cut off.
+    """
+    calculator = CALCULATORS[name]
+    records = iter(records)
+    offset = 0
+    while offset < MAX_BATCH_ROWS:
+        chunk = list(islice(records, min(BATCH_CHUNK, MAX_BATCH_ROWS - offset)))
+        if not chunk:
+            return
+        for i, result in enumerate(_run_chunk(calculator, chunk)):
+            yield offset + i, result
+        offset += len(chunk)
+    if next(records, None) is not None:
+        yield offset, f'batches are limited to {MAX_BATCH_ROWS} rows'
+
+
+def calculate(name, data):
+    """One calculation from a form or JSON mapping; raises CalculationError with the user-facing message"""
+    calculator = CALCULATORS[name]
+    _, result = next(run_batch(name, [dict(data) if data else {}]))
+    if isinstance(result, str):
+        raise CalculationError(calculator.error)
+    return result
+
+
+def stream_json(name, records):
+    """Batch results as a JSON document, produced in chunks"""
+    yield '{"success": true, "results": ['
+    for index, result in run_batch(name, records):
+        row = {'index': index, 'error': result} if isinstance(result, str) else {'index': index, 'result': result}
+        yield (', ' if index else '') + json.dumps(row)
+    yield ']}'
+
+
+def stream_csv(name, records):
+    """Batch results as CSV: the calculator's output columns plus an error column"""
+    outputs = CALCULATORS[name].outputs
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['index'] + outputs + ['error'])
+    for index, result in run_batch(name, records):
+        if isinstance(result, str):
+            writer.writerow([index] + [''] * len(outputs) + [result])
+        else:
+            writer.writerow([index] + [result[name] for name in outputs] + [''])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
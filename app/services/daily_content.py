@@ -0,0 +1,124 @@
+# Today's word and quiz, resolved once per day
+#
+# Several pages look up WordOfTheDay / QuizOfTheDay by date (and category,
+# with a fallback to any category).  get_daily_content() loads all of today's
+# rows with one query per model, keeps them as plain tuples (safe to share
+# between requests and sessions) and caches them for DAILY_CONTENT_TTL
+# seconds, never past the next local midnight.  A background thread pre-warms
+# the new day just after midnight.  Admin edits call invalidate_daily_content(),
+# which only clears this process's cache; the TTL bounds how long other
+# workers keep serving the old rows.
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from app.models.models import db, QuizOfTheDay, WordOfTheDay
+from app.utils.cache import TTLCache
+from app.utils.queries import daily_quizzes, daily_words, previous_words
+
+logger = logging.getLogger(__name__)
+
+PREVIOUS_WORDS = 10
+DAILY_CONTENT_TTL = 300
+
+DailyWord = namedtuple('DailyWord', [column.name for column in WordOfTheDay.__table__.columns])
+DailyQuiz = namedtuple('DailyQuiz', [column.name for column in QuizOfTheDay.__table__.columns])
+
+_daily_cache = TTLCache(ttl=24 * 60 * 60, maxsize=2)
+
+
+class DailyContent:
+    """Everything scheduled for one date, indexed by category"""
+
+    def __init__(self, day, words, quizzes, previous_words):
+        self.date = day
+        self._words = self._by_category(words)
+        self._quizzes = self._by_category(quizzes)
+        self.previous_words = tuple(previous_words)
+
+    @staticmethod
+    def _by_category(rows):
+        # rows are ordered by (category, id), so the lowest id wins like .first() did
+        index = {}
+        for row in rows:
+            index.setdefault(row.category, row)
+        return {'categories': index, 'any': min(rows, key=lambda row: row.id) if rows else None}
+
+    @staticmethod
+    def _pick(index, category, fallback):
+        if category is None:
+            return index['any']
+        found = index['categories'].get(category)
+        if found is None and fallback:
+            return index['any']
+        return found
+
+    def word(self, category=None, fallback=True):
+        """Today's word for ``category`` (any category when None), falling back to any word"""
+        return self._pick(self._words, category, fallback)
+
+    def quiz(self, category=None, fallback=True):
+        return self._pick(self._quizzes, category, fallback)
+
+
+def _row_tuple(cls, row):
+    return cls(*(getattr(row, field) for field in cls._fields))
+
+
+def _load(day):
+    words = daily_words(day).all()
+    quizzes = daily_quizzes(day).all()
+    previous = previous_words(day, PREVIOUS_WORDS).all()
+    return DailyContent(day,
+                        [_row_tuple(DailyWord, row) for row in words],
+                        [_row_tuple(DailyQuiz, row) for row in quizzes],
+                        [_row_tuple(DailyWord, row) for row in previous])
+
+
+def seconds_until_midnight(now=None):
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max((midnight - now).total_seconds(), 1)
+
+
+def get_daily_content(day=None):
+    """Cached DailyContent for ``day`` (default: today, local time)"""
+    day = day or date.today()
+    # Also expire at the next local midnight so "today" never outlives the day
+    return _daily_cache.get_or_set(day, lambda: _load(day), ttl=min(DAILY_CONTENT_TTL, seconds_until_midnight()))
+
+
+def invalidate_daily_content():
+    """Call after words or quizzes of the day are added or edited"""
+    _daily_cache.clear()
+
+
+def _prewarm_loop(app):
+    while True:
+        # Wake just after midnight and load the new day before the first visitor does
+        time.sleep(seconds_until_midnight() + 1)
+        with app.app_context():
+            try:
+                get_daily_content()
+            except Exception:
+                logger.exception('Pre-warming daily content failed')
+            finally:
+                db.session.remove()
+
+
+def start_prewarmer(app):
+    """Load today's content now and again after every midnight"""
+    if app.extensions.get('daily_content_prewarmer'):
+        return None
+    app.extensions['daily_content_prewarmer'] = True
+    with app.app_context():
+        try:
+            get_daily_content()
+        except Exception:
+            # e.g. tables not created yet while running migrations
+            logger.warning('Could not pre-warm daily content', exc_info=True)
+    thread = threading.Thread(target=_prewarm_loop, args=(app,), name='daily-content-prewarmer', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,188 @@
+# In-memory drug catalog
+#
+# The pharmacology pages read a DrugCatalog snapshot instead of the Drug and
+# DrugClass tables: every drug as a DrugRecord with brand_names and
+# dosage_forms already parsed, every class as a ClassRecord with its drug ids
+# (sorted by name) and drug count, plus the recently-added ordering.  The
+# snapshot is built with two queries, holds only immutable tuples (safe to
+# share between threads) and is cached for CATALOG_TTL seconds.
+#
+# It is built at startup and dropped after any commit
+# that touches a Drug or DrugClass, so admin edits show up on the next
+# request; the TTL bounds staleness for writes made by other processes.
+# Concurrent misses wait for a single build under _build_lock, and a build
+# that an invalidation overtook is returned but not cached.
+import itertools
+import json
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event
+
+from app.models.models import db, Drug, DrugClass
+from app.utils.cache import TTLCache
+from app.utils.db_routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL = 300
+
+_DRUG_COLUMNS = [column.name for column in Drug.__table__.columns]
+_CLASS_COLUMNS = [column.name for column in DrugClass.__table__.columns]
+
+DrugRecord = namedtuple('DrugRecord', _DRUG_COLUMNS + ['drug_class'])
+ClassRecord = namedtuple('ClassRecord', _CLASS_COLUMNS + ['drug_ids', 'drug_count'])
+
+_catalog_cache = TTLCache(ttl=CATALOG_TTL, maxsize=1)
+_build_lock = threading.Lock()
+_generations = itertools.count(1)
+_generation = [0]
+
+
+def parse_list(raw):
+    """A JSON array column as a tuple of strings; anything unparseable is empty"""
+    if not raw:
+        return ()
+    try:
+        parsed = json.loads(raw)
+    except (TypeError, ValueError):
+        return ()
+    return tuple(str(item) for item in parsed) if isinstance(parsed, list) else ()
+
+
+def _matches(needle, *fields):
+    return any(needle in (field or '').casefold() for field in fields)
+
+
+class DrugCatalog:
+    """Immutable snapshot of all drugs and drug classes"""
+
+    def __init__(self, class_rows, drug_rows):
+        drug_rows = sorted(drug_rows, key=lambda row: (row.name.casefold(), row.id))
+        members = {}
+        for row in drug_rows:
+            members.setdefault(row.drug_class_id, []).append(row.id)
+
+        self._classes = {}
+        for row in class_rows:
+            drug_ids = tuple(members.get(row.id, ()))
+            self._classes[row.id] = ClassRecord(*row, drug_ids=drug_ids, drug_count=len(drug_ids))
+        self.classes = tuple(sorted(self._classes.values(), key=lambda record: (record.name, record.id)))
+
+        self._drugs = {}
+        for row in drug_rows:
+            values = dict(zip(_DRUG_COLUMNS, row))
+            values['brand_names'] = parse_list(values['brand_names'])
+            values['dosage_forms'] = parse_list(values['dosage_forms'])
+            self._drugs[row.id] = DrugRecord(**values, drug_class=self._classes.get(row.drug_class_id))
+        self.drugs = tuple(self._drugs.values())  # by name
+        self._recent = tuple(drug.id for drug in sorted(
+            self.drugs, key=lambda drug: (drug.created_at or datetime.min, drug.id), reverse=True))
+
+    @classmethod
+    def load(cls):
+        class_rows = db.session.query(*[getattr(DrugClass, name) for name in _CLASS_COLUMNS]).all()
+        drug_rows = db.session.query(*[getattr(Drug, name) for name in _DRUG_COLUMNS]).all()
+        return cls(class_rows, drug_rows)
+
+    def __len__(self):
+        return len(self._drugs)
+
+    def drug(self, drug_id):
+        return self._drugs.get(drug_id)
+
+    def drug_class(self, class_id):
+        return self._classes.get(class_id)
+
+    def drugs_in_class(self, class_id, exclude=None, limit=None):
+        """Drugs of a class ordered by name"""
+        record = self._classes.get(class_id)
+        if record is None:
+            return []
+        ids = (drug_id for drug_id in record.drug_ids if drug_id != exclude)
+        return [self._drugs[drug_id] for drug_id in (list(ids)[:limit] if limit else ids)]
+
+    def recent(self, limit=6):
+        return [self._drugs[drug_id] for drug_id in self._recent[:limit]]
+
+    def search_drugs(self, query, limit=20, descriptions=True):
+        """Drugs whose name, generic name or (optionally) description contains ``query``, case-insensitively"""
+        needle = query.casefold()
+        results = []
+        for drug in self.drugs:
+            if _matches(needle, drug.name, drug.generic_name, drug.description if descriptions else None):
+                results.append(drug)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def search_classes(self, query, limit=None):
+        needle = query.casefold()
+        results = [record for record in self.classes if _matches(needle, record.name, record.description)]
+        return results[:limit] if limit else results
+
+
+def get_catalog():
+    """The shared catalog, built by one request at a time on a miss"""
+    catalog = _catalog_cache.get('catalog')
+    if catalog is None:
+        with _build_lock:
+            catalog = _catalog_cache.get('catalog')
+            if catalog is None:
+                generation = _generation[0]
+                catalog = DrugCatalog.load()
+                if generation == _generation[0]:
+                    _catalog_cache.set('catalog', catalog)
+    return catalog
+
+
+def invalidate_catalog():
+    _generation[0] = next(_generations)
+    _catalog_cache.clear()
+
+
+def find_drug(drug_id):
+    """A drug from the catalog; rebuilds once if the id is missing but exists (added by another process)"""
+    drug = get_catalog().drug(drug_id)
+    if drug is None and db.session.get(Drug, drug_id) is not None:
+        invalidate_catalog()
+        drug = get_catalog().drug(drug_id)
+    return drug
+
+
+def find_class(class_id):
+    record = get_catalog().drug_class(class_id)
+    if record is None and db.session.get(DrugClass, class_id) is not None:
+        invalidate_catalog()
+        record = get_catalog().drug_class(class_id)
+    return record
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    if any(isinstance(obj, (Drug, DrugClass)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['drug_catalog_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_catalog_on_commit(session):
+    if session.info.pop('drug_catalog_changed', False):
+        invalidate_catalog()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_catalog_changes(session):
+    session.info.pop('drug_catalog_changed', None)
+
+
+def warm_catalog(app):
+    """Build the catalog at startup so the first pharmacology request doesn't pay for it"""
+    with app.app_context():
+        try:
+            get_catalog()
+        except Exception:
+            # e.g. tables not created yet while running migrations
+            logger.warning('Could not load the drug catalog', exc_info=True)
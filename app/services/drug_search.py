@@ -0,0 +1,178 @@
+# Fuzzy drug-name lookup
+#
+# Every name a drug is known by - Drug.name, generic_name, each parsed brand
+# name, and each word of a multi-word name - is a term in a trigram inverted
+# index: term strings are normalised (accents stripped, case-folded,
+# punctuation to spaces), padded as "$term$" and split into trigrams, and
+# each trigram maps to a NumPy array of the term ids containing it.
+#
+# A query is padded only at the front ("$amox"), so a prefix shares all of
+# its trigrams with the names it starts.  Candidates are counted with one
+# np.bincount over the postings of the query's trigrams; k edits destroy at
+# most 3k trigrams, so terms sharing fewer than len(grams) - 3k can't be
+# within k edits and are skipped.  The best MAX_CANDIDATES survivors are
+# verified with a bounded Damerau-Levenshtein (optimal string alignment)
+# distance, computed once per candidate against both the whole term and its
+# best-matching prefix.  Matches are ranked by edit distance, a prefix match
+# counting PREFIX_PENALTY more than a whole-term match with the same edits.
+#
+# The index is built from the drug catalog snapshot and rebuilt whenever the
+# snapshot is, by one request at a time under _build_lock while the others
+# wait for it.
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+
+from app.services.drug_catalog import get_catalog
+from app.utils.cache import TTLCache
+
+MAX_CANDIDATES = 64
+PREFIX_PENALTY = 0.5
+
+Match = namedtuple('Match', ['drug', 'term', 'kind', 'distance', 'score'])
+
+_NON_WORD = re.compile(r'[^\w]+')
+_index_cache = TTLCache(ttl=3600, maxsize=1)
+_build_lock = threading.Lock()
+
+
+def normalize_name(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def _grams(padded):
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(length):
+    """Typos tolerated for a query of ``length`` characters"""
+    if length < 3:
+        return 0
+    if length <= 5:
+        return 1
+    return 2 if length <= 10 else 3
+
+
+def edit_distance(query, term, limit):
+    """``(whole-term distance, best prefix distance)`` under optimal string alignment.
+
+    Gives up early - returning ``limit + 1`` for both - once every cell of a
+    row exceeds ``limit``.
+    """
+    m, n = len(query), len(term)
+    over = limit + 1
+    if m - n > limit:
+        return over, over
+    previous2 = None
+    previous = list(range(n + 1))
+    for i in range(1, m + 1):
+        current = [i] + [0] * n
+        q = query[i - 1]
+        for j in range(1, n + 1):
+            cost = 0 if q == term[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and q == term[j - 2] and query[i - 2] == term[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return over, over
+        previous2, previous = previous, current
+    return min(previous[n], over), min(min(previous), over)
+
+
+class NameIndex:
+    """Trigram index over every name in a DrugCatalog"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        terms, seen = [], set()
+        for drug in catalog.drugs:
+            names = [(drug.name, 'name'), (drug.generic_name, 'generic')] + \
+                [(brand, 'brand') for brand in drug.brand_names]
+            for text, kind in names:
+                normalized = normalize_name(text)
+                if not normalized:
+                    continue
+                words = normalized.split()
+                entries = [(normalized, kind)] + ([(word, kind) for word in words if len(word) > 2]
+                                                  if len(words) > 1 else [])
+                for term, term_kind in entries:
+                    if (term, drug.id) not in seen:
+                        seen.add((term, drug.id))
+                        terms.append((term, drug.id, term_kind, text))
+
+        self.terms = [term for term, _, _, _ in terms]
+        self.drug_ids = np.array([drug_id for _, drug_id, _, _ in terms], dtype=np.int64)
+        self.kinds = [kind for _, _, kind, _ in terms]
+        self.labels = [label for _, _, _, label in terms]
+
+        postings = {}
+        for term_id, term in enumerate(self.terms):
+            for gram in _grams(f'${term}$'):
+                postings.setdefault(gram, []).append(term_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _candidates(self, grams, edits):
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        counts = np.bincount(np.concatenate(lists), minlength=len(self.terms))
+        needed = max(len(grams) - 3 * edits, 1)
+        candidates = np.flatnonzero(counts >= needed)
+        if len(candidates) > MAX_CANDIDATES:
+            best = np.argpartition(counts[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+            candidates = candidates[best]
+        return candidates, counts[candidates]
+
+    def search(self, query, limit=10, prefix=True):
+        """Drugs matching ``query`` best first, at most one Match per drug"""
+        query = normalize_name(query)
+        if not query:
+            return []
+        edits = max_edits(len(query))
+        grams = _grams(f'${query}')
+        candidates, shared = self._candidates(grams, edits)
+
+        best = {}
+        for term_id, count in zip(candidates.tolist(), shared.tolist()):
+            term = self.terms[term_id]
+            whole, partial = edit_distance(query, term, edits)
+            options = [(float(whole), whole)] if whole <= edits else []
+            if prefix and partial <= edits and partial < whole:
+                options.append((partial + PREFIX_PENALTY, partial))
+            if not options:
+                continue
+            score, distance = min(options)
+            drug_id = int(self.drug_ids[term_id])
+            # ties: more shared trigrams, then the shorter (closer) term
+            key = (score, -count, len(term), term)
+            if drug_id not in best or key < best[drug_id][0]:
+                best[drug_id] = (key, Match(self.catalog.drug(drug_id), self.labels[term_id], self.kinds[term_id],
+                                            distance, score))
+        ranked = sorted(best.values(), key=lambda item: (item[0], item[1].drug.name))
+        return [match for _, match in ranked[:limit]]
+
+
+def get_name_index():
+    """The NameIndex for the current catalog snapshot"""
+    catalog = get_catalog()
+    index = _index_cache.get('names')
+    if index is None or index.catalog is not catalog:
+        with _build_lock:
+            index = _index_cache.get('names')
+            if index is None or index.catalog is not catalog:
+                index = NameIndex(catalog)
+                _index_cache.set('names', index)
+    return index
+
+
+def search_drug_names(query, limit=10, prefix=True):
+    return get_name_index().search(query, limit=limit, prefix=prefix)
@@ -0,0 +1,89 @@
+# Cached facet counts for the library filter dropdowns
+#
+# Filling the type/author/year dropdowns used to cost three SELECT DISTINCT
+# scans of the resource table per request.  Instead we keep one grouped
+# "cube" of (resource_type, author, year_published) -> count for the active
+# catalog and derive every facet from it in Python.  The cube has one row per
+# distinct combination, which is far smaller than the catalog itself.
+from app.models.models import db, Resource
+from app.utils.cache import TTLCache
+
+FACET_TTL = 300  # seconds; writes through the admin UI invalidate sooner
+
+_cube_cache = TTLCache(ttl=FACET_TTL, maxsize=256)
+
+
+class FacetCube:
+    """Resource counts grouped by (resource_type, author, year_published)"""
+
+    def __init__(self, rows):
+        self.rows = [(rtype, author, year, count) for rtype, author, year, count in rows]
+
+    @classmethod
+    def build(cls, search_query=''):
+        query = db.session.query(
+            Resource.resource_type,
+            Resource.author,
+            Resource.year_published,
+            db.func.count(Resource.id)
+        ).filter(Resource.is_active == True)
+
+        if search_query:
+            query = query.filter(
+                db.or_(
+                    Resource.title.contains(search_query),
+                    Resource.description.contains(search_query),
+                    Resource.author.contains(search_query)
+                )
+            )
+
+        rows = query.group_by(Resource.resource_type, Resource.author, Resource.year_published).all()
+        return cls(rows)
+
+    def facets(self, resource_type='all', author='', year='', author_limit=50):
+        """Return ``{'types': [...], 'authors': [...], 'years': [...]}`` of ``(value, count)`` pairs.
+
+        Each facet is counted with every *other* active filter applied, so the
+        type dropdown shows how many results each type would give for the
+        chosen author/year, and so on.
+        """
+        type_filter = None if resource_type in ('', 'all') else resource_type
+        author_filter = author.casefold() if author else None
+        try:
+            year_filter = int(year) if year else None
+        except (TypeError, ValueError):
+            year_filter = None
+
+        types, authors, years = {}, {}, {}
+        for rtype, row_author, row_year, count in self.rows:
+            type_ok = type_filter is None or rtype == type_filter
+            # Mirrors Resource.author.contains(), which is case-insensitive on SQLite
+            author_ok = author_filter is None or (row_author is not None and author_filter in row_author.casefold())
+            year_ok = year_filter is None or row_year == year_filter
+
+            if author_ok and year_ok and rtype:
+                types[rtype] = types.get(rtype, 0) + count
+            if type_ok and year_ok and row_author:
+                authors[row_author] = authors.get(row_author, 0) + count
+            if type_ok and author_ok and row_year:
+                years[row_year] = years.get(row_year, 0) + count
+
+        return {
+            'types': sorted(types.items()),
+            'authors': sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:author_limit],
+            'years': sorted(years.items(), reverse=True)
+        }
+
+
+def get_facet_cube(search_query=''):
+    """Return the cached cube for ``search_query`` (the whole catalog when empty)"""
+    return _cube_cache.get_or_set(search_query, lambda: FacetCube.build(search_query))
+
+
+def get_facets(resource_type='all', author='', year='', search_query='', author_limit=50):
+    return get_facet_cube(search_query).facets(resource_type, author, year, author_limit=author_limit)
+
+
+def invalidate_facets():
+    """Drop cached cubes after resources are added, edited or deactivated"""
+    _cube_cache.clear()
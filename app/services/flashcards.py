@@ -0,0 +1,120 @@
+# Spaced-repetition scheduling for flashcards (SM-2)
+#
+# Each user has a FlashcardState row per card they have reviewed: ease
+# factor, interval in days, streak of successful reviews and the next due
+# time.  A review reads and writes that single row by primary key.  Decks are
+# read from the (user_id, due) index - cards due now, oldest first - topped up
+# with a few cards the user has never seen from topics they have started, so
+# building a deck never scans every card.
+#
+# Ratings follow SM-2's 0-5 quality scale; the names again/hard/good/easy map
+# to 1/3/4/5.  Anything below 3 is a lapse: the streak resets and the card
+# comes back after RELEARN_MINUTES.
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from app.models.models import db, Flashcard, FlashcardState, UserProgress
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+RELEARN_MINUTES = 10
+DECK_SIZE = 50
+NEW_CARDS_PER_DECK = 20
+
+RATINGS = {'again': 1, 'hard': 3, 'good': 4, 'easy': 5}
+
+Schedule = namedtuple('Schedule', ['ease', 'interval', 'repetitions', 'lapses', 'due'])
+DeckCard = namedtuple('DeckCard', ['flashcard_id', 'topic_id', 'front_text', 'back_text', 'due', 'interval', 'is_new'])
+
+
+def parse_rating(value):
+    """SM-2 quality 0-5 from a number or a button name, or None if invalid"""
+    if isinstance(value, str) and value.strip().lower() in RATINGS:
+        return RATINGS[value.strip().lower()]
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if 0 <= rating <= 5 else None
+
+
+def next_schedule(ease, interval, repetitions, lapses, rating, now):
+    """Apply one SM-2 review with quality ``rating`` (0-5)"""
+    if rating >= 3:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = max(int(round(interval * ease)), interval + 1)
+        repetitions += 1
+        due = now + timedelta(days=interval)
+    else:
+        interval = 0
+        repetitions = 0
+        lapses += 1
+        due = now + timedelta(minutes=RELEARN_MINUTES)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02))
+    return Schedule(ease, interval, repetitions, lapses, due)
+
+
+def review(user_id, flashcard_id, rating, now=None):
+    """Record a review and return the card's FlashcardState, or None if the card isn't active.
+
+    The caller commits.
+    """
+    now = now or datetime.utcnow()
+    state = db.session.get(FlashcardState, (user_id, flashcard_id))
+    if state is None:
+        card = db.session.query(Flashcard.topic_id).filter(Flashcard.id == flashcard_id,
+                                                           Flashcard.is_active == True).first()
+        if card is None:
+            return None
+        state = FlashcardState(user_id=user_id, flashcard_id=flashcard_id, topic_id=card.topic_id,
+                               ease=DEFAULT_EASE, interval=0, repetitions=0, lapses=0, due=now)
+        db.session.add(state)
+
+    schedule = next_schedule(state.ease, state.interval, state.repetitions, state.lapses, rating, now)
+    state.ease, state.interval, state.repetitions, state.lapses, state.due = schedule
+    state.last_reviewed_at = now
+    return state
+
+
+def _due_cards(user_id, limit, now, topic_id=None):
+    query = db.session.query(FlashcardState.flashcard_id, FlashcardState.topic_id, Flashcard.front_text,
+                             Flashcard.back_text, FlashcardState.due, FlashcardState.interval)\
+        .join(Flashcard, Flashcard.id == FlashcardState.flashcard_id)\
+        .filter(FlashcardState.user_id == user_id, FlashcardState.due <= now, Flashcard.is_active == True)
+    if topic_id is not None:
+        query = query.filter(FlashcardState.topic_id == topic_id)
+    return [DeckCard(*row, is_new=False) for row in query.order_by(FlashcardState.due).limit(limit)]
+
+
+def _new_cards(user_id, limit, topic_id=None):
+    if limit <= 0:
+        return []
+    seen = db.session.query(FlashcardState.flashcard_id)\
+        .filter(FlashcardState.user_id == user_id, FlashcardState.flashcard_id == Flashcard.id)
+    query = db.session.query(Flashcard.id, Flashcard.topic_id, Flashcard.front_text, Flashcard.back_text)\
+        .filter(Flashcard.is_active == True, ~seen.exists())
+    if topic_id is not None:
+        query = query.filter(Flashcard.topic_id == topic_id).order_by(Flashcard.id)
+    else:
+        # Only topics the user has opened, most recently visited first
+        query = query.join(UserProgress, db.and_(UserProgress.topic_id == Flashcard.topic_id,
+                                                 UserProgress.user_id == user_id))\
+            .order_by(UserProgress.last_accessed.desc(), Flashcard.id)
+    return [DeckCard(*row, due=None, interval=0, is_new=True) for row in query.limit(limit)]
+
+
+def build_deck(user_id, topic_id=None, limit=DECK_SIZE, new_cards=NEW_CARDS_PER_DECK, now=None):
+    """Cards due for review (all topics, or one) followed by up to ``new_cards`` unseen cards"""
+    now = now or datetime.utcnow()
+    deck = _due_cards(user_id, limit, now, topic_id)
+    return deck + _new_cards(user_id, min(new_cards, limit - len(deck)), topic_id)
+
+
+def topic_states(user_id, topic_id):
+    """``{flashcard_id: FlashcardState}`` for the user's reviewed cards in a topic"""
+    return {state.flashcard_id: state for state in FlashcardState.query.filter_by(user_id=user_id, topic_id=topic_id)}
+
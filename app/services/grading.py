@@ -0,0 +1,284 @@
+# Quiz grading with compiled answer keys
+#
+# A quiz's questions are compiled once into an AnswerKey: every accepted
+# answer is normalised up front (case, surrounding and repeated whitespace,
+# option labels resolved to option text), so grading a submission is one set
+# lookup per question instead of re-parsing questions on every request.
+# Question types:
+#
+#   multiple_choice, true_false, short_answer, ...   one accepted string
+#   multiple_select (multi_select, checkbox, ...)     exact set of options;
+#                                                     correct_answer is a JSON
+#                                                     list or "A, C"
+#   numeric (number, calculation)                     "12.5", "12.5 +/- 0.1",
+#                                                     or options {"tolerance": x}
+#
+# Options may be a JSON list (labelled a, b, c, ...) or an object mapping
+# labels to text; answers and keys may use either the label or the text.
+# Scores are weighted by QuizQuestion.points.  Keys are cached per quiz and
+# dropped when a commit touches the quiz's questions; regrade_attempts()
+# re-scores stored attempts against the current keys.
+import json
+import re
+import string
+import unicodedata
+from collections import namedtuple
+from itertools import chain
+
+import click
+from sqlalchemy import bindparam, event, inspect
+
+from app.models.models import db, Quiz, QuizAttempt, QuizQuestion
+from app.utils.cache import TTLCache
+from app.utils.db_routing import RoutingSession
+
+CHOICE = 'choice'
+MULTI = 'multi'
+NUMERIC = 'numeric'
+
+MULTI_TYPES = {'multiple_select', 'multi_select', 'multiple_answer', 'checkbox'}
+NUMERIC_TYPES = {'numeric', 'number', 'calculation'}
+BOOLEAN_ALIASES = {'t': 'true', 'yes': 'true', 'y': 'true', 'f': 'false', 'no': 'false', 'n': 'false'}
+DEFAULT_TOLERANCE = 1e-9
+REGRADE_BATCH = 500
+
+_NUMBER = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)', re.IGNORECASE)
+_TOLERANCE = re.compile(r'^(.*?)(?:±|\+/-|\+-)(.*)$')
+_SEPARATORS = re.compile(r'[,;|]')
+
+# expected: frozenset of accepted strings (CHOICE), frozenset of options (MULTI) or a number (NUMERIC)
+CompiledQuestion = namedtuple('CompiledQuestion', ['id', 'kind', 'points', 'expected', 'tolerance', 'labels'])
+AnswerKey = namedtuple('AnswerKey', ['quiz_id', 'questions', 'total_points'])
+GradeResult = namedtuple('GradeResult', ['score', 'earned_points', 'total_points',
+                                         'correct_answers', 'total_questions', 'results'])
+RegradeResult = namedtuple('RegradeResult', ['checked', 'changed'])
+
+_key_cache = TTLCache(ttl=600, maxsize=512)
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive form of a single answer"""
+    if value is None:
+        return ''
+    return ' '.join(unicodedata.normalize('NFKC', str(value)).casefold().split())
+
+
+def _parse_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.match(str(value or '').replace(',', ''))
+    return float(match.group(1)) if match else None
+
+
+def _option_labels(options):
+    """``{normalised label: normalised option text}`` from QuizQuestion.options"""
+    try:
+        parsed = json.loads(options) if options else None
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(parsed, dict):
+        return {normalize(label): normalize(text) for label, text in parsed.items()
+                if not isinstance(text, (dict, list))}
+    if isinstance(parsed, list):
+        return {label: normalize(text) for label, text in zip(string.ascii_lowercase, parsed)
+                if not isinstance(text, (dict, list))}
+    return {}
+
+
+def _options_setting(options, name):
+    try:
+        parsed = json.loads(options) if options else None
+    except (TypeError, ValueError):
+        return None
+    return parsed.get(name) if isinstance(parsed, dict) else None
+
+
+def _resolve(value, labels):
+    value = normalize(value)
+    return labels.get(value, value)
+
+
+def _split(value):
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    text = str(value or '')
+    if text.lstrip().startswith('['):
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, list):
+            return parsed
+    return [part for part in _SEPARATORS.split(text) if part.strip()]
+
+
+def compile_question(question_id, question_type, options, correct_answer, points):
+    """Build a CompiledQuestion from a QuizQuestion's columns"""
+    question_type = (question_type or '').lower()
+    points = 1 if points is None else max(points, 0)
+
+    if question_type in NUMERIC_TYPES:
+        value, tolerance = correct_answer, _options_setting(options, 'tolerance')
+        match = _TOLERANCE.match(str(correct_answer or ''))
+        if match:
+            value, tolerance = match.group(1), _parse_number(match.group(2))
+        expected = _parse_number(value)
+        if expected is not None:
+            tolerance = _parse_number(tolerance) if tolerance is not None else None
+            return CompiledQuestion(question_id, NUMERIC, points, expected,
+                                    abs(tolerance) if tolerance is not None else DEFAULT_TOLERANCE, {})
+        # Unparseable key: fall back to comparing the text
+
+    labels = _option_labels(options)
+    if question_type in MULTI_TYPES:
+        expected = frozenset(_resolve(part, labels) for part in _split(correct_answer))
+        return CompiledQuestion(question_id, MULTI, points, expected, None, labels)
+
+    if question_type == 'true_false':
+        labels = dict(BOOLEAN_ALIASES, **labels)
+    return CompiledQuestion(question_id, CHOICE, points, frozenset({_resolve(correct_answer, labels)}), None, labels)
+
+
+def is_correct(question, answer):
+    if answer is None or answer == '' or answer == []:
+        return False
+    if question.kind == NUMERIC:
+        value = _parse_number(answer)
+        return value is not None and abs(value - question.expected) <= question.tolerance
+    if question.kind == MULTI:
+        return frozenset(_resolve(part, question.labels) for part in _split(answer)) == question.expected
+    if isinstance(answer, (list, dict)):
+        return False
+    return _resolve(answer, question.labels) in question.expected
+
+
+def canonical_answer(question, answer):
+    """The normalised form of ``answer`` that grading compares, for tallying responses"""
+    if question.kind == NUMERIC:
+        value = _parse_number(answer)
+        return '' if value is None else format(value, 'g')
+    if question.kind == MULTI:
+        return ', '.join(sorted(_resolve(part, question.labels) for part in _split(answer)))
+    if isinstance(answer, (list, dict)):
+        return ''
+    return _resolve(answer, question.labels)
+
+
+def _build_key(quiz_id):
+    rows = db.session.query(QuizQuestion.id, QuizQuestion.question_type, QuizQuestion.options,
+                            QuizQuestion.correct_answer, QuizQuestion.points)\
+        .filter(QuizQuestion.quiz_id == quiz_id)\
+        .order_by(QuizQuestion.order_index, QuizQuestion.id).all()
+    questions = tuple(compile_question(*row) for row in rows)
+    return AnswerKey(quiz_id, questions, sum(question.points for question in questions))
+
+
+def get_answer_key(quiz_id):
+    """The compiled AnswerKey for a quiz (cached)"""
+    return _key_cache.get_or_set(quiz_id, lambda: _build_key(quiz_id))
+
+
+def invalidate_answer_key(quiz_id=None):
+    """Drop one quiz's key, or every key when ``quiz_id`` is None"""
+    if quiz_id is None:
+        _key_cache.clear()
+    else:
+        _key_cache.delete(quiz_id)
+
+
+def grade(key, answers):
+    """Grade ``{question_id: answer}`` (ids as str or int) against an AnswerKey"""
+    answers = answers if isinstance(answers, dict) else {}
+    results = {}
+    earned = 0
+    for question in key.questions:
+        answer = answers.get(str(question.id), answers.get(question.id))
+        correct = is_correct(question, answer)
+        results[question.id] = correct
+        if correct:
+            earned += question.points
+    score = (earned / key.total_points * 100) if key.total_points > 0 else 0
+    return GradeResult(score, earned, key.total_points, sum(results.values()), len(key.questions), results)
+
+
+def decode_answers(raw):
+    """QuizAttempt.answers JSON as a dict (empty when missing or malformed)"""
+    try:
+        answers = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        return {}
+    return answers if isinstance(answers, dict) else {}
+
+
+def regrade_attempts(quiz_id=None, batch_size=REGRADE_BATCH):
+    """Re-score completed attempts (of one quiz, or all) against the current answer keys.
+
+    Only QuizAttempt.score is rewritten; points and badges already granted
+    are left alone.  Adaptive attempts are skipped: their score is an
+    ability estimate, not a grade of the answers.  Commits after each batch and returns a RegradeResult.
+    """
+    checked = changed = 0
+    last_id = 0
+    attempts = QuizAttempt.__table__
+    while True:
+        query = db.session.query(QuizAttempt.id, QuizAttempt.quiz_id, QuizAttempt.answers, QuizAttempt.score)\
+            .filter(QuizAttempt.completed == True, QuizAttempt.mode != 'adaptive', QuizAttempt.id > last_id)
+        if quiz_id is not None:
+            query = query.filter(QuizAttempt.quiz_id == quiz_id)
+        rows = query.order_by(QuizAttempt.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        updates = []
+        for attempt_id, attempt_quiz_id, raw_answers, old_score in rows:
+            score = grade(get_answer_key(attempt_quiz_id), decode_answers(raw_answers)).score
+            # score is stored as an integer percentage
+            if old_score is None or abs(old_score - score) >= 0.5:
+                updates.append({'attempt_id': attempt_id, 'new_score': score})
+        if updates:
+            db.session.execute(
+                attempts.update().where(attempts.c.id == bindparam('attempt_id')).values(score=bindparam('new_score')),
+                updates
+            )
+        db.session.commit()
+
+        checked += len(rows)
+        changed += len(updates)
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+    return RegradeResult(checked, changed)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changed_quizzes(session, flush_context):
+    changed = session.info.setdefault('changed_quiz_ids', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, QuizQuestion):
+            changed.add(obj.quiz_id)
+            # a question moved to another quiz changes both keys
+            changed.update(inspect(obj).attrs.quiz_id.history.deleted or ())
+        elif isinstance(obj, Quiz) and obj in session.deleted:
+            changed.add(obj.id)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_changed_quizzes(session):
+    for quiz_id in session.info.pop('changed_quiz_ids', ()):
+        invalidate_answer_key(quiz_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_changed_quizzes(session):
+    session.info.pop('changed_quiz_ids', None)
+
+
+@click.command('regrade-quizzes')
+@click.option('--quiz-id', type=int, default=None, help='Only re-score attempts of this quiz.')
+def regrade_quizzes_command(quiz_id):
+    """Re-score completed quiz attempts against the current answer keys."""
+    invalidate_answer_key()
+    result = regrade_attempts(quiz_id)
+    click.echo(f'Checked {result.checked} attempt(s), updated {result.changed}')
@@ -0,0 +1,252 @@
+# Quiz item analysis
+#
+# For every quiz, completed attempts are graded against the current answer
+# key into a NumPy response matrix (attempts x questions, each cell the
+# question's points when answered correctly).  Only additive sufficient
+# statistics are stored - per-item sums of x, x^2 and x*total, the sums of
+# total and total^2, correct counts and response tallies - so new attempts
+# are folded in from QuizItemAnalysis.last_attempt_id onwards without
+# re-reading history.  From those sums we derive:
+#
+#   difficulty      share of attempts answering the item correctly
+#   discrimination  point-biserial correlation of the item with the rest of
+#                   the test (total minus the item itself)
+#   distractors     most frequent wrong answers
+#   alpha           Cronbach's alpha for the whole quiz
+#
+# The checkpoint never moves past an attempt that is still in progress (ids
+# are assigned when an attempt starts, not when it is submitted); attempts
+# left open longer than OPEN_ATTEMPT_HORIZON count as abandoned.  If the
+# answer key changes the stored sums no longer match it and the quiz is
+# recomputed from scratch.  Adaptive attempts are left out: each one answers
+# a handful of questions picked for that user, so they would skew both the
+# item difficulties and alpha.
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+import numpy as np
+
+from app.models.models import db, Quiz, QuizAttempt, QuizItemAnalysis
+from app.services.grading import CHOICE, MULTI, canonical_answer, decode_answers, get_answer_key, is_correct
+
+ANALYSIS_BATCH = 2000
+MAX_TRACKED_RESPONSES = 50  # distinct answers tallied per item; the rest count as OTHER
+TOP_DISTRACTORS = 5
+OTHER = '(other)'
+BLANK = '(blank)'
+
+TOO_HARD = 0.2
+TOO_EASY = 0.95
+POOR_DISCRIMINATION = 0.2
+MIN_ATTEMPTS_FOR_FLAGS = 10
+OPEN_ATTEMPT_HORIZON = timedelta(hours=24)
+
+
+def key_fingerprint(key):
+    parts = [[q.id, q.kind, q.points, sorted(q.expected) if isinstance(q.expected, frozenset) else q.expected,
+              q.tolerance] for q in key.questions]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _empty_sums(key):
+    k = len(key.questions)
+    return {'questions': [q.id for q in key.questions], 'n': 0,
+            'sx': [0.0] * k, 'sx2': [0.0] * k, 'sxt': [0.0] * k, 'st': 0.0, 'st2': 0.0,
+            'correct': [0] * k, 'responses': [{} for _ in range(k)]}
+
+
+def response_matrix(key, answer_dicts):
+    """``(scores, correct)`` arrays of shape (attempts, questions) plus per-item response lists"""
+    questions = key.questions
+    correct = np.zeros((len(answer_dicts), len(questions)), dtype=bool)
+    responses = [[] for _ in questions]
+    for i, answers in enumerate(answer_dicts):
+        for j, question in enumerate(questions):
+            answer = answers.get(str(question.id), answers.get(question.id))
+            correct[i, j] = is_correct(question, answer)
+            responses[j].append(canonical_answer(question, answer) or BLANK)
+    points = np.array([q.points for q in questions], dtype=float)
+    return correct * points, correct, responses
+
+
+def _fold(sums, key, answer_dicts):
+    scores, correct, responses = response_matrix(key, answer_dicts)
+    totals = scores.sum(axis=1)
+    sums['n'] += len(answer_dicts)
+    sums['sx'] = (np.array(sums['sx']) + scores.sum(axis=0)).tolist()
+    sums['sx2'] = (np.array(sums['sx2']) + (scores ** 2).sum(axis=0)).tolist()
+    sums['sxt'] = (np.array(sums['sxt']) + scores.T @ totals).tolist()
+    sums['st'] += float(totals.sum())
+    sums['st2'] += float(totals @ totals)
+    sums['correct'] = (np.array(sums['correct']) + correct.sum(axis=0)).astype(int).tolist()
+
+    for question, tally, answers in zip(key.questions, sums['responses'], responses):
+        if question.kind not in (CHOICE, MULTI):
+            continue  # numeric answers don't form a useful set of distractors
+        for answer, count in Counter(answers).items():
+            if answer not in tally and len(tally) >= MAX_TRACKED_RESPONSES:
+                answer = OTHER
+            tally[answer] = tally.get(answer, 0) + count
+
+
+def _safe_ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = numerator / denominator
+    return np.where(denominator > 1e-12, ratio, np.nan)
+
+
+def _metric(value):
+    return None if value is None or not np.isfinite(value) else round(float(value), 4)
+
+
+def compute_results(sums, key):
+    """Per-item difficulty, discrimination and distractors plus Cronbach's alpha from stored sums"""
+    n, k = sums['n'], len(sums['questions'])
+    if not n or not k:
+        return {'attempts': n, 'alpha': None, 'items': []}
+
+    sx, sx2, sxt = (np.array(sums[name], dtype=float) for name in ('sx', 'sx2', 'sxt'))
+    st, st2 = sums['st'], sums['st2']
+
+    difficulty = np.array(sums['correct'], dtype=float) / n
+    mean_x = sx / n
+    var_x = sx2 / n - mean_x ** 2
+    # rest score = total - item, so the item isn't correlated with itself
+    mean_r = (st - sx) / n
+    var_r = (st2 - 2 * sxt + sx2) / n - mean_r ** 2
+    cov_xr = (sxt - sx2) / n - mean_x * mean_r
+    discrimination = _safe_ratio(cov_xr, np.sqrt(np.clip(var_x * var_r, 0, None)))
+
+    var_t = st2 / n - (st / n) ** 2
+    alpha = None
+    if k > 1 and var_t > 1e-12:
+        alpha = k / (k - 1) * (1 - var_x.sum() / var_t)
+
+    items = []
+    for j, question in enumerate(key.questions):
+        if question.kind == MULTI:
+            accepted = {', '.join(sorted(question.expected))}
+        else:
+            accepted = question.expected if question.kind == CHOICE else ()
+        distractors = sorted(
+            ((answer, count) for answer, count in sums['responses'][j].items() if answer not in accepted),
+            key=lambda item: (-item[1], item[0])
+        )[:TOP_DISTRACTORS]
+
+        flags = []
+        if n >= MIN_ATTEMPTS_FOR_FLAGS:
+            if difficulty[j] < TOO_HARD:
+                flags.append('too_hard')
+            elif difficulty[j] > TOO_EASY:
+                flags.append('too_easy')
+            if np.isfinite(discrimination[j]) and discrimination[j] < POOR_DISCRIMINATION:
+                flags.append('poor_discrimination')
+
+        items.append({
+            'question_id': question.id,
+            'difficulty': _metric(difficulty[j]),
+            'discrimination': _metric(discrimination[j]),
+            'distractors': [{'answer': answer, 'count': count} for answer, count in distractors],
+            'flags': flags
+        })
+    return {'attempts': n, 'alpha': _metric(alpha), 'items': items}
+
+
+def analyze_quiz(quiz_id, full=False, batch_size=ANALYSIS_BATCH):
+    """Fold attempts newer than the stored checkpoint into the quiz's analysis and commit it"""
+    key = get_answer_key(quiz_id)
+    fingerprint = key_fingerprint(key)
+
+    analysis = db.session.get(QuizItemAnalysis, quiz_id)
+    if analysis is None:
+        analysis = QuizItemAnalysis(quiz_id=quiz_id)
+        db.session.add(analysis)
+    if full or analysis.key_fingerprint != fingerprint or not analysis.sums:
+        analysis.key_fingerprint = fingerprint
+        analysis.last_attempt_id = 0
+        analysis.attempt_count = 0
+        sums = _empty_sums(key)
+    else:
+        sums = json.loads(analysis.sums)
+
+    last_id = analysis.last_attempt_id
+    barrier = db.session.query(db.func.min(QuizAttempt.id)).filter(
+        QuizAttempt.quiz_id == quiz_id,
+        QuizAttempt.mode != 'adaptive',
+        QuizAttempt.id > last_id,
+        db.or_(QuizAttempt.completed == False, QuizAttempt.completed.is_(None)),
+        QuizAttempt.started_at > datetime.utcnow() - OPEN_ATTEMPT_HORIZON
+    ).scalar()
+    while True:
+        query = db.session.query(QuizAttempt.id, QuizAttempt.answers)\
+            .filter(QuizAttempt.quiz_id == quiz_id, QuizAttempt.completed == True, QuizAttempt.mode != 'adaptive',
+                    QuizAttempt.id > last_id)
+        if barrier is not None:
+            query = query.filter(QuizAttempt.id < barrier)
+        rows = query.order_by(QuizAttempt.id).limit(batch_size).all()
+        if not rows:
+            break
+        _fold(sums, key, [decode_answers(raw) for _, raw in rows])
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+
+    analysis.last_attempt_id = last_id
+    analysis.attempt_count = sums['n']
+    analysis.sums = json.dumps(sums)
+    analysis.results = json.dumps(compute_results(sums, key))
+    analysis.updated_at = datetime.utcnow()
+    db.session.commit()
+    return analysis
+
+
+def analyze_pending_quizzes(full=False):
+    """Analyse every quiz with completed attempts newer than its checkpoint; returns the quiz ids"""
+    latest = db.session.query(QuizAttempt.quiz_id, db.func.max(QuizAttempt.id).label('latest'))\
+        .filter(QuizAttempt.completed == True, QuizAttempt.mode != 'adaptive')\
+        .group_by(QuizAttempt.quiz_id).subquery()
+    query = db.session.query(latest.c.quiz_id)\
+        .outerjoin(QuizItemAnalysis, QuizItemAnalysis.quiz_id == latest.c.quiz_id)
+    if not full:
+        query = query.filter(latest.c.latest > db.func.coalesce(QuizItemAnalysis.last_attempt_id, 0))
+    quiz_ids = [row[0] for row in query.order_by(latest.c.quiz_id)]
+    for quiz_id in quiz_ids:
+        analyze_quiz(quiz_id, full=full)
+    return quiz_ids
+
+
+def analysis_summaries(limit=10):
+    """Stored analyses for the admin dashboard, most recently updated first"""
+    rows = db.session.query(QuizItemAnalysis, Quiz.title)\
+        .join(Quiz, Quiz.id == QuizItemAnalysis.quiz_id)\
+        .order_by(QuizItemAnalysis.updated_at.desc()).limit(limit).all()
+    summaries = []
+    for analysis, title in rows:
+        results = json.loads(analysis.results or '{}')
+        items = results.get('items', [])
+        summaries.append({
+            'quiz_id': analysis.quiz_id,
+            'title': title,
+            'attempts': analysis.attempt_count,
+            'alpha': results.get('alpha'),
+            'flagged_items': sum(1 for item in items if item['flags']),
+            'total_items': len(items),
+            'updated_at': analysis.updated_at
+        })
+    return summaries
+
+
+@click.command('analyze-quizzes')
+@click.option('--quiz-id', type=int, default=None, help='Only analyse this quiz.')
+@click.option('--full', is_flag=True, help='Recompute from the first attempt instead of the last checkpoint.')
+def analyze_quizzes_command(quiz_id, full):
+    """Update quiz item statistics with attempts completed since the last run."""
+    if quiz_id is not None:
+        analysis = analyze_quiz(quiz_id, full=full)
+        click.echo(f'Quiz {quiz_id}: {analysis.attempt_count} attempt(s) analysed')
+        return
+    quiz_ids = analyze_pending_quizzes(full=full)
+    click.echo(f'Analysed {len(quiz_ids)} quiz(zes)')
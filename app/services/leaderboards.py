@@ -0,0 +1,215 @@
+# Global, per-track and weekly leaderboards
+#
+# Boards live in process memory as RankedSets (see app.utils.ranking), so top-N
+# and "my rank" are O(log n) instead of an ORDER BY over the user table.  They
+# are built from the database the first time they're read (stored totals plus
+# uncompacted ledger events; the weekly board from this week's ledger) and then
+# kept current from the session: every committed PointsEvent is added to the
+# user's global, track and weekly scores, and committed User changes move users
+# between track boards.  Each worker process holds its own copy; writes in
+# other processes reach it when the board is rebuilt
+# (LEADERBOARD_REBUILD_SECONDS).
+#
+# A rebuild runs outside _lock, one at a time, while readers keep using the
+# old boards, and is swapped in under the lock.  Totals, pending ledger points
+# and the highest ledger id (the watermark) come from one statement, so a
+# compaction can't fold events between two reads and count them twice.
+# Changes committed while the build runs are queued and replayed onto the new
+# boards; points at or below the watermark are skipped as already counted.
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from app.models.models import db, PointsEvent, User
+from app.services.points import pending_points_subquery, week_start
+from app.utils.db_routing import RoutingSession
+from app.utils.ranking import RankedSet
+
+_lock = threading.RLock()
+_build_lock = threading.Lock()
+_state = {'built_at': None, 'week': None, 'global': None, 'tracks': {}, 'weekly': None, 'user_tracks': {},
+          'replay': None}
+
+
+def _build():
+    boards = {'global': RankedSet(), 'tracks': {}, 'weekly': RankedSet(), 'user_tracks': {}}
+    watermark = db.select(db.func.coalesce(db.func.max(PointsEvent.id), 0)).scalar_subquery()
+    pending = pending_points_subquery()
+    rows = db.session.execute(
+        db.select(User.id, User.track,
+                  db.func.coalesce(User.total_points, 0) + db.func.coalesce(pending.c.points, 0),
+                  watermark)
+        .outerjoin(pending, pending.c.user_id == User.id)
+    ).all()
+    last_event_id = rows[0][3] if rows else 0
+    for user_id, track, score, _ in rows:
+        boards['global'].set(user_id, score)
+        boards['tracks'].setdefault(track, RankedSet()).set(user_id, score)
+        boards['user_tracks'][user_id] = track
+
+    start = week_start()
+    weekly = db.session.query(PointsEvent.user_id, db.func.sum(PointsEvent.points))\
+        .filter(PointsEvent.created_at >= start, PointsEvent.id <= last_event_id)\
+        .group_by(PointsEvent.user_id)
+    for user_id, points in weekly:
+        boards['weekly'].set(user_id, points)
+
+    boards['built_at'] = time.time()
+    boards['week'] = start
+    return boards, last_event_id
+
+
+def _needs_build(rebuild_after):
+    with _lock:
+        built_at = _state['built_at']
+        return built_at is None or time.time() - built_at > rebuild_after or _state['week'] != week_start()
+
+
+def _rebuild():
+    with _lock:
+        _state['replay'] = []
+    try:
+        boards, last_event_id = _build()
+    finally:
+        with _lock:
+            replay, _state['replay'] = _state['replay'], None
+    with _lock:
+        for change in replay:
+            if change[0] == 'points':
+                _, event_id, user_id, points = change
+                if event_id is None or event_id > last_event_id:
+                    _apply_points(boards, user_id, points)
+            elif change[0] == 'track':
+                _apply_move(boards, change[1], change[2])
+            else:
+                _apply_remove(boards, change[1])
+        _state.update(boards)
+
+
+def _boards():
+    rebuild_after = current_app.config.get('LEADERBOARD_REBUILD_SECONDS', 600) if has_app_context() else 600
+    if _needs_build(rebuild_after):
+        # Readers wait only for the very first build; later ones serve the old boards meanwhile
+        if _build_lock.acquire(blocking=_state['built_at'] is None):
+            try:
+                if _needs_build(rebuild_after):
+                    _rebuild()
+            finally:
+                _build_lock.release()
+    return _state
+
+
+def invalidate_leaderboards():
+    with _lock:
+        _state['built_at'] = None
+
+
+def _apply_move(boards, user_id, track):
+    score = boards['global'].score(user_id)
+    if score is None:
+        score = 0
+        boards['global'].set(user_id, score)
+    old_track = boards['user_tracks'].get(user_id)
+    if user_id in boards['user_tracks'] and old_track != track:
+        boards['tracks'].get(old_track, RankedSet()).discard(user_id)
+    boards['user_tracks'][user_id] = track
+    boards['tracks'].setdefault(track, RankedSet()).set(user_id, score)
+
+
+def _apply_points(boards, user_id, points):
+    score = boards['global'].increment(user_id, points)
+    track = boards['user_tracks'].get(user_id)
+    boards['tracks'].setdefault(track, RankedSet()).set(user_id, score)
+    if boards['week'] == week_start():
+        boards['weekly'].increment(user_id, points)
+
+
+def _apply_remove(boards, user_id):
+    track = boards['user_tracks'].pop(user_id, None)
+    boards['global'].discard(user_id)
+    boards['weekly'].discard(user_id)
+    if track in boards['tracks']:
+        boards['tracks'][track].discard(user_id)
+
+
+def _record(change, apply, *args):
+    with _lock:
+        if _state['replay'] is not None:
+            _state['replay'].append(change)
+        if _state['built_at'] is None:
+            return  # not built yet; the build will read the committed rows
+        apply(_state, *args)
+
+
+def _move_user(user_id, track):
+    _record(('track', user_id, track), _apply_move, user_id, track)
+
+
+def _add_points(event_id, user_id, points):
+    _record(('points', event_id, user_id, points), _apply_points, user_id, points)
+
+
+def _remove_user(user_id):
+    _record(('remove', user_id), _apply_remove, user_id)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changes(session, flush_context):
+    tracks = session.info.setdefault('leaderboard_tracks', {})
+    points = session.info.setdefault('leaderboard_points', [])
+    for obj in session.new:
+        if isinstance(obj, PointsEvent):
+            points.append((obj.id, obj.user_id, obj.points))
+        elif isinstance(obj, User):
+            tracks[obj.id] = obj.track
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            tracks[obj.id] = obj.track
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            tracks[obj.id] = None
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_changes(session):
+    # Stored totals are ignored here: points only change through the ledger,
+    # and compaction folds events that are already counted
+    for user_id, track in session.info.pop('leaderboard_tracks', {}).items():
+        if track is None:
+            _remove_user(user_id)
+        else:
+            _move_user(user_id, track)
+    for event_id, user_id, points in session.info.pop('leaderboard_points', ()):
+        _add_points(event_id, user_id, points)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('leaderboard_tracks', None)
+    session.info.pop('leaderboard_points', None)
+
+
+def _board(scope, track=None):
+    boards = _boards()
+    if scope == 'weekly':
+        return boards['weekly']
+    if scope == 'track':
+        return boards['tracks'].get(track) or RankedSet()
+    return boards['global']
+
+
+def top(scope='global', n=10, track=None):
+    """``[(rank, user_id, points), ...]`` with 1-based ranks"""
+    return [(rank, user_id, points)
+            for rank, (user_id, points) in enumerate(_board(scope, track).top(n), start=1)]
+
+
+def rank_of(user_id, scope='global', track=None):
+    """``(rank, points, board size)`` for the user, rank 1-based, or None if unranked"""
+    board = _board(scope, track)
+    rank = board.rank(user_id)
+    if rank is None:
+        return None
+    return rank + 1, board.score(user_id), len(board)
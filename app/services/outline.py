@@ -0,0 +1,132 @@
+# Course outline cache (course -> modules -> topics)
+#
+# Course pages only need the shape of the curriculum (ids, titles, order,
+# active flags), which changes only when admins edit content.  The whole tree
+# is built with three queries into immutable tuples and shared by every
+# request.  Each build gets a new version number; admin views that add
+# modules or topics call rebuild_outline() after committing, and the TTL
+# bounds staleness for edits made by other processes.  Per-user progress is
+# not part of the outline - fetch it with progress_for() and overlay it when
+# rendering.
+import itertools
+import threading
+from collections import namedtuple
+
+from app.models.models import db, Course, Module, Topic, UserProgress
+from app.utils.cache import TTLCache
+
+OUTLINE_TTL = 600  # seconds
+
+TopicOutline = namedtuple('TopicOutline', ['id', 'title', 'order_index', 'is_active',
+                                           'estimated_time', 'difficulty_level'])
+ModuleOutline = namedtuple('ModuleOutline', ['id', 'name', 'description', 'order_index', 'is_active',
+                                             'topics'])
+CourseOutline = namedtuple('CourseOutline', ['id', 'name', 'track', 'is_active', 'modules'])
+TopicProgressView = namedtuple('TopicProgressView', ['completed', 'progress_percentage', 'last_accessed'])
+
+NO_PROGRESS = TopicProgressView(False, 0, None)
+
+_outline_cache = TTLCache(ttl=OUTLINE_TTL, maxsize=1)
+_versions = itertools.count(1)
+_build_lock = threading.Lock()
+
+
+class Outline:
+    """Immutable snapshot of every course, keyed for direct lookup"""
+
+    def __init__(self, version, courses):
+        self.version = version
+        self.courses = {course.id: course for course in courses}
+        self.modules = {}
+        self.topic_parents = {}  # topic id -> (course id, module id)
+        for course in courses:
+            for module in course.modules:
+                self.modules[module.id] = (course.id, module)
+                for topic in module.topics:
+                    self.topic_parents[topic.id] = (course.id, module.id)
+
+    def course(self, course_id):
+        return self.courses.get(course_id)
+
+    def module(self, module_id):
+        entry = self.modules.get(module_id)
+        return entry[1] if entry else None
+
+    def course_of_module(self, module_id):
+        entry = self.modules.get(module_id)
+        return self.courses[entry[0]] if entry else None
+
+
+def active_modules(course):
+    return tuple(module for module in course.modules if module.is_active)
+
+
+def active_topics(module):
+    return tuple(topic for topic in module.topics if topic.is_active)
+
+
+def _build():
+    courses = db.session.query(Course.id, Course.name, Course.track, Course.is_active).order_by(Course.id).all()
+    modules = db.session.query(Module.id, Module.course_id, Module.name, Module.description,
+                               Module.order_index, Module.is_active)\
+        .order_by(Module.course_id, Module.order_index, Module.id).all()
+    topics = db.session.query(Topic.id, Topic.module_id, Topic.title, Topic.order_index, Topic.is_active,
+                              Topic.estimated_time, Topic.difficulty_level)\
+        .order_by(Topic.module_id, Topic.order_index, Topic.id).all()
+
+    topics_by_module = {}
+    for row in topics:
+        topics_by_module.setdefault(row.module_id, []).append(
+            TopicOutline(row.id, row.title, row.order_index, bool(row.is_active),
+                         row.estimated_time, row.difficulty_level))
+
+    modules_by_course = {}
+    for row in modules:
+        modules_by_course.setdefault(row.course_id, []).append(
+            ModuleOutline(row.id, row.name, row.description, row.order_index, bool(row.is_active),
+                          tuple(topics_by_module.get(row.id, ()))))
+
+    return Outline(next(_versions), [
+        CourseOutline(row.id, row.name, row.track, bool(row.is_active), tuple(modules_by_course.get(row.id, ())))
+        for row in courses
+    ])
+
+
+def get_outline():
+    """The shared outline, built on first use and after invalidation"""
+    outline = _outline_cache.get('outline')
+    if outline is None:
+        with _build_lock:
+            outline = _outline_cache.get_or_set('outline', _build)
+    return outline
+
+
+def rebuild_outline():
+    """Build a fresh version now; call after committing course/module/topic changes"""
+    with _build_lock:
+        outline = _build()
+        _outline_cache.set('outline', outline)
+    return outline
+
+
+def progress_for(user_id, topic_ids):
+    """``{topic_id: TopicProgressView}`` for the user's progress rows among ``topic_ids``"""
+    topic_ids = list(topic_ids)
+    if not topic_ids:
+        return {}
+    rows = db.session.query(UserProgress.topic_id, UserProgress.completed,
+                            UserProgress.progress_percentage, UserProgress.last_accessed)\
+        .filter(UserProgress.user_id == user_id, UserProgress.topic_id.in_(topic_ids))
+    return {row.topic_id: TopicProgressView(bool(row.completed), row.progress_percentage or 0, row.last_accessed)
+            for row in rows}
+
+
+def module_summary(module, progress):
+    """Totals for the module's active topics, overlaid with ``progress_for`` output"""
+    topics = active_topics(module)
+    completed = sum(1 for topic in topics if progress.get(topic.id, NO_PROGRESS).completed)
+    return {
+        'total_topics': len(topics),
+        'completed_topics': completed,
+        'progress_percentage': (completed / len(topics) * 100) if topics else 0
+    }
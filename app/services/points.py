@@ -0,0 +1,188 @@
+# Points ledger
+#
+# Awarding points is an INSERT into points_event; nothing touches the user row
+# in the request path.  A compactor (a background thread started by create_app,
+# or ``flask compact-points``) periodically folds new events into
+# User.total_points / User.level and advances the ledger checkpoint.  Until
+# then, current_points() adds a user's uncompacted events to their stored total,
+# and time-windowed totals (this week, this month) are range scans on the
+# (user_id, created_at) / (created_at) indexes rather than over user history.
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import bindparam
+
+from app.models.models import db, LedgerCheckpoint, PointsEvent, User
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_LEVEL = 100
+CHECKPOINT = 'points'
+COMPACTION_BATCH = 10000
+# Only fold events at least this old, so a transaction that took its id
+# earlier but commits a little later is never skipped by the checkpoint
+COMPACTION_GRACE_SECONDS = 5
+
+
+def level_for(points):
+    return (points or 0) // POINTS_PER_LEVEL + 1
+
+
+def award_points(user_id, points, reason, source_id=None):
+    """Append a ledger entry; the caller commits"""
+    event = PointsEvent(user_id=user_id, points=points, reason=reason, source_id=source_id,
+                        created_at=datetime.utcnow())
+    db.session.add(event)
+    return event
+
+
+def _checkpoint_id():
+    return db.select(LedgerCheckpoint.last_event_id)\
+        .where(LedgerCheckpoint.name == CHECKPOINT).scalar_subquery()
+
+
+def _pending_filter():
+    return PointsEvent.id > db.func.coalesce(_checkpoint_id(), 0)
+
+
+def current_points(user_id):
+    """Stored total plus events the compactor hasn't folded in yet (one query)"""
+    pending = db.select(db.func.coalesce(db.func.sum(PointsEvent.points), 0))\
+        .where(PointsEvent.user_id == user_id, _pending_filter()).scalar_subquery()
+    return db.session.execute(
+        db.select(db.func.coalesce(User.total_points, 0) + pending).where(User.id == user_id)
+    ).scalar() or 0
+
+
+def pending_points_subquery():
+    """Subquery of ``(user_id, points)`` summing each user's uncompacted events"""
+    return db.select(PointsEvent.user_id, db.func.sum(PointsEvent.points).label('points'))\
+        .where(_pending_filter()).group_by(PointsEvent.user_id).subquery()
+
+
+def pending_points_by_user():
+    """``{user_id: points}`` for every user with uncompacted events"""
+    pending = pending_points_subquery()
+    return dict(db.session.execute(db.select(pending.c.user_id, pending.c.points)).all())
+
+
+def week_start(now=None):
+    """Monday 00:00 (UTC) of the week containing ``now``"""
+    now = now or datetime.utcnow()
+    return datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
+
+
+def month_start(now=None):
+    now = now or datetime.utcnow()
+    return datetime(now.year, now.month, 1)
+
+
+def points_since(user_id, since):
+    return db.session.query(db.func.coalesce(db.func.sum(PointsEvent.points), 0))\
+        .filter(PointsEvent.user_id == user_id, PointsEvent.created_at >= since).scalar()
+
+
+def points_by_user_since(since):
+    """``{user_id: points}`` earned since ``since``"""
+    rows = db.session.query(PointsEvent.user_id, db.func.sum(PointsEvent.points))\
+        .filter(PointsEvent.created_at >= since).group_by(PointsEvent.user_id)
+    return dict(rows)
+
+
+def _compact_batch(batch_size, grace_seconds):
+    checkpoint = db.session.get(LedgerCheckpoint, CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = LedgerCheckpoint(name=CHECKPOINT, last_event_id=0)
+        db.session.add(checkpoint)
+        db.session.flush()
+    start = checkpoint.last_event_id
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    batch = db.select(PointsEvent.id)\
+        .where(PointsEvent.id > start, PointsEvent.created_at <= cutoff)\
+        .order_by(PointsEvent.id).limit(batch_size).subquery()
+    upto = db.session.execute(db.select(db.func.max(batch.c.id))).scalar()
+    if upto is None:
+        db.session.rollback()
+        return 0, set()
+
+    deltas = db.session.query(PointsEvent.user_id, db.func.sum(PointsEvent.points), db.func.count(PointsEvent.id))\
+        .filter(PointsEvent.id > start, PointsEvent.id <= upto)\
+        .group_by(PointsEvent.user_id).all()
+    folded = sum(count for _, _, count in deltas)
+
+    current = {user_id: (total or 0, level or 1) for user_id, total, level in
+               db.session.query(User.id, User.total_points, User.level).filter(User.id.in_([d[0] for d in deltas]))}
+    users = User.__table__
+    db.session.execute(
+        users.update().where(users.c.id == bindparam('uid')).values(
+            total_points=db.func.coalesce(users.c.total_points, 0) + bindparam('delta'),
+            level=bindparam('new_level')
+        ),
+        [{'uid': user_id, 'delta': delta,
+          'new_level': max(current[user_id][1], level_for(current[user_id][0] + delta))}
+         for user_id, delta, _ in deltas if user_id in current]
+    )
+
+    # Another compactor may have advanced the checkpoint in the meantime
+    advanced = db.session.execute(
+        LedgerCheckpoint.__table__.update()
+        .where(LedgerCheckpoint.name == CHECKPOINT, LedgerCheckpoint.last_event_id == start)
+        .values(last_event_id=upto, updated_at=datetime.utcnow())
+    ).rowcount
+    if not advanced:
+        db.session.rollback()
+        return 0, set()
+
+    db.session.commit()
+    return folded, set(current)
+
+
+def compact(batch_size=COMPACTION_BATCH, grace_seconds=COMPACTION_GRACE_SECONDS):
+    """Fold new ledger events into user totals; returns the number of events folded"""
+    from app.services.user_cache import invalidate_user
+
+    total = 0
+    while True:
+        folded, user_ids = _compact_batch(batch_size, grace_seconds)
+        # Core UPDATEs bypass the ORM, so drop cached identities explicitly
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        total += folded
+        if folded < batch_size:
+            return total
+
+
+def _compactor_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                folded = compact()
+                if folded:
+                    logger.info('Compacted %d points events', folded)
+            except Exception:
+                logger.exception('Points compaction failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def start_compactor(app):
+    """Run compact() every POINTS_COMPACTION_INTERVAL seconds in a daemon thread"""
+    interval = app.config.get('POINTS_COMPACTION_INTERVAL', 30)
+    if not interval or app.extensions.get('points_compactor'):
+        return None
+    thread = threading.Thread(target=_compactor_loop, args=(app, interval), name='points-compactor', daemon=True)
+    app.extensions['points_compactor'] = thread
+    thread.start()
+    return thread
+
+
+@click.command('compact-points')
+def compact_points_command():
+    """Fold pending points events into user totals."""
+    click.echo(f'Compacted {compact(grace_seconds=0)} event(s)')
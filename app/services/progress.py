@@ -0,0 +1,157 @@
+# Batched topic progress ingestion
+#
+# Topic pages report progress as a stream of small events (heartbeats with a
+# few minutes of reading time, scroll-to-bottom completions).  apply_progress()
+# coalesces a batch per topic and writes it with one INSERT ... ON CONFLICT
+# upsert on (user_id, topic_id), plus one guarded UPDATE for completions, so a
+# batch costs the same handful of statements whether it covers one topic or
+# fifty.  Completion rewards (points, badges) are granted only for rows the
+# guarded UPDATE actually flipped, so a topic is never rewarded twice.
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models.models import db, Topic, UserProgress
+from app.services.badges import record_event
+from app.services.points import award_points
+
+TOPIC_COMPLETION_POINTS = 10
+MAX_BATCH_EVENTS = 500
+
+TopicProgress = namedtuple('TopicProgress', ['topic_id', 'progress_percentage', 'time_spent', 'completed'])
+ProgressResult = namedtuple('ProgressResult', ['topic_ids', 'completed_topic_ids', 'points_awarded', 'badges_awarded'])
+
+
+def _as_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def coalesce_events(events):
+    """Merge raw event dicts into one TopicProgress per topic.
+
+    Percentages take the maximum, time spent (minutes) is summed and a topic
+    is completed if any event completed it.  Events without a usable topic id
+    are dropped.
+    """
+    merged = {}
+    for event in events[:MAX_BATCH_EVENTS]:
+        if not isinstance(event, dict):
+            continue
+        topic_id = _as_int(event.get('topic_id'), None)
+        if not topic_id:
+            continue
+        percentage = min(max(_as_int(event.get('progress_percentage')), 0), 100)
+        time_spent = max(_as_int(event.get('time_spent')), 0)
+        completed = bool(event.get('completed'))
+
+        current = merged.get(topic_id)
+        if current:
+            percentage = max(percentage, current.progress_percentage)
+            time_spent += current.time_spent
+            completed = completed or current.completed
+        merged[topic_id] = TopicProgress(topic_id, percentage, time_spent, completed)
+    return list(merged.values())
+
+
+def _upsert_statement(dialect_name, rows):
+    insert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(dialect_name)
+    if insert is None:
+        return None
+    greatest = db.func.max if dialect_name == 'sqlite' else db.func.greatest
+
+    stmt = insert(UserProgress.__table__).values(rows)
+    table = UserProgress.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.topic_id],
+        set_={
+            'progress_percentage': greatest(db.func.coalesce(table.c.progress_percentage, 0),
+                                            stmt.excluded.progress_percentage),
+            'time_spent': db.func.coalesce(table.c.time_spent, 0) + stmt.excluded.time_spent,
+            'last_accessed': stmt.excluded.last_accessed,
+        }
+    )
+
+
+def _upsert_fallback(user_id, updates, now):
+    # Databases without ON CONFLICT: one SELECT for existing rows, then ORM writes
+    existing = {p.topic_id: p for p in UserProgress.query.filter(
+        UserProgress.user_id == user_id,
+        UserProgress.topic_id.in_([u.topic_id for u in updates])
+    )}
+    for update in updates:
+        progress = existing.get(update.topic_id)
+        if progress is None:
+            db.session.add(UserProgress(user_id=user_id, topic_id=update.topic_id,
+                                        progress_percentage=update.progress_percentage,
+                                        time_spent=update.time_spent, last_accessed=now))
+        else:
+            progress.progress_percentage = max(progress.progress_percentage or 0, update.progress_percentage)
+            progress.time_spent = (progress.time_spent or 0) + update.time_spent
+            progress.last_accessed = now
+    db.session.flush()
+
+
+def _mark_completed(user_id, topic_ids, now):
+    """Flip completed on the given topics and return the ids that weren't completed before"""
+    table = UserProgress.__table__
+    stmt = table.update().where(
+        table.c.user_id == user_id,
+        table.c.topic_id.in_(topic_ids),
+        db.or_(table.c.completed == False, table.c.completed.is_(None))
+    ).values(completed=True, completed_at=now, progress_percentage=100)
+
+    if db.session.get_bind().dialect.update_returning:
+        return {row[0] for row in db.session.execute(stmt.returning(table.c.topic_id))}
+
+    pending = {row[0] for row in db.session.execute(
+        db.select(table.c.topic_id).where(stmt.whereclause)
+    )}
+    db.session.execute(stmt)
+    return pending
+
+
+def apply_progress(user_id, updates):
+    """Write coalesced TopicProgress updates for ``user_id``; the caller commits.
+
+    Unknown topic ids are skipped.  Returns a ProgressResult.
+    """
+    if not updates:
+        return ProgressResult([], [], 0, [])
+
+    known = {row[0] for row in db.session.query(Topic.id).filter(Topic.id.in_([u.topic_id for u in updates]))}
+    updates = [u for u in updates if u.topic_id in known]
+    if not updates:
+        return ProgressResult([], [], 0, [])
+
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'topic_id': u.topic_id, 'progress_percentage': u.progress_percentage,
+             'time_spent': u.time_spent, 'completed': False, 'last_accessed': now} for u in updates]
+    stmt = _upsert_statement(db.session.get_bind().dialect.name, rows)
+    if stmt is not None:
+        db.session.execute(stmt)
+    else:
+        _upsert_fallback(user_id, updates, now)
+
+    completed_ids = []
+    completing = [u.topic_id for u in updates if u.completed]
+    if completing:
+        completed_ids = sorted(_mark_completed(user_id, completing, now))
+
+    # Core statements bypass the identity map; don't serve stale rows afterwards
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, UserProgress):
+            db.session.expire(obj)
+
+    badges_awarded = []
+    points_awarded = 0
+    if completed_ids:
+        for topic_id in completed_ids:
+            award_points(user_id, TOPIC_COMPLETION_POINTS, 'topic_completed', topic_id)
+        points_awarded = TOPIC_COMPLETION_POINTS * len(completed_ids)
+        badges_awarded = record_event(user_id, topics_completed=len(completed_ids), points=points_awarded)
+
+    return ProgressResult([u.topic_id for u in updates], completed_ids, points_awarded, badges_awarded)
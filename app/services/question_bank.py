@@ -0,0 +1,439 @@
+# Bulk quiz question import and export (CSV, JSONL, GIFT)
+#
+# Files are parsed as a stream - one CSV row, JSON line or GIFT block at a
+# time - and each record is validated into a plain row dict.  Valid rows are
+# deduplicated by a hash of (quiz, normalised question text), against the file
+# itself and against questions already in the quiz, then written with Core
+# executemany INSERTs of IMPORT_CHUNK rows.  Memory stays bounded by the chunk
+# plus 16 bytes per question hash.  A dry run does everything except the
+# inserts and returns the same ImportReport, including the rejected lines.
+#
+# Record fields: quiz_id (optional when a default quiz is given),
+# question_text, question_type, options (JSON list/object, or "a|b|c" in
+# CSV), correct_answer, explanation, points.  GIFT supports the usual
+# multiple choice (=right ~wrong), multi-select (~%50%a), true/false ({T}),
+# short answer ({=a}) and numeric ({#12.5:0.1}) forms.
+import csv
+import hashlib
+import io
+import json
+import re
+from collections import namedtuple
+
+import click
+
+from app.models.models import db, Quiz, QuizQuestion
+from app.services.grading import (CHOICE, MULTI, MULTI_TYPES, NUMERIC, NUMERIC_TYPES, compile_question,
+                                  invalidate_answer_key, normalize)
+
+IMPORT_CHUNK = 1000
+EXPORT_CHUNK = 1000
+MAX_REPORTED_REJECTS = 1000
+FORMATS = ('csv', 'jsonl', 'gift')
+QUESTION_TYPES = {'multiple_choice', 'true_false', 'short_answer'} | MULTI_TYPES | NUMERIC_TYPES
+CSV_FIELDS = ['quiz_id', 'question_text', 'question_type', 'options', 'correct_answer', 'explanation', 'points']
+
+Reject = namedtuple('Reject', ['line', 'reason'])
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+class ImportReport:
+    """Outcome of an import; ``rejects`` holds the first MAX_REPORTED_REJECTS problems"""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.total = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejects = []
+        self.quiz_ids = set()
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append(Reject(line, reason))
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'total': self.total,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'rejects': [{'line': reject.line, 'reason': reject.reason} for reject in self.rejects]
+        }
+
+
+def detect_format(filename):
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension in ('gift', 'txt'):
+        return 'gift'
+    return 'csv'
+
+
+# ---- parsing: each reader yields (line number, record dict or error string)
+
+def _read_csv(stream):
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _read_jsonl(stream):
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, 'invalid JSON'
+            continue
+        yield line_no, record if isinstance(record, dict) else 'expected a JSON object'
+
+
+_GIFT_SPECIAL = re.compile(r'\\([~=#{}:])')
+_GIFT_ANSWER = re.compile(r'(?<!\\)([=~])')
+_GIFT_WEIGHT = re.compile(r'^%(-?\d+(?:\.\d+)?)%')
+
+
+def _gift_unescape(text):
+    return _GIFT_SPECIAL.sub(r'\1', text).strip()
+
+
+def _unescaped_index(text, char, start=0):
+    index = text.find(char, start)
+    while index > 0 and text[index - 1] == '\\':
+        index = text.find(char, index + 1)
+    return index
+
+
+def _parse_gift(block):
+    """One GIFT question block as a record dict, or an error string"""
+    text = block.strip()
+    if text.startswith('::'):
+        end = text.find('::', 2)
+        if end == -1:
+            return 'unterminated title'
+        text = text[end + 2:]
+
+    open_at = _unescaped_index(text, '{')
+    close_at = _unescaped_index(text, '}', open_at + 1) if open_at != -1 else -1
+    if open_at == -1 or close_at == -1:
+        return 'missing answer block'
+    before, body, after = text[:open_at], text[open_at + 1:close_at].strip(), text[close_at + 1:]
+    if before.lstrip().startswith('[') and ']' in before:
+        before = before[before.index(']') + 1:]  # [html]/[markdown] text format marker
+    question_text = _gift_unescape(before + (' _____ ' + after if after.strip() else ''))
+
+    if body.upper() in ('T', 'TRUE', 'F', 'FALSE'):
+        return {'question_text': question_text, 'question_type': 'true_false',
+                'correct_answer': 'true' if body.upper().startswith('T') else 'false'}
+
+    if body.startswith('#'):
+        value = body[1:].lstrip('=')
+        feedback_at = _unescaped_index(value, '#')
+        value = _gift_unescape(value[:feedback_at] if feedback_at != -1 else value)
+        if '..' in value:
+            low, _, high = value.partition('..')
+            try:
+                low, high = float(low), float(high)
+            except ValueError:
+                return 'invalid numeric range'
+            value = f'{(low + high) / 2:g} +/- {(high - low) / 2:g}'
+        elif ':' in value:
+            number, _, tolerance = value.partition(':')
+            value = f'{number.strip()} +/- {tolerance.strip()}'
+        return {'question_text': question_text, 'question_type': 'numeric', 'correct_answer': value}
+
+    answers = []
+    parts = _GIFT_ANSWER.split(body)
+    for marker, answer in zip(parts[1::2], parts[2::2]):
+        feedback_at = _unescaped_index(answer, '#')
+        if feedback_at != -1:
+            answer = answer[:feedback_at]
+        weight = None
+        match = _GIFT_WEIGHT.match(answer.strip())
+        if match:
+            weight = float(match.group(1))
+            answer = answer.strip()[match.end():]
+        answers.append((marker, weight, _gift_unescape(answer)))
+    if not answers:
+        return 'empty answer block'
+
+    options = [answer for marker, _, answer in answers]
+    if all(marker == '=' for marker, _, _ in answers):
+        return {'question_text': question_text, 'question_type': 'short_answer', 'correct_answer': options[0]}
+    weighted = [answer for marker, weight, answer in answers if weight is not None and weight > 0]
+    if len(weighted) > 1:
+        return {'question_text': question_text, 'question_type': 'multiple_select', 'options': options,
+                'correct_answer': weighted}
+    correct = [answer for marker, weight, answer in answers if marker == '=' or (weight or 0) >= 100]
+    if not correct:
+        return 'no correct answer'
+    return {'question_text': question_text, 'question_type': 'multiple_choice', 'options': options,
+            'correct_answer': correct[0]}
+
+
+def _read_gift(stream):
+    block, start = [], None
+    for line_no, line in enumerate(stream, start=1):
+        stripped = line.strip()
+        if stripped.startswith('//') or stripped.startswith('$CATEGORY'):
+            continue
+        if not stripped:
+            if block:
+                yield start, _parse_gift('\n'.join(block))
+                block = []
+            continue
+        if not block:
+            start = line_no
+        block.append(line.rstrip('\n'))
+    if block:
+        yield start, _parse_gift('\n'.join(block))
+
+
+READERS = {'csv': _read_csv, 'jsonl': _read_jsonl, 'gift': _read_gift}
+
+
+# ---- validation
+
+def _options_json(options):
+    if options is None or options == '':
+        return None
+    if isinstance(options, str):
+        stripped = options.strip()
+        if stripped.startswith('[') or stripped.startswith('{'):
+            try:
+                options = json.loads(stripped)
+            except ValueError:
+                raise InvalidRecord('options is not valid JSON')
+        else:
+            options = [part.strip() for part in stripped.split('|') if part.strip()]
+    if not isinstance(options, (list, dict)):
+        raise InvalidRecord('options must be a list or an object')
+    return json.dumps(options)
+
+
+def validate_record(record, default_quiz_id=None):
+    """A QuizQuestion row dict from a parsed record; raises InvalidRecord with the reason"""
+    quiz_id = record.get('quiz_id') or default_quiz_id
+    try:
+        quiz_id = int(quiz_id)
+    except (TypeError, ValueError):
+        raise InvalidRecord('quiz_id is missing or not a number')
+
+    question_text = str(record.get('question_text') or '').strip()
+    if not question_text:
+        raise InvalidRecord('question_text is required')
+    question_type = str(record.get('question_type') or 'multiple_choice').strip().lower()
+    if question_type not in QUESTION_TYPES:
+        raise InvalidRecord(f'unknown question_type {question_type!r}')
+
+    correct_answer = record.get('correct_answer')
+    if isinstance(correct_answer, (list, dict)):
+        correct_answer = json.dumps(correct_answer)
+    correct_answer = str(correct_answer if correct_answer is not None else '').strip()
+    if not correct_answer:
+        raise InvalidRecord('correct_answer is required')
+
+    points = record.get('points')
+    try:
+        points = int(points) if points not in (None, '') else 1
+    except (TypeError, ValueError):
+        raise InvalidRecord('points must be a whole number')
+    if points < 0:
+        raise InvalidRecord('points must not be negative')
+
+    options = _options_json(record.get('options'))
+    compiled = compile_question(None, question_type, options, correct_answer, points)
+    if question_type in NUMERIC_TYPES and compiled.kind != NUMERIC:
+        raise InvalidRecord('correct_answer is not a number')
+    if options and compiled.labels:
+        choices = set(compiled.labels.values())
+        expected = compiled.expected if compiled.kind in (CHOICE, MULTI) else ()
+        missing = [answer for answer in expected if answer not in choices]
+        if missing and question_type != 'true_false':
+            raise InvalidRecord('correct_answer is not one of the options')
+
+    return {'quiz_id': quiz_id, 'question_text': question_text, 'question_type': question_type,
+            'options': options, 'correct_answer': correct_answer,
+            'explanation': str(record.get('explanation') or '').strip() or None, 'points': points}
+
+
+def question_hash(quiz_id, question_text):
+    return hashlib.blake2b(f'{quiz_id}\x00{normalize(question_text)}'.encode(), digest_size=16).digest()
+
+
+class _QuizState:
+    """Per-quiz hashes of existing questions and the next order_index"""
+
+    def __init__(self):
+        self._quizzes = {}
+
+    def get(self, quiz_id):
+        if quiz_id not in self._quizzes:
+            if db.session.get(Quiz, quiz_id) is None:
+                self._quizzes[quiz_id] = None
+            else:
+                hashes, next_index = set(), 0
+                rows = db.session.query(QuizQuestion.question_text, QuizQuestion.order_index)\
+                    .filter(QuizQuestion.quiz_id == quiz_id).yield_per(EXPORT_CHUNK)
+                for question_text, order_index in rows:
+                    hashes.add(question_hash(quiz_id, question_text))
+                    next_index = max(next_index, (order_index or 0) + 1)
+                self._quizzes[quiz_id] = [hashes, next_index]
+        return self._quizzes[quiz_id]
+
+
+def import_questions(stream, fmt, default_quiz_id=None, dry_run=False):
+    """Import questions from a text stream; commits unless ``dry_run``.  Returns an ImportReport."""
+    if fmt not in READERS:
+        raise ValueError(f'unsupported format {fmt!r}')
+    report = ImportReport(dry_run)
+    quizzes = _QuizState()
+    table = QuizQuestion.__table__
+    chunk = []
+
+    def write(rows):
+        if rows and not dry_run:
+            db.session.execute(table.insert(), rows)
+        report.inserted += len(rows)
+
+    try:
+        for line_no, record in READERS[fmt](stream):
+            report.total += 1
+            if isinstance(record, str):
+                report.reject(line_no, record)
+                continue
+            try:
+                row = validate_record(record, default_quiz_id)
+            except InvalidRecord as e:
+                report.reject(line_no, str(e))
+                continue
+
+            state = quizzes.get(row['quiz_id'])
+            if state is None:
+                report.reject(line_no, f"quiz {row['quiz_id']} does not exist")
+                continue
+            digest = question_hash(row['quiz_id'], row['question_text'])
+            if digest in state[0]:
+                report.duplicates += 1
+                continue
+            state[0].add(digest)
+            row['order_index'] = state[1]
+            state[1] += 1
+            report.quiz_ids.add(row['quiz_id'])
+
+            chunk.append(row)
+            if len(chunk) >= IMPORT_CHUNK:
+                write(chunk)
+                chunk = []
+        write(chunk)
+        if not dry_run:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not dry_run:
+        # Core inserts skip the session hooks that normally drop answer keys
+        for quiz_id in report.quiz_ids:
+            invalidate_answer_key(quiz_id)
+    return report
+
+
+# ---- export
+
+def _gift_escape(text):
+    return re.sub(r'([~=#{}:])', r'\\\1', str(text or ''))
+
+
+def _option_texts(options):
+    try:
+        parsed = json.loads(options) if options else None
+    except ValueError:
+        return []
+    if isinstance(parsed, dict):
+        parsed = list(parsed.values())
+    return [str(text) for text in parsed if not isinstance(text, (dict, list))] if isinstance(parsed, list) else []
+
+
+def _gift_line(row):
+    compiled = compile_question(row.id, row.question_type, row.options, row.correct_answer, row.points)
+    options = _option_texts(row.options) if compiled.kind != NUMERIC else []
+    if compiled.kind == NUMERIC:
+        body = f'#{compiled.expected:g}' + (f':{compiled.tolerance:g}' if compiled.tolerance > 1e-6 else '')
+    elif (row.question_type or '') == 'true_false':
+        body = 'T' if 'true' in compiled.expected else 'F'
+    elif compiled.kind == MULTI:
+        right = sum(1 for option in options if normalize(option) in compiled.expected)
+        weight = f'{100 / right:g}' if right else '0'
+        # Options keep their order so labels (a, b, c...) in the key still point at the same text
+        body = ' '.join(f'~%{weight if normalize(option) in compiled.expected else -100}%{_gift_escape(option)}'
+                        for option in options)
+    elif options:
+        body = ' '.join(('=' if normalize(option) in compiled.expected else '~') + _gift_escape(option)
+                        for option in options)
+    else:
+        body = '=' + _gift_escape(row.correct_answer)
+    return f'::Q{row.id}:: {_gift_escape(row.question_text)} {{{body}}}\n\n'
+
+
+def export_questions(fmt, quiz_id=None):
+    """Yield the question bank (one quiz, or all) as chunks of CSV, JSONL or GIFT text"""
+    if fmt not in FORMATS:
+        raise ValueError(f'unsupported format {fmt!r}')
+    query = db.session.query(QuizQuestion.id, QuizQuestion.quiz_id, QuizQuestion.question_text,
+                             QuizQuestion.question_type, QuizQuestion.options, QuizQuestion.correct_answer,
+                             QuizQuestion.explanation, QuizQuestion.points)
+    if quiz_id is not None:
+        query = query.filter(QuizQuestion.quiz_id == quiz_id)
+    rows = query.order_by(QuizQuestion.quiz_id, QuizQuestion.order_index, QuizQuestion.id).yield_per(EXPORT_CHUNK)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(CSV_FIELDS)
+
+    for count, row in enumerate(rows, start=1):
+        if fmt == 'csv':
+            writer.writerow([row.quiz_id, row.question_text, row.question_type or 'multiple_choice', row.options or '',
+                             row.correct_answer, row.explanation or '', row.points if row.points is not None else 1])
+        elif fmt == 'jsonl':
+            try:
+                options = json.loads(row.options) if row.options else None
+            except ValueError:
+                options = row.options
+            buffer.write(json.dumps({'quiz_id': row.quiz_id, 'question_text': row.question_text,
+                                     'question_type': row.question_type, 'options': options,
+                                     'correct_answer': row.correct_answer, 'explanation': row.explanation,
+                                     'points': row.points}) + '\n')
+        else:
+            buffer.write(_gift_line(row))
+        if count % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@click.command('import-questions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--quiz-id', type=int, default=None, help='Quiz for records without a quiz_id.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='Defaults to the file extension.')
+@click.option('--dry-run', is_flag=True, help='Validate and report without inserting.')
+def import_questions_command(path, quiz_id, fmt, dry_run):
+    """Import a CSV, JSONL or GIFT question bank."""
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        report = import_questions(stream, fmt or detect_format(path), quiz_id, dry_run)
+    click.echo(f'{report.total} record(s): {report.inserted} {"to insert" if dry_run else "inserted"}, '
+               f'{report.duplicates} duplicate(s), {report.rejected} rejected')
+    for reject in report.rejects:
+        click.echo(f'  line {reject.line}: {reject.reason}')
@@ -0,0 +1,280 @@
+# Timed quiz sessions: answer autosave and deadline enforcement
+#
+# start_quiz stamps QuizAttempt.expires_at from Quiz.time_limit.  While an
+# attempt is open the browser autosaves its full answer set every few
+# seconds; autosave() only replaces the attempt's entry in an in-process
+# buffer (ownership and deadline are checked against cached attempt metadata,
+# so an autosave costs no query), and a background thread writes the buffer
+# every QUIZ_AUTOSAVE_FLUSH_INTERVAL seconds with one executemany UPDATE.
+#
+# A second thread sweeps the (completed, expires_at) index every
+# QUIZ_EXPIRY_SWEEP_INTERVAL seconds for attempts past their deadline plus
+# QUIZ_DEADLINE_GRACE_SECONDS and submits them in batches with their last
+# saved answers: one guarded UPDATE claims the batch, one executemany UPDATE
+# stores the scores, and passes are rewarded as if submitted by hand.  Manual
+# submits claim their attempt with the same guarded UPDATE, so whichever of
+# the two gets there first completes the attempt and grants the rewards.
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam
+
+from app.models.models import db, Quiz, QuizAttempt
+from app.services.badges import record_event
+from app.services.grading import decode_answers, get_answer_key, grade
+from app.services.points import award_points
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH = 200
+QUIZ_PASS_POINTS = 20
+
+AttemptMeta = namedtuple('AttemptMeta', ['attempt_id', 'user_id', 'quiz_id', 'expires_at', 'completed', 'mode'])
+
+_lock = threading.Lock()
+_buffer = {}  # attempt id -> latest autosaved answers
+_meta_cache = TTLCache(ttl=3600, maxsize=10000)
+
+
+def deadline_for(started_at, time_limit):
+    """When an attempt started at ``started_at`` must be submitted, or None if untimed"""
+    return started_at + timedelta(minutes=time_limit) if time_limit else None
+
+
+def grace_period():
+    seconds = current_app.config.get('QUIZ_DEADLINE_GRACE_SECONDS', 30) if has_app_context() else 30
+    return timedelta(seconds=seconds)
+
+
+def attempt_meta(attempt_id):
+    """Cached AttemptMeta for an attempt, or None if it doesn't exist"""
+    meta = _meta_cache.get(attempt_id)
+    if meta is None:
+        row = db.session.query(QuizAttempt.id, QuizAttempt.user_id, QuizAttempt.quiz_id, QuizAttempt.expires_at,
+                               QuizAttempt.completed, QuizAttempt.mode).filter(QuizAttempt.id == attempt_id).first()
+        if row is None:
+            return None
+        meta = AttemptMeta(row.id, row.user_id, row.quiz_id, row.expires_at, bool(row.completed), row.mode)
+        _meta_cache.set(attempt_id, meta)
+    return meta
+
+
+def is_expired(expires_at, now=None):
+    """True once the deadline plus the grace period has passed"""
+    return expires_at is not None and (now or datetime.utcnow()) > expires_at + grace_period()
+
+
+def seconds_left(expires_at, now=None):
+    if expires_at is None:
+        return None
+    return max(int((expires_at - (now or datetime.utcnow())).total_seconds()), 0)
+
+
+def autosave(attempt_id, answers):
+    with _lock:
+        _buffer[attempt_id] = dict(answers)
+
+
+def saved_answers(attempt_id, stored):
+    """The latest answers for an attempt: buffered autosave, else the stored JSON"""
+    with _lock:
+        buffered = _buffer.get(attempt_id)
+    return dict(buffered) if buffered is not None else decode_answers(stored)
+
+
+def forget(attempt_id):
+    """Drop buffered answers and cached metadata once an attempt is completed"""
+    with _lock:
+        _buffer.pop(attempt_id, None)
+    _meta_cache.delete(attempt_id)
+
+
+def _take_buffer(attempt_ids=None):
+    global _buffer
+    with _lock:
+        if attempt_ids is None:
+            taken, _buffer = _buffer, {}
+        else:
+            taken = {attempt_id: _buffer.pop(attempt_id) for attempt_id in attempt_ids if attempt_id in _buffer}
+    return taken
+
+
+def _restore(entries):
+    # Put entries back after a failed flush unless a newer autosave arrived
+    with _lock:
+        for attempt_id, answers in entries.items():
+            _buffer.setdefault(attempt_id, answers)
+
+
+def flush():
+    """Write buffered autosaves of open attempts; returns how many attempts were written"""
+    entries = _take_buffer()
+    if not entries:
+        return 0
+
+    attempts = QuizAttempt.__table__
+    try:
+        db.session.execute(
+            attempts.update()
+            .where(attempts.c.id == bindparam('attempt_id'), attempts.c.completed == False)
+            .values(answers=bindparam('saved_answers')),
+            [{'attempt_id': attempt_id, 'saved_answers': json.dumps(answers)}
+             for attempt_id, answers in entries.items()]
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _restore(entries)
+        raise
+    return len(entries)
+
+
+def claim_attempts(attempt_ids):
+    """Mark open attempts completed and return the ids this call flipped"""
+    attempts = QuizAttempt.__table__
+    stmt = attempts.update().where(attempts.c.id.in_(attempt_ids), attempts.c.completed == False)\
+        .values(completed=True)
+
+    if db.session.get_bind().dialect.update_returning:
+        return {row[0] for row in db.session.execute(stmt.returning(attempts.c.id))}
+
+    pending = {row[0] for row in db.session.execute(db.select(attempts.c.id).where(stmt.whereclause))}
+    db.session.execute(stmt)
+    return pending
+
+
+def _submit_expired_batch(now, batch_size):
+    cutoff = now - grace_period()
+    rows = db.session.query(QuizAttempt.id, QuizAttempt.user_id, QuizAttempt.quiz_id, QuizAttempt.answers,
+                            QuizAttempt.started_at, QuizAttempt.expires_at)\
+        .filter(QuizAttempt.completed == False, QuizAttempt.expires_at.isnot(None),
+                QuizAttempt.expires_at <= cutoff)\
+        .order_by(QuizAttempt.expires_at).limit(batch_size).all()
+    if not rows:
+        return 0, 0
+
+    claimed = claim_attempts([row.id for row in rows])
+    buffered = _take_buffer(claimed)
+    rows = [row for row in rows if row.id in claimed]
+    if not rows:
+        db.session.commit()
+        return 0, len(claimed)
+
+    quiz_ids = {row.quiz_id for row in rows}
+    passing = dict(db.session.query(Quiz.id, Quiz.passing_score).filter(Quiz.id.in_(quiz_ids)))
+    # Users who had already passed one of these quizzes before this batch
+    earlier_passes = db.session.query(QuizAttempt.user_id, QuizAttempt.quiz_id)\
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)\
+        .filter(QuizAttempt.quiz_id.in_(quiz_ids),
+                QuizAttempt.user_id.in_({row.user_id for row in rows}),
+                QuizAttempt.completed == True,
+                QuizAttempt.score >= Quiz.passing_score,
+                QuizAttempt.id.notin_(claimed)).distinct()
+    passed_before = {tuple(pair) for pair in earlier_passes}
+
+    updates, passes = [], []
+    for row in rows:
+        answers = buffered[row.id] if row.id in buffered else decode_answers(row.answers)
+        score = grade(get_answer_key(row.quiz_id), answers).score
+        updates.append({'attempt_id': row.id, 'saved_answers': json.dumps(answers), 'new_score': score,
+                        'finished_at': row.expires_at,
+                        'minutes': max(int((row.expires_at - row.started_at).total_seconds() / 60), 0)})
+        if score >= (passing.get(row.quiz_id) or 70):
+            passes.append(row)
+
+    attempts = QuizAttempt.__table__
+    db.session.execute(
+        attempts.update().where(attempts.c.id == bindparam('attempt_id')).values(
+            answers=bindparam('saved_answers'), score=bindparam('new_score'),
+            completed_at=bindparam('finished_at'), time_taken=bindparam('minutes')
+        ),
+        updates
+    )
+
+    # Scores are stored first so badge counters backfilled here already see these passes
+    for row in passes:
+        award_points(row.user_id, QUIZ_PASS_POINTS, 'quiz_passed', row.quiz_id)
+        first_pass = (row.user_id, row.quiz_id) not in passed_before
+        passed_before.add((row.user_id, row.quiz_id))
+        record_event(row.user_id, quizzes_passed=1 if first_pass else 0, points=QUIZ_PASS_POINTS)
+    db.session.commit()
+    for row in rows:
+        _meta_cache.delete(row.id)
+    return len(rows), len(claimed)
+
+
+def submit_expired(now=None, batch_size=SWEEP_BATCH):
+    """Auto-submit every attempt past its deadline and grace period; returns how many were submitted"""
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        submitted, claimed = _submit_expired_batch(now, batch_size)
+        total += submitted
+        if not claimed:
+            return total
+
+
+def _flush_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush()
+            except Exception:
+                logger.exception('Quiz autosave flush failed')
+            finally:
+                db.session.remove()
+
+
+def _sweep_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                submitted = submit_expired()
+                if submitted:
+                    logger.info('Auto-submitted %d expired quiz attempts', submitted)
+            except Exception:
+                logger.exception('Quiz expiry sweep failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def _flush_at_exit(app):
+    with app.app_context():
+        try:
+            flush()
+        except Exception:
+            logger.exception('Quiz autosave flush at exit failed')
+
+
+def start_session_workers(app):
+    """Flush autosaves and sweep expired attempts in daemon threads"""
+    if app.extensions.get('quiz_session_workers'):
+        return
+    app.extensions['quiz_session_workers'] = True
+    atexit.register(_flush_at_exit, app)
+
+    flush_interval = app.config.get('QUIZ_AUTOSAVE_FLUSH_INTERVAL', 5)
+    if flush_interval:
+        threading.Thread(target=_flush_loop, args=(app, flush_interval), name='quiz-autosave-flusher',
+                         daemon=True).start()
+    sweep_interval = app.config.get('QUIZ_EXPIRY_SWEEP_INTERVAL', 30)
+    if sweep_interval:
+        threading.Thread(target=_sweep_loop, args=(app, sweep_interval), name='quiz-expiry-sweeper',
+                         daemon=True).start()
+
+
+@click.command('submit-expired-quizzes')
+def submit_expired_command():
+    """Submit quiz attempts that are past their time limit."""
+    click.echo(f'Submitted {submit_expired()} attempt(s)')
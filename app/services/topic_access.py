@@ -0,0 +1,160 @@
+# Buffered "last accessed" tracking for topic pages
+#
+# Viewing a topic used to get-or-create the UserProgress row and commit
+# last_accessed on every request.  record_access() now only stores the
+# timestamp in an in-process buffer (latest access per user/topic wins); a
+# background thread flushes the buffer every TOPIC_ACCESS_FLUSH_INTERVAL
+# seconds as chunked INSERT ... ON CONFLICT upserts, which also create missing
+# progress rows.  Whatever is still buffered is flushed at interpreter exit.
+# If a batch fails, its rows are retried one at a time so a row the database
+# rejects (e.g. a topic deleted meanwhile) is logged and dropped instead of
+# failing every later flush; other errors put the entries back for next time.
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.models.models import db, UserProgress
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK = 500
+
+_lock = threading.Lock()
+_buffer = {}  # (user_id, topic_id) -> last access (UTC)
+
+
+def record_access(user_id, topic_id, when=None):
+    when = when or datetime.utcnow()
+    key = (user_id, topic_id)
+    with _lock:
+        if _buffer.get(key) is None or _buffer[key] < when:
+            _buffer[key] = when
+
+
+def buffered_access(user_id, topic_id):
+    """The not-yet-flushed access time for this user/topic, if any"""
+    with _lock:
+        return _buffer.get((user_id, topic_id))
+
+
+def _take_buffer():
+    global _buffer
+    with _lock:
+        taken, _buffer = _buffer, {}
+    return taken
+
+
+def _restore(entries):
+    # Put entries back after a failed flush without overwriting newer accesses
+    with _lock:
+        for key, when in entries.items():
+            if _buffer.get(key) is None or _buffer[key] < when:
+                _buffer[key] = when
+
+
+def _upsert(rows):
+    dialect_name = db.session.get_bind().dialect.name
+    insert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(dialect_name)
+    table = UserProgress.__table__
+
+    if insert is None:
+        for row in rows:
+            updated = db.session.execute(
+                table.update().where(table.c.user_id == row['user_id'], table.c.topic_id == row['topic_id'])
+                .values(last_accessed=row['last_accessed'])
+            ).rowcount
+            if not updated:
+                db.session.execute(table.insert().values(**row))
+        return
+
+    greatest = db.func.max if dialect_name == 'sqlite' else db.func.greatest
+    stmt = insert(table).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.topic_id],
+        set_={'last_accessed': greatest(db.func.coalesce(table.c.last_accessed, stmt.excluded.last_accessed),
+                                        stmt.excluded.last_accessed)}
+    ))
+
+
+def flush():
+    """Write buffered accesses; returns how many user/topic pairs were flushed"""
+    entries = _take_buffer()
+    if not entries:
+        return 0
+
+    rows = [{'user_id': user_id, 'topic_id': topic_id, 'last_accessed': when,
+             'progress_percentage': 0, 'time_spent': 0, 'completed': False}
+            for (user_id, topic_id), when in entries.items()]
+    try:
+        for start in range(0, len(rows), FLUSH_CHUNK):
+            _upsert(rows[start:start + FLUSH_CHUNK])
+        db.session.commit()
+    except (IntegrityError, DataError):
+        db.session.rollback()
+        logger.warning('Topic access batch rejected, retrying row by row', exc_info=True)
+        return _flush_rows(rows)
+    except Exception:
+        db.session.rollback()
+        _restore(entries)
+        raise
+    return len(rows)
+
+
+def _flush_rows(rows):
+    """Upsert and commit rows one at a time, dropping the ones the database rejects"""
+    written = 0
+    for position, row in enumerate(rows):
+        try:
+            _upsert([row])
+            db.session.commit()
+            written += 1
+        except (IntegrityError, DataError):
+            db.session.rollback()
+            logger.error('Dropping topic access for user %s, topic %s', row['user_id'], row['topic_id'],
+                         exc_info=True)
+        except Exception:
+            db.session.rollback()
+            _restore({(r['user_id'], r['topic_id']): r['last_accessed'] for r in rows[position:]})
+            raise
+    return written
+
+
+def _flush_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush()
+            except Exception:
+                logger.exception('Topic access flush failed')
+            finally:
+                db.session.remove()
+
+
+def _flush_at_exit(app):
+    with app.app_context():
+        try:
+            flush()
+        except Exception:
+            logger.exception('Topic access flush at exit failed')
+
+
+def start_access_flusher(app):
+    """Flush the access buffer every TOPIC_ACCESS_FLUSH_INTERVAL seconds and at exit"""
+    if app.extensions.get('topic_access_flusher'):
+        return None
+    app.extensions['topic_access_flusher'] = True
+    atexit.register(_flush_at_exit, app)
+
+    interval = app.config.get('TOPIC_ACCESS_FLUSH_INTERVAL', 10)
+    if not interval:
+        return None
+    thread = threading.Thread(target=_flush_loop, args=(app, interval), name='topic-access-flusher', daemon=True)
+    thread.start()
+    return thread
+
@@ -0,0 +1,224 @@
+# Unit registry with dimensional analysis
+#
+# A unit is a scale (and, for temperatures, an offset) relative to the base
+# unit of its dimension.  Dimensions are exponent vectors over the base
+# quantities in BASE_DIMENSIONS, so composite units are parsed rather than
+# listed: "mg/kg/min" is mass^1 mass^-1 time^-1 with scale
+# 1e-6 / 1 / 60, and "mL/h" is volume^1 time^-1.  Division is
+# left-associative ("mg/kg/min" = mg / kg / min); "*" or "." multiplies and
+# "^2" (or a trailing digit, "m2") raises a power.
+#
+# The predefined units are interned once into flat NumPy arrays (scale,
+# offset, dimension) and the conversion factors between all of them form a
+# fixed matrix, so converting between two of them is an index lookup and a
+# batch with mixed units is one gather over the matrix.  Composite
+# expressions are parsed (memoised in a bounded LRU of PARSE_CACHE_SIZE
+# entries) and converted from their own scale, so unit strings from requests
+# never grow the shared matrix.
+import math
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+BASE_DIMENSIONS = ('mass', 'volume', 'time', 'length', 'amount', 'temperature', 'activity')
+
+PARSE_CACHE_SIZE = 256  # parsed composite expressions kept
+MAX_POWER = 4  # largest |exponent| of one factor, e.g. m^4
+
+Unit = namedtuple('Unit', ['symbol', 'scale', 'offset', 'dimension'])
+
+
+class UnitError(ValueError):
+    pass
+
+
+def _dimension(**exponents):
+    return tuple(exponents.get(name, 0) for name in BASE_DIMENSIONS)
+
+
+MASS = _dimension(mass=1)
+VOLUME = _dimension(volume=1)
+TIME = _dimension(time=1)
+LENGTH = _dimension(length=1)
+AMOUNT = _dimension(amount=1)
+TEMPERATURE = _dimension(temperature=1)
+ACTIVITY = _dimension(activity=1)
+DIMENSIONLESS = _dimension()
+
+# symbol -> (scale to the dimension's base unit, offset, dimension, aliases); bases: g, mL, s, m, mol, K, IU
+_ATOMIC = {
+    'kg': (1e3, 0, MASS, ['kilogram', 'kilograms']),
+    'g': (1, 0, MASS, ['gram', 'grams', 'gm']),
+    'mg': (1e-3, 0, MASS, ['milligram', 'milligrams']),
+    'mcg': (1e-6, 0, MASS, ['µg', 'μg', 'ug', 'microgram', 'micrograms']),
+    'ng': (1e-9, 0, MASS, ['nanogram', 'nanograms']),
+    'lb': (453.59237, 0, MASS, ['lbs', 'pound', 'pounds']),
+    'oz': (28.349523125, 0, MASS, ['ounce', 'ounces']),
+    'L': (1e3, 0, VOLUME, ['l', 'liter', 'liters', 'litre', 'litres']),
+    'dL': (100, 0, VOLUME, ['dl']),
+    'mL': (1, 0, VOLUME, ['ml', 'cc', 'cm3']),
+    'mcL': (1e-3, 0, VOLUME, ['µL', 'μL', 'uL', 'ul', 'mcl']),
+    'tsp': (4.92892159375, 0, VOLUME, ['teaspoon', 'teaspoons']),
+    'tbsp': (14.78676478125, 0, VOLUME, ['tablespoon', 'tablespoons']),
+    'fl oz': (29.5735295625, 0, VOLUME, ['floz', 'fl_oz']),
+    's': (1, 0, TIME, ['sec', 'second', 'seconds']),
+    'min': (60, 0, TIME, ['minute', 'minutes']),
+    'h': (3600, 0, TIME, ['hr', 'hour', 'hours']),
+    'day': (86400, 0, TIME, ['d', 'days']),
+    'm': (1, 0, LENGTH, ['meter', 'meters', 'metre', 'metres']),
+    'cm': (1e-2, 0, LENGTH, []),
+    'mm': (1e-3, 0, LENGTH, []),
+    'in': (0.0254, 0, LENGTH, ['inch', 'inches']),
+    'ft': (0.3048, 0, LENGTH, ['foot', 'feet']),
+    'mol': (1, 0, AMOUNT, []),
+    'mmol': (1e-3, 0, AMOUNT, []),
+    'mcmol': (1e-6, 0, AMOUNT, ['µmol', 'μmol', 'umol']),
+    'K': (1, 0, TEMPERATURE, ['kelvin']),
+    '°C': (1, 273.15, TEMPERATURE, ['C', 'degC', 'celsius']),
+    '°F': (5 / 9, 273.15 - 32 * 5 / 9, TEMPERATURE, ['F', 'degF', 'fahrenheit']),
+    'IU': (1, 0, ACTIVITY, ['unit', 'units', 'U']),
+    'mIU': (1e-3, 0, ACTIVITY, ['milliunit', 'milliunits', 'mU']),
+}
+
+_SYMBOLS = {}
+for _symbol, (_scale, _offset, _dim, _aliases) in _ATOMIC.items():
+    for _name in [_symbol] + _aliases:
+        _SYMBOLS[_name] = Unit(_symbol, float(_scale), float(_offset), _dim)
+
+_TOKEN = re.compile(r'\s*([*/.·])?\s*([^\s*/.·^]+(?: oz)?)(?:\^(-?\d+))?\s*')
+_TRAILING_POWER = re.compile(r'^(.*[^\d])(\d)$')
+
+
+def _atomic(name):
+    """``(unit, power)`` for one factor; "m2" is m^2 unless it is a unit of its own"""
+    unit = _SYMBOLS.get(name) or _SYMBOLS.get(name.lower())
+    if unit is not None:
+        return unit, 1
+    match = _TRAILING_POWER.match(name)
+    if match:
+        unit, _ = _atomic(match.group(1))
+        return unit, int(match.group(2))
+    raise UnitError(f'unknown unit {name!r}')
+
+
+def parse_unit(text):
+    """A Unit for a unit expression such as "mg", "mcg/kg/min" or "mL/h" """
+    text = str(text or '').strip()
+    if not text:
+        raise UnitError('unit is required')
+    if text in _SYMBOLS:
+        return _SYMBOLS[text]
+
+    scale, dimension, position = 1.0, [0] * len(BASE_DIMENSIONS), 0
+    parts = []
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise UnitError(f'cannot parse unit {text!r}')
+        operator, name, power = match.groups()
+        if operator is None and parts:
+            raise UnitError(f'cannot parse unit {text!r}')
+        unit, exponent = _atomic(name)
+        exponent *= int(power or 1) * (-1 if operator == '/' else 1)
+        if abs(exponent) > MAX_POWER:
+            raise UnitError(f'unit powers are limited to {MAX_POWER}')
+        if unit.offset and (exponent != 1 or parts or match.end() < len(text)):
+            raise UnitError('temperatures with an offset cannot be combined with other units')
+        scale *= unit.scale ** exponent
+        dimension = [d + exponent * u for d, u in zip(dimension, unit.dimension)]
+        parts.append(name)
+        position = match.end()
+    if not (math.isfinite(scale) and scale > 0):
+        raise UnitError(f'unit {text!r} is out of range')
+    return Unit(text, scale, 0.0, tuple(dimension))
+
+
+def describe(dimension):
+    """Human-readable form of a dimension vector, e.g. "mass/time" """
+    up = [name if power == 1 else f'{name}^{power}' for name, power in zip(BASE_DIMENSIONS, dimension) if power > 0]
+    down = [name if power == -1 else f'{name}^{-power}' for name, power in zip(BASE_DIMENSIONS, dimension) if power < 0]
+    return ('*'.join(up) or '1') + ''.join('/' + name for name in down)
+
+
+_parse_cached = lru_cache(maxsize=PARSE_CACHE_SIZE)(parse_unit)
+
+
+class UnitRegistry:
+    """The predefined units, the conversion matrix between them and conversions of any expression"""
+
+    def __init__(self):
+        self._units = [_SYMBOLS[symbol] for symbol in _ATOMIC]
+        position = {unit.symbol: i for i, unit in enumerate(self._units)}
+        self._index = {name: position[unit.symbol] for name, unit in _SYMBOLS.items()}
+
+        units = self._units
+        scale = np.array([unit.scale for unit in units], dtype=float)
+        offset = np.array([unit.offset for unit in units], dtype=float)
+        dims = np.array([unit.dimension for unit in units], dtype=int)
+        # unit i -> unit j is value * factor[i, j] + shift[i, j] when compatible[i, j]
+        self.factor = scale[:, None] / scale[None, :]
+        self.shift = (offset[:, None] - offset[None, :]) / scale[None, :]
+        self.compatible = (dims[:, None, :] == dims[None, :, :]).all(axis=2)
+
+    def index(self, text):
+        """Row of a predefined unit (or alias) in the conversion matrix, or None"""
+        return self._index.get(str(text or '').strip())
+
+    def unit(self, text):
+        position = self.index(text)
+        return self._units[position] if position is not None else _parse_cached(str(text or '').strip())
+
+    def check(self, source, target):
+        """``(source unit, target unit)``; raises UnitError unless they have the same dimension"""
+        source, target = self.unit(source), self.unit(target)
+        if source.dimension != target.dimension:
+            raise UnitError(f'cannot convert {describe(source.dimension)} to {describe(target.dimension)}')
+        return source, target
+
+    def convert(self, value, source, target):
+        """Convert a number or array from ``source`` to ``target``"""
+        source, target = self.check(source, target)
+        return np.asarray(value, dtype=float) * (source.scale / target.scale) + \
+            (source.offset - target.offset) / target.scale
+
+    def convert_many(self, values, sources, targets):
+        """Element-wise conversion with a unit pair per element.
+
+        Returns ``(converted, ok)``; elements whose units are unknown or whose
+        dimensions don't match are NaN with ``ok`` False.
+        """
+        values = np.asarray(values, dtype=float)
+        i = np.array([self._index.get(str(unit).strip(), -1) for unit in sources], dtype=int)
+        j = np.array([self._index.get(str(unit).strip(), -1) for unit in targets], dtype=int)
+        factor, shift = np.ones(len(values)), np.zeros(len(values))
+        ok = np.zeros(len(values), dtype=bool)
+
+        predefined = (i >= 0) & (j >= 0)
+        factor[predefined] = self.factor[i[predefined], j[predefined]]
+        shift[predefined] = self.shift[i[predefined], j[predefined]]
+        ok[predefined] = self.compatible[i[predefined], j[predefined]]
+
+        # Composite expressions: one parse per distinct pair
+        pairs = {}
+        for k in np.flatnonzero(~predefined):
+            pairs.setdefault((sources[k], targets[k]), []).append(k)
+        for (source, target), rows in pairs.items():
+            try:
+                source, target = self.check(source, target)
+            except UnitError:
+                continue
+            factor[rows] = source.scale / target.scale
+            shift[rows] = (source.offset - target.offset) / target.scale
+            ok[rows] = True
+
+        return np.where(ok, values * factor + shift, np.nan), ok
+
+
+registry = UnitRegistry()
+
+
+def convert(value, source, target):
+    return registry.convert(value, source, target)
+
@@ -0,0 +1,124 @@
+# Cached identity for login_manager.user_loader
+#
+# Flask-Login calls the user loader on every authenticated request, and most
+# requests only need a handful of columns from the user row (id, name, track,
+# admin flag, points, level).  load_cached_user() returns a CachedUser built
+# from a short-lived snapshot of those columns; the full User row is loaded
+# lazily, at most once per request, the first time anything else is touched
+# (relationships, bio, password checks) or an attribute is assigned.
+#
+# Fields that decide access (AUTH_FIELDS), and whether the user still exists,
+# are never taken from the snapshot: every load re-reads them with one
+# primary-key lookup, so a revoked admin flag, a track change or a deleted
+# account made by another process applies on the next request.
+from collections import namedtuple
+from itertools import chain
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from app.models.models import db, User
+from app.utils.cache import TTLCache
+from app.utils.db_routing import RoutingSession
+
+SNAPSHOT_FIELDS = ('id', 'name', 'email', 'track', 'is_admin', 'avatar_url', 'total_points', 'level')
+SNAPSHOT_TTL = 30  # seconds; commits in this process invalidate immediately
+AUTH_FIELDS = ('is_admin', 'track')  # read fresh on every load
+
+UserSnapshot = namedtuple('UserSnapshot', SNAPSHOT_FIELDS)
+
+_snapshot_cache = TTLCache(ttl=SNAPSHOT_TTL, maxsize=20000)
+
+
+class CachedUser(UserMixin):
+    """``current_user`` backed by a cached snapshot, falling back to the User row.
+
+    Snapshot fields are served from the cache until the row has been loaded in
+    this request; after that they read through to the row so values written
+    during the request are visible.  Code that does read-modify-write on a
+    column (points, level) should use :attr:`record` directly so it never
+    starts from a cached value.
+    """
+
+    def __init__(self, snapshot, record=None):
+        object.__setattr__(self, '_snapshot', snapshot)
+        object.__setattr__(self, '_record', record)
+
+    @property
+    def record(self):
+        """The User row for this request, loaded on first use"""
+        if self._record is None:
+            object.__setattr__(self, '_record', db.session.get(User, self._snapshot.id))
+        return self._record
+
+    def __getattr__(self, name):
+        # Only reached for attributes that aren't snapshot fields
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.record, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.record, name, value)
+
+    def __repr__(self):
+        return f'<CachedUser {self._snapshot.id}>'
+
+
+def _snapshot_property(field):
+    def getter(self):
+        if self._record is not None:
+            return getattr(self._record, field)
+        return getattr(self._snapshot, field)
+    return property(getter)
+
+
+for _field in SNAPSHOT_FIELDS:
+    setattr(CachedUser, _field, _snapshot_property(_field))
+
+
+def snapshot_of(user):
+    return UserSnapshot(*(getattr(user, field) for field in SNAPSHOT_FIELDS))
+
+
+def load_cached_user(user_id):
+    """user_loader implementation: a CachedUser, or None if the user doesn't exist"""
+    snapshot = _snapshot_cache.get(user_id)
+    if snapshot is not None:
+        access = db.session.query(*[getattr(User, field) for field in AUTH_FIELDS])\
+            .filter(User.id == user_id).first()
+        if access is None:
+            invalidate_user(user_id)
+            return None
+        return CachedUser(snapshot._replace(**dict(zip(AUTH_FIELDS, access))))
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    snapshot = snapshot_of(user)
+    _snapshot_cache.set(user_id, snapshot)
+    return CachedUser(snapshot, record=user)
+
+
+def invalidate_user(user_id):
+    _snapshot_cache.delete(user_id)
+
+
+# Invalidate snapshots for every User row changed through the ORM once the
+# transaction commits: profile edits, point awards, admin changes alike.
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
@@ -105,17 +105,50 @@ $(document).ready(function() {
     });
     
     // ===== PROGRESS TRACKING =====
+    // Progress events are queued per topic and sent to /user/progress/batch
+    // together: on an interval, when the tab is hidden, and straight away on
+    // completion (so level-ups still show immediately).
+    const PROGRESS_FLUSH_INTERVAL = 60000;
+    let progressQueue = {};
+
     function updateProgress(topicId, progressPercentage, timeSpent, completed = false) {
+        const entry = progressQueue[topicId] || {
+            topic_id: topicId, progress_percentage: 0, time_spent: 0, completed: false
+        };
+        entry.progress_percentage = Math.max(entry.progress_percentage, progressPercentage || 0);
+        entry.time_spent += timeSpent || 0;
+        entry.completed = entry.completed || completed;
+        progressQueue[topicId] = entry;
+
+        if (completed) {
+            flushProgress();
+        }
+    }
+
+    function takeProgressEvents() {
+        const events = Object.values(progressQueue);
+        progressQueue = {};
+        return events;
+    }
+
+    function flushProgress(useBeacon = false) {
+        const events = takeProgressEvents();
+        if (!events.length) {
+            return;
+        }
+        const payload = JSON.stringify({events: events});
+
+        // sendBeacon survives the page being hidden or unloaded
+        if (useBeacon && navigator.sendBeacon &&
+                navigator.sendBeacon('/user/progress/batch', new Blob([payload], {type: 'application/json'}))) {
+            return;
+        }
+
         $.ajax({
-            url: '/user/update-progress',
+            url: '/user/progress/batch',
             method: 'POST',
             contentType: 'application/json',
-            data: JSON.stringify({
-                topic_id: topicId,
-                progress_percentage: progressPercentage,
-                time_spent: timeSpent,
-                completed: completed
-            }),
+            data: payload,
             success: function(response) {
                 if (response.success) {
                     // Update UI elements
@@ -125,38 +158,71 @@ $(document).ready(function() {
                         showLevelUpModal(response.new_level);
                     }
                 }
+            },
+            error: function(xhr) {
+                // Requeue on network/server errors so the next flush retries them
+                if (xhr.status === 0 || xhr.status >= 500) {
+                    events.forEach(function(event) {
+                        updateProgress(event.topic_id, event.progress_percentage, event.time_spent, false);
+                        if (event.completed) {
+                            progressQueue[event.topic_id].completed = true;
+                        }
+                    });
+                }
             }
         });
     }
-    
+
     // Track time spent on topic pages
-    let topicStartTime;
     if ($('body').hasClass('topic-page')) {
-        topicStartTime = Date.now();
-        
-        // Update progress every 30 seconds
-        setInterval(function() {
-            const timeSpent = Math.floor((Date.now() - topicStartTime) / 1000 / 60); // minutes
-            const topicId = $('.topic-container').data('topic-id');
-            if (topicId && timeSpent > 0) {
-                updateProgress(topicId, 0, timeSpent);
+        const topicId = $('.topic-container').data('topic-id');
+        let lastTick = Date.now();
+        let wasVisible = document.visibilityState === 'visible';
+        let unsentSeconds = 0;
+
+        // Queue whole minutes of visible reading time; the server adds them up
+        function recordReadingTime() {
+            const now = Date.now();
+            if (wasVisible) {
+                unsentSeconds += (now - lastTick) / 1000;
+            }
+            lastTick = now;
+            wasVisible = document.visibilityState === 'visible';
+
+            const minutes = Math.floor(unsentSeconds / 60);
+            if (topicId && minutes > 0) {
+                unsentSeconds -= minutes * 60;
+                updateProgress(topicId, 0, minutes);
             }
-        }, 30000);
+        }
+
+        setInterval(recordReadingTime, 30000);
+        document.addEventListener('visibilitychange', recordReadingTime);
         
         // Mark as completed when user scrolls to bottom
         let hasReachedBottom = false;
         $(window).on('scroll', function() {
             if (!hasReachedBottom && $(window).scrollTop() + $(window).height() >= $(document).height() - 100) {
                 hasReachedBottom = true;
-                const timeSpent = Math.floor((Date.now() - topicStartTime) / 1000 / 60);
-                const topicId = $('.topic-container').data('topic-id');
                 if (topicId) {
-                    updateProgress(topicId, 100, timeSpent, true);
+                    recordReadingTime();
+                    updateProgress(topicId, 100, 0, true);
                 }
             }
         });
     }
     
+    // Registered after the reading-time listener so hiding the tab flushes its last minutes
+    setInterval(flushProgress, PROGRESS_FLUSH_INTERVAL);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'hidden') {
+            flushProgress(true);
+        }
+    });
+    window.addEventListener('pagehide', function() {
+        flushProgress(true);
+    });
+    
     // ===== FLASHCARD FUNCTIONALITY =====
     $(document).on('click', '.flashcard', function() {
         $(this).toggleClass('flipped');
@@ -173,18 +239,21 @@ $(document).ready(function() {
     });
     
     // ===== QUIZ FUNCTIONALITY =====
+    // Answers are autosaved (the whole set) every few seconds while they
+    // change, and once more when the page is hidden, so a closed tab or an
+    // expired timer keeps what was answered.
+    const QUIZ_AUTOSAVE_INTERVAL = 5000;
+    let quizAnswersDirty = false;
+    
     $(document).on('click', '.quiz-option', function() {
         const question = $(this).closest('.quiz-question');
         question.find('.quiz-option').removeClass('selected');
         $(this).addClass('selected');
+        quizAnswersDirty = true;
     });
     
-    // Quiz submission
-    $(document).on('click', '.submit-quiz', function() {
-        const quizId = $(this).data('quiz-id');
-        const attemptId = $(this).data('attempt-id');
+    function collectQuizAnswers() {
         const answers = {};
-        
         $('.quiz-question').each(function() {
             const questionId = $(this).data('question-id');
             const selectedOption = $(this).find('.quiz-option.selected');
@@ -192,6 +261,55 @@ $(document).ready(function() {
                 answers[questionId] = selectedOption.data('value');
             }
         });
+        return answers;
+    }
+    
+    function autosaveQuiz(useBeacon = false) {
+        const attemptId = $('.submit-quiz').data('attempt-id');
+        if (!quizAnswersDirty || !attemptId) {
+            return;
+        }
+        quizAnswersDirty = false;
+        const url = `/courses/quiz-attempt/${attemptId}/autosave`;
+        const payload = JSON.stringify({ answers: collectQuizAnswers() });
+        
+        if (useBeacon && navigator.sendBeacon &&
+                navigator.sendBeacon(url, new Blob([payload], {type: 'application/json'}))) {
+            return;
+        }
+        
+        $.ajax({
+            url: url,
+            method: 'POST',
+            contentType: 'application/json',
+            data: payload,
+            error: function(xhr) {
+                // Retry on network/server errors; 4xx means the attempt is closed
+                if (xhr.status === 0 || xhr.status >= 500) {
+                    quizAnswersDirty = true;
+                }
+            }
+        });
+    }
+    
+    if ($('.submit-quiz').length > 0) {
+        setInterval(autosaveQuiz, QUIZ_AUTOSAVE_INTERVAL);
+        document.addEventListener('visibilitychange', function() {
+            if (document.visibilityState === 'hidden') {
+                autosaveQuiz(true);
+            }
+        });
+        window.addEventListener('pagehide', function() {
+            autosaveQuiz(true);
+        });
+    }
+    
+    // Quiz submission
+    $(document).on('click', '.submit-quiz', function() {
+        const quizId = $(this).data('quiz-id');
+        const attemptId = $(this).data('attempt-id');
+        const answers = collectQuizAnswers();
+        quizAnswersDirty = false;
         
         $.ajax({
             url: `/courses/quiz-attempt/${attemptId}/submit`,
@@ -0,0 +1,65 @@
+# Small in-process caches shared by the route helpers
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe dict whose entries expire after ``ttl`` seconds.
+
+    This is deliberately process-local: every gunicorn worker keeps its own
+    copy, which is fine for values that are cheap to rebuild and only need to
+    be roughly fresh (counts, dropdown values, snapshots).
+    """
+
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (expires_at, value)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Return the cached value for ``key``, building it with ``factory()`` on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        # Drop expired entries first, then the entry closest to expiry
+        now = time.monotonic()
+        expired = [k for k, (expires_at, _) in self._data.items() if expires_at < now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.maxsize:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+
+_MISSING = object()
@@ -0,0 +1,84 @@
+# Read/write routing between the primary database and read replicas
+#
+# Replicas are configured as extra Flask-SQLAlchemy binds (see create_app).
+# Writes, flushes and anything that isn't a plain SELECT always go to the
+# primary.  SELECTs go to a replica only when the caller opted in, either for a
+# whole view with @replica_reads or per query with
+# ``.execution_options(replica=True)``, and only while the session hasn't
+# written anything.  Once a transaction writes, the session sticks to the
+# primary for the rest of the request, and the browser session sticks to it for
+# DB_READ_YOUR_WRITES_SECONDS so a redirect-after-POST doesn't read a lagging
+# replica.
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as browser_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+_PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends opted-in reads to replica engines"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replicas = current_app.config.get('SQLALCHEMY_REPLICA_BINDS') or []
+            engines = self._db.engines
+            return engines[random.choice(replicas)]
+
+        if clause is not None and getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if not has_app_context() or not current_app.config.get('SQLALCHEMY_REPLICA_BINDS'):
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        if clause is None or not getattr(clause, 'is_select', False):
+            return False
+
+        opted_in = g.get('db_replica_reads', False) or clause.get_execution_options().get('replica', False)
+        if not opted_in:
+            return False
+
+        now = time.time()
+        if self.info.get('primary_until', 0) > now:
+            return False
+        if has_request_context() and browser_session.get(_PRIMARY_UNTIL_KEY, 0) > now:
+            return False
+        return True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.pop('wrote', False):
+        return
+
+    seconds = current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5) if has_app_context() else 5
+    until = time.time() + seconds
+    session.info['primary_until'] = until
+    if has_request_context() and current_app.config.get('SQLALCHEMY_REPLICA_BINDS'):
+        browser_session[_PRIMARY_UNTIL_KEY] = until
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(session):
+    session.info.pop('wrote', None)
+
+
+def replica_reads(f):
+    """Let SELECTs in this view go to a read replica until the view writes something"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_replica_reads = True
+        return f(*args, **kwargs)
+    return decorated_function
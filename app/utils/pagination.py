@@ -0,0 +1,214 @@
+# Keyset (seek) pagination helpers
+#
+# ``query.paginate()`` runs OFFSET/LIMIT plus a COUNT(*) for every page, so the
+# database has to walk and throw away every row before the requested page.
+# Keyset pagination remembers the (sort key, id) of the boundary row instead and
+# asks for rows strictly after it, which costs the same on page 1 and page 500.
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+from app.models.models import db, Resource, User, user_bookmarks
+from app.utils.cache import TTLCache
+
+# column: ORM attribute to sort on
+# descending: sort direction for the column (the id tiebreaker follows it)
+# null_value: stand-in used for NULLs so rows with a missing key stay reachable
+# id_column: tiebreaker when ``column`` belongs to a joined table rather than
+#            the paged model (whose id it must equal); the sort value is then
+#            selected alongside each row
+SortKey = namedtuple('SortKey', ['column', 'descending', 'null_value', 'id_column'], defaults=[None])
+
+RESOURCE_SORTS = {
+    'created_at': SortKey(Resource.created_at, True, None),
+    'title': SortKey(Resource.title, False, None),
+    'author': SortKey(Resource.author, False, ''),
+    'year': SortKey(Resource.year_published, True, 0),
+    # view_count defaults to 0 and is only ever incremented, so it is sorted
+    # bare to let ix_resource_active_views serve the ORDER BY.
+    'popular': SortKey(Resource.view_count, True, None),
+    # Ratings live in another table; until there is a denormalised average
+    # this sorts like the default, matching the previous behaviour.
+    'rating': SortKey(Resource.created_at, True, None),
+}
+
+USER_SORTS = {
+    'created_at': SortKey(User.created_at, True, None),
+}
+
+# Bookmarked resources, newest bookmark first (ix_user_bookmarks_user_created)
+BOOKMARK_SORTS = {
+    'created_at': SortKey(user_bookmarks.c.created_at, True, None, user_bookmarks.c.resource_id),
+}
+
+_count_cache = TTLCache(ttl=60, maxsize=512)
+
+
+class KeysetPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def to_dict(self, serialize):
+        """JSON-friendly representation; ``serialize`` turns one item into a dict"""
+        return {
+            'items': [serialize(item) for item in self.items],
+            'per_page': self.per_page,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total
+        }
+
+
+def encode_cursor(sort_by, value, row_id):
+    """Encode a (sort key, id) position as an opaque URL-safe token"""
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    elif isinstance(value, date):
+        value = {'d': value.isoformat()}
+    payload = json.dumps([sort_by, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_by):
+    """Decode a cursor token, returning ``(value, id)`` or ``None`` if it is unusable"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if cursor_sort != sort_by or not isinstance(row_id, int):
+            return None
+        if isinstance(value, dict):
+            if 'dt' in value:
+                value = datetime.fromisoformat(value['dt'])
+            elif 'd' in value:
+                value = date.fromisoformat(value['d'])
+            else:
+                return None
+        return value, row_id
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _sort_expression(key):
+    if key.null_value is None:
+        return key.column
+    return db.func.coalesce(key.column, key.null_value)
+
+
+def _row_value(item, key):
+    value = getattr(item, key.column.key)
+    if value is None and key.null_value is not None:
+        return key.null_value
+    return value
+
+
+def _seek_condition(expr, id_column, value, row_id, forward):
+    # "forward" means strictly after the cursor in display order
+    if forward:
+        return db.or_(expr > value, db.and_(expr == value, id_column > row_id))
+    return db.or_(expr < value, db.and_(expr == value, id_column < row_id))
+
+
+def cached_count(query, cache_key, ttl=None):
+    """``query.count()`` memoised for ``ttl`` seconds under ``cache_key``.
+
+    Listing pages only use the total for "about N results", so a count that is
+    up to a minute stale saves a full COUNT(*) on every page turn.
+    """
+    return _count_cache.get_or_set(cache_key, lambda: query.order_by(None).count(), ttl)
+
+
+def _page_query(query, sorts, sort_by, after, before, per_page):
+    if sort_by not in sorts:
+        sort_by = next(iter(sorts))
+    key = sorts[sort_by]
+    joined = key.id_column is not None
+    id_column = key.id_column if joined else key.column.class_.id
+    expr = _sort_expression(key)
+    if joined:
+        query = query.add_columns(expr)
+
+    before_pos = decode_cursor(before, sort_by)
+    after_pos = None if before_pos else decode_cursor(after, sort_by)
+
+    # Walking backwards flips the direction so LIMIT picks the rows just
+    # before the cursor; keyset_paginate reverses them into display order.
+    backwards = before_pos is not None
+    descending = key.descending != backwards
+    if descending:
+        ordered = query.order_by(expr.desc(), id_column.desc())
+    else:
+        ordered = query.order_by(expr.asc(), id_column.asc())
+
+    position = before_pos or after_pos
+    if position is not None:
+        ordered = ordered.filter(_seek_condition(expr, id_column, position[0], position[1], not descending))
+    # one extra row tells whether there is another page
+    return ordered.limit(per_page + 1), sort_by, key, position, backwards
+
+
+def keyset_query(query, sorts, sort_by, after=None, before=None, per_page=12):
+    """The unexecuted page query :func:`keyset_paginate` runs for these arguments"""
+    return _page_query(query, sorts, sort_by, after, before, per_page)[0]
+
+
+def keyset_paginate(query, sorts, sort_by, after=None, before=None, per_page=12, count_key=None):
+    """Return a :class:`KeysetPage` of ``query`` ordered by ``sorts[sort_by]``.
+
+    ``after`` / ``before`` are cursor tokens taken from a previous page's
+    ``next_cursor`` / ``prev_cursor``.  Invalid or stale cursors fall back to
+    the first page, the same way ``paginate(error_out=False)`` did.  Pass
+    ``count_key`` to include a cached total count.
+    """
+    page_query, sort_by, key, position, backwards = _page_query(query, sorts, sort_by, after, before, per_page)
+
+    # (item, sort value) pairs
+    rows = [tuple(row) if key.id_column is not None else (row, _row_value(row, key)) for row in page_query.all()]
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    items = [item for item, _ in rows]
+
+    def cursor_for(row):
+        item, value = row
+        return encode_cursor(sort_by, value, item.id)
+
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, position is not None
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = cursor_for(rows[-1])
+        if has_prev:
+            prev_cursor = cursor_for(rows[0])
+
+    total = cached_count(query, count_key) if count_key is not None else None
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
@@ -0,0 +1,100 @@
+# Query builders for the hot query shapes
+#
+# The routes and services build their hot queries through these functions,
+# and ``flask check-query-plans`` (plus tests/test_query_plans.py) explains
+# the very same functions, so a filter or ordering change in a route is what
+# the plan check sees.  Each builder returns an unexecuted query.
+from app.models.models import (db, Resource, Topic, UserProgress, QuizAttempt, NewsArticle, WordOfTheDay, QuizOfTheDay,
+                               user_bookmarks)
+
+
+def resource_listing(filters):
+    """Active resources matching the library listing filters (type, author, year, q)"""
+    query = Resource.query.filter_by(is_active=True)
+
+    if filters.get('type', 'all') != 'all':
+        query = query.filter(Resource.resource_type == filters['type'])
+
+    if filters.get('author'):
+        query = query.filter(Resource.author.contains(filters['author']))
+
+    if filters.get('year'):
+        try:
+            query = query.filter(Resource.year_published == int(filters['year']))
+        except (TypeError, ValueError):
+            pass  # ignore a malformed year, as the facets do
+
+    if filters.get('q'):
+        query = query.filter(
+            db.or_(
+                Resource.title.contains(filters['q']),
+                Resource.description.contains(filters['q']),
+                Resource.author.contains(filters['q'])
+            )
+        )
+
+    return query
+
+
+def popular_resources(limit):
+    return Resource.query.filter_by(is_active=True).order_by(Resource.view_count.desc()).limit(limit)
+
+
+def topic_resources(topic_id):
+    return Resource.query.filter_by(topic_id=topic_id, is_active=True)
+
+
+def bookmarked_resources(user_id):
+    return Resource.query.join(user_bookmarks, user_bookmarks.c.resource_id == Resource.id)\
+        .filter(user_bookmarks.c.user_id == user_id)
+
+
+def recent_bookmarks(user_id, limit):
+    # resource_id, not Resource.id, so ix_user_bookmarks_user_created covers the ORDER BY
+    return bookmarked_resources(user_id)\
+        .order_by(user_bookmarks.c.created_at.desc(), user_bookmarks.c.resource_id.desc()).limit(limit)
+
+
+def topic_neighbours(topic):
+    """``(prev_id, next_id, Topic)`` rows for the active topics around ``topic`` in its module"""
+    order = (Topic.order_index, Topic.id)
+    window = db.session.query(
+        Topic.id.label('id'),
+        db.func.lag(Topic.id).over(order_by=order).label('prev_id'),
+        db.func.lead(Topic.id).over(order_by=order).label('next_id')
+    ).filter(Topic.module_id == topic.module_id, Topic.is_active == True).subquery()
+
+    return db.session.query(window.c.prev_id, window.c.next_id, Topic)\
+        .outerjoin(Topic, db.or_(Topic.id == window.c.prev_id, Topic.id == window.c.next_id))\
+        .filter(window.c.id == topic.id)
+
+
+def recent_progress(user_id, limit):
+    return UserProgress.query.filter_by(user_id=user_id)\
+        .order_by(UserProgress.last_accessed.desc()).limit(limit)
+
+
+def quiz_attempts(user_id, quiz_ids):
+    """A user's attempts at any of ``quiz_ids``, grouped by quiz and newest first within each"""
+    return QuizAttempt.query.filter(QuizAttempt.user_id == user_id, QuizAttempt.quiz_id.in_(list(quiz_ids)))\
+        .order_by(QuizAttempt.quiz_id.desc(), QuizAttempt.started_at.desc())
+
+
+def published_news(category=None):
+    query = NewsArticle.query.filter_by(is_published=True)
+    if category:
+        query = query.filter_by(category=category)
+    return query.order_by(NewsArticle.published_at.desc())
+
+
+def daily_words(day):
+    # (category, id) is the index order, so no sort step
+    return WordOfTheDay.query.filter_by(date=day).order_by(WordOfTheDay.category, WordOfTheDay.id)
+
+
+def daily_quizzes(day):
+    return QuizOfTheDay.query.filter_by(date=day).order_by(QuizOfTheDay.category, QuizOfTheDay.id)
+
+
+def previous_words(day, limit):
+    return WordOfTheDay.query.filter(WordOfTheDay.date < day).order_by(WordOfTheDay.date.desc()).limit(limit)
@@ -0,0 +1,87 @@
+# EXPLAIN QUERY PLAN checks for the hot query shapes
+#
+# Run ``flask check-query-plans`` against a migrated database;
+# tests/test_query_plans.py runs the same check on a fresh SQLite database.
+# It exits non-zero if any query below is planned as a full table scan or
+# needs a temporary b-tree to sort, which is what happens when a composite
+# index goes missing or a route changes its filter/order shape.  The queries
+# come from the builders in app.utils.queries that the routes call, so they
+# can't drift from what the routes run.
+from datetime import date
+from types import SimpleNamespace
+
+import click
+from sqlalchemy.dialects import sqlite
+
+from app.models.models import db
+from app.utils import queries
+from app.utils.pagination import keyset_query, BOOKMARK_SORTS, RESOURCE_SORTS
+
+
+def hot_queries():
+    """(label, query) pairs built by the same functions the routes use"""
+    newest = dict(type='all', author='', year='', q='')
+    return [
+        ('library.index (newest)',
+         keyset_query(queries.resource_listing(newest), RESOURCE_SORTS, 'created_at')),
+        ('library.books (type listing)',
+         keyset_query(queries.resource_listing(dict(newest, type='book')), RESOURCE_SORTS, 'created_at')),
+        ('popular resources', queries.popular_resources(6)),
+        ('topic resources', queries.topic_resources(1)),
+        ('topic prev-next navigation', queries.topic_neighbours(SimpleNamespace(id=1, module_id=1))),
+        ('user.bookmarks (keyset)', keyset_query(queries.bookmarked_resources(1), BOOKMARK_SORTS, 'created_at')),
+        ('recent bookmarks', queries.recent_bookmarks(1, 6)),
+        ('recent progress', queries.recent_progress(1, 5)),
+        ('quiz attempts for user', queries.quiz_attempts(1, [1, 2])),
+        ('latest news', queries.published_news().limit(3)),
+        ('word of the day', queries.daily_words(date.today())),
+        ('quiz of the day', queries.daily_quizzes(date.today())),
+        ('previous words', queries.previous_words(date.today(), 7)),
+    ]
+
+
+def explain(query):
+    """Return the SQLite query plan for ``query`` as a list of detail strings"""
+    sql = str(query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan):
+    problems = []
+    for detail in plan:
+        # "SCAN t USING INDEX ..." walks an index in order and is fine for
+        # LIMITed ORDER BY; a bare "SCAN t" reads the whole table.  Scans of
+        # subqueries and window co-routines only read rows already searched.
+        if detail.startswith('SCAN ') and ' USING ' not in detail and detail.split()[1] in db.metadata.tables:
+            problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans():
+    """Return ``{label: (plan, problems)}`` for every hot query"""
+    results = {}
+    for label, query in hot_queries():
+        plan = explain(query)
+        results[label] = (plan, plan_problems(plan))
+    return results
+
+
+@click.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot query regresses to a full table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('check-query-plans only understands SQLite query plans')
+
+    failed = False
+    for label, (plan, problems) in check_query_plans().items():
+        status = 'FAIL' if problems else 'ok'
+        click.echo(f'[{status}] {label}')
+        for detail in plan:
+            click.echo(f'       {detail}')
+        failed = failed or bool(problems)
+
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,166 @@
+# Indexable skip list for leaderboards
+#
+# RankedSet keeps members ordered by score (highest first, ties broken by the
+# member id) and answers "what rank is this member" and "who is at rank k" in
+# O(log n) expected time.  Each forward link stores how many bottom-level nodes
+# it skips, so a search can sum link widths on the way down to get a position.
+import random
+import threading
+
+MAX_LEVEL = 24  # plenty for 2**24 members at p=0.5
+_P = 0.5
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.width = [1] * level
+
+
+class RankedSet:
+    """Members with numeric scores, ordered by (score desc, member asc)"""
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0  # nodes linked, which briefly differs from len(_scores) during a move
+        self._scores = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    def score(self, member):
+        return self._scores.get(member)
+
+    @staticmethod
+    def _key(member, score):
+        return (-score, member)
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < _P:
+            level += 1
+        return level
+
+    def set(self, member, score):
+        """Insert ``member`` or move it to ``score``"""
+        with self._lock:
+            old = self._scores.get(member)
+            if old == score:
+                return
+            if old is not None:
+                self._unlink(self._key(member, old))
+            self._link(self._key(member, score))
+            self._scores[member] = score
+
+    def increment(self, member, amount):
+        with self._lock:
+            self.set(member, (self._scores.get(member) or 0) + amount)
+            return self._scores[member]
+
+    def discard(self, member):
+        with self._lock:
+            old = self._scores.pop(member, None)
+            if old is not None:
+                self._unlink(self._key(member, old))
+
+    def _link(self, key):
+        update = [self._head] * MAX_LEVEL
+        position = [0] * MAX_LEVEL
+        node = self._head
+        pos = 0
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                pos += node.width[i]
+                node = node.forward[i]
+            update[i] = node
+            position[i] = pos
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                position[i] = 0
+                self._head.width[i] = self._size + 1
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            prev = update[i]
+            skipped = pos - position[i]
+            new.forward[i] = prev.forward[i]
+            new.width[i] = prev.width[i] - skipped
+            prev.forward[i] = new
+            prev.width[i] = skipped + 1
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def _unlink(self, key):
+        update = [None] * MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        for i in range(self._level):
+            prev = update[i]
+            if prev.forward[i] is target:
+                prev.width[i] += target.width[i] - 1
+                prev.forward[i] = target.forward[i]
+            else:
+                prev.width[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def rank(self, member):
+        """0-based rank of ``member``, or None if it isn't in the set"""
+        with self._lock:
+            score = self._scores.get(member)
+            if score is None:
+                return None
+            key = self._key(member, score)
+            node = self._head
+            pos = 0
+            for i in range(self._level - 1, -1, -1):
+                while node.forward[i] is not None and node.forward[i].key <= key:
+                    pos += node.width[i]
+                    node = node.forward[i]
+            return pos - 1
+
+    def _node_at(self, index):
+        node = self._head
+        remaining = index + 1
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.width[i] <= remaining:
+                remaining -= node.width[i]
+                node = node.forward[i]
+        return node
+
+    def range(self, start, stop):
+        """``[(member, score), ...]`` for ranks ``start`` up to ``stop`` (exclusive)"""
+        with self._lock:
+            start = max(start, 0)
+            stop = min(stop, len(self._scores))
+            if start >= stop:
+                return []
+            node = self._node_at(start)
+            items = []
+            while node is not None and len(items) < stop - start:
+                score, member = -node.key[0], node.key[1]
+                items.append((member, score))
+                node = node.forward[0]
+            return items
+
+    def top(self, n):
+        return self.range(0, n)
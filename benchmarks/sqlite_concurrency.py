@@ -0,0 +1,104 @@
+"""Read throughput of SQLite while writers are committing.
+
+Compares a stock SQLite connection (rollback journal) with the production
+profile from ``app.utils.sqlite``.  Reader processes run the library listing
+query while writer processes bump view counters and commit after every
+update, which is what ``library.resource_detail`` does on each page view.
+
+    python benchmarks/sqlite_concurrency.py --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.sqlite import apply_pragmas, production_pragmas  # noqa: E402
+
+ROWS = 20000
+LISTING_SQL = ('SELECT id, title, view_count FROM resource WHERE is_active = 1 '
+               'ORDER BY created_at DESC, id DESC LIMIT 12 OFFSET ?')
+
+
+def connect(path, profile):
+    conn = sqlite3.connect(path, timeout=30)
+    if profile == 'production':
+        apply_pragmas(conn, production_pragmas({}))
+    return conn
+
+
+def build_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE resource (id INTEGER PRIMARY KEY, title TEXT, is_active BOOLEAN, '
+                 'view_count INTEGER, created_at TEXT)')
+    conn.execute('CREATE INDEX ix_resource_active_created ON resource (is_active, created_at)')
+    conn.executemany('INSERT INTO resource (title, is_active, view_count, created_at) VALUES (?, 1, 0, ?)',
+                     ((f'Resource {i}', f'2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}')
+                      for i in range(ROWS)))
+    conn.commit()
+    conn.close()
+
+
+def reader(path, profile, deadline, counter):
+    conn = connect(path, profile)
+    done = 0
+    while time.time() < deadline:
+        conn.execute(LISTING_SQL, (random.randrange(0, 200) * 12,)).fetchall()
+        done += 1
+    conn.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def writer(path, profile, deadline, counter):
+    conn = connect(path, profile)
+    done = 0
+    while time.time() < deadline:
+        conn.execute('UPDATE resource SET view_count = view_count + 1 WHERE id = ?', (random.randint(1, ROWS),))
+        conn.commit()
+        done += 1
+    conn.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def run(profile, readers, writers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build_database(path)
+        # journal_mode is persistent, so switch it once before workers start
+        connect(path, profile).close()
+
+        reads = multiprocessing.Value('i', 0)
+        writes = multiprocessing.Value('i', 0)
+        deadline = time.time() + seconds
+        procs = [multiprocessing.Process(target=reader, args=(path, profile, deadline, reads)) for _ in range(readers)]
+        procs += [multiprocessing.Process(target=writer, args=(path, profile, deadline, writes)) for _ in range(writers)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        return reads.value / seconds, writes.value / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile')
+    print(f'{"profile":<12}{"reads/s":>12}{"writes/s":>12}')
+    for profile in ('default', 'production'):
+        reads, writes = run(profile, args.readers, args.writers, args.seconds)
+        print(f'{profile:<12}{reads:>12.0f}{writes:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""quiz attempt expiry
+
+Revision ID: 1e7a4c9b2f68
+Revises: 9b3c6e0f4d52
+Create Date: 2026-10-19 21:15:36.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e7a4c9b2f68'
+down_revision = '9b3c6e0f4d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Attempts started before this migration stay untimed (expires_at NULL)
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('quiz_attempt')}
+    indexes = {index['name'] for index in inspector.get_indexes('quiz_attempt')}
+    with op.batch_alter_table('quiz_attempt') as batch_op:
+        if 'expires_at' not in columns:
+            batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+        if 'ix_quiz_attempt_open_expires' not in indexes:
+            batch_op.create_index('ix_quiz_attempt_open_expires', ['completed', 'expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('quiz_attempt') as batch_op:
+        batch_op.drop_index('ix_quiz_attempt_open_expires')
+        batch_op.drop_column('expires_at')
@@ -0,0 +1,47 @@
+"""composite indexes for hot queries
+
+Revision ID: 3f1c2a9d7b41
+Revises:
+Create Date: 2026-10-19 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - kept in step with __table_args__ in app/models/models.py
+INDEXES = [
+    ('ix_resource_active_type_created', 'resource', ['is_active', 'resource_type', 'created_at']),
+    ('ix_resource_active_created', 'resource', ['is_active', 'created_at']),
+    ('ix_resource_active_views', 'resource', ['is_active', 'view_count']),
+    ('ix_resource_topic_active', 'resource', ['topic_id', 'is_active']),
+    ('ix_module_course_active_order', 'module', ['course_id', 'is_active', 'order_index']),
+    ('ix_topic_module_active_order', 'topic', ['module_id', 'is_active', 'order_index']),
+    ('ix_user_progress_user_accessed', 'user_progress', ['user_id', 'last_accessed']),
+    ('ix_quiz_attempt_user_quiz_started', 'quiz_attempt', ['user_id', 'quiz_id', 'started_at']),
+    ('ix_quiz_topic_active', 'quiz', ['topic_id', 'is_active']),
+    ('ix_flashcard_topic_active', 'flashcard', ['topic_id', 'is_active']),
+    ('ix_news_article_published', 'news_article', ['is_published', 'published_at']),
+    ('ix_word_of_the_day_date_category', 'word_of_the_day', ['date', 'category']),
+    ('ix_quiz_of_the_day_date_category', 'quiz_of_the_day', ['date', 'category']),
+    ('ix_search_log_created', 'search_log', ['created_at']),
+]
+
+
+def upgrade():
+    # create_app() still runs db.create_all(), so a fresh database may already
+    # have these indexes by the time the migration runs.
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,47 @@
+"""flashcard state
+
+Revision ID: 5d1f7a3e8b20
+Revises: e2b58d4a9c17
+Create Date: 2026-10-19 18:20:44.610935
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f7a3e8b20'
+down_revision = 'e2b58d4a9c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A row is created the first time a user reviews a card
+    op.create_table(
+        'flashcard_state',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('flashcard_id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('ease', sa.Float(), nullable=False),
+        sa.Column('interval', sa.Integer(), nullable=False),
+        sa.Column('repetitions', sa.Integer(), nullable=False),
+        sa.Column('lapses', sa.Integer(), nullable=False),
+        sa.Column('due', sa.DateTime(), nullable=False),
+        sa.Column('last_reviewed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['flashcard_id'], ['flashcard.id']),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id', 'flashcard_id'),
+        if_not_exists=True
+    )
+    op.create_index('ix_flashcard_state_user_due', 'flashcard_state', ['user_id', 'due'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_flashcard_state_user_topic_due', 'flashcard_state', ['user_id', 'topic_id', 'due'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_flashcard_state_user_topic_due', table_name='flashcard_state', if_exists=True)
+    op.drop_index('ix_flashcard_state_user_due', table_name='flashcard_state', if_exists=True)
+    op.drop_table('flashcard_state', if_exists=True)
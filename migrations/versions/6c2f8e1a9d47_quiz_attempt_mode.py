@@ -0,0 +1,32 @@
+"""quiz attempt mode
+
+Revision ID: 6c2f8e1a9d47
+Revises: b4e1d7a2c953
+Create Date: 2026-10-20 11:02:17.884301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2f8e1a9d47'
+down_revision = 'b4e1d7a2c953'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing attempts, adaptive ones included, become 'standard'; they can't be told apart
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('quiz_attempt')}
+    with op.batch_alter_table('quiz_attempt') as batch_op:
+        if 'mode' not in columns:
+            batch_op.add_column(sa.Column('mode', sa.String(length=20), server_default='standard', nullable=False))
+        if 'served_question_id' not in columns:
+            batch_op.add_column(sa.Column('served_question_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('quiz_attempt') as batch_op:
+        batch_op.drop_column('served_question_id')
+        batch_op.drop_column('mode')
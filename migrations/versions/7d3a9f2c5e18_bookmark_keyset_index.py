@@ -0,0 +1,50 @@
+"""bookmark keyset index
+
+Revision ID: 7d3a9f2c5e18
+Revises: 6c2f8e1a9d47
+Create Date: 2026-10-21 09:41:05.216734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a9f2c5e18'
+down_revision = '6c2f8e1a9d47'
+branch_labels = None
+depends_on = None
+
+
+def _index_columns():
+    for index in sa.inspect(op.get_bind()).get_indexes('user_bookmarks'):
+        if index['name'] == 'ix_user_bookmarks_user_created':
+            return index['column_names']
+    return None
+
+
+def _replace_index(columns):
+    existing = _index_columns()
+    if existing == columns:
+        return
+    with op.batch_alter_table('user_bookmarks') as batch_op:
+        if existing is not None:
+            batch_op.drop_index('ix_user_bookmarks_user_created')
+        batch_op.create_index('ix_user_bookmarks_user_created', columns, unique=False)
+
+
+def upgrade():
+    # Bookmarks made before b4e1d7a2c953 get their resource's upload time:
+    # older than any later bookmark, and in the order the listing used before.
+    # Keyset cursors can't step past NULL keys.
+    op.execute(sa.text(
+        'UPDATE user_bookmarks SET created_at = '
+        '(SELECT resource.created_at FROM resource WHERE resource.id = user_bookmarks.resource_id) '
+        'WHERE created_at IS NULL'
+    ))
+    # resource_id is the keyset tiebreaker, so the index covers the whole ORDER BY
+    _replace_index(['user_id', 'created_at', 'resource_id'])
+
+
+def downgrade():
+    _replace_index(['user_id', 'created_at'])
@@ -0,0 +1,37 @@
+"""user counters for badge rules
+
+Revision ID: 8a4e6c2f1b93
+Revises: 3f1c2a9d7b41
+Create Date: 2026-10-19 11:40:03.527114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c2f1b93'
+down_revision = '3f1c2a9d7b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created and backfilled lazily by app.services.badges.get_counters
+    op.create_table(
+        'user_counters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('topics_completed', sa.Integer(), nullable=False),
+        sa.Column('quizzes_passed', sa.Integer(), nullable=False),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('longest_streak', sa.Integer(), nullable=False),
+        sa.Column('last_active_date', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('user_counters', if_exists=True)
@@ -0,0 +1,37 @@
+"""topic mastery
+
+Revision ID: 9b3c6e0f4d52
+Revises: 5d1f7a3e8b20
+Create Date: 2026-10-19 19:47:03.125870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3c6e0f4d52'
+down_revision = '5d1f7a3e8b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A row is created by a user's first adaptive quiz answer on the topic
+    op.create_table(
+        'topic_mastery',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('rating', sa.Float(), nullable=False),
+        sa.Column('variance', sa.Float(), nullable=False),
+        sa.Column('answers_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['topic_id'], ['topic.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id', 'topic_id'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('topic_mastery', if_exists=True)
@@ -0,0 +1,32 @@
+"""bookmark created_at
+
+Revision ID: b4e1d7a2c953
+Revises: 1e7a4c9b2f68
+Create Date: 2026-10-20 10:12:48.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e1d7a2c953'
+down_revision = '1e7a4c9b2f68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Bookmarks made before this migration have no timestamp and sort last
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user_bookmarks')}
+    if 'created_at' in columns:
+        return
+    with op.batch_alter_table('user_bookmarks') as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_user_bookmarks_user_created', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_bookmarks') as batch_op:
+        batch_op.drop_index('ix_user_bookmarks_user_created')
+        batch_op.drop_column('created_at')
@@ -0,0 +1,51 @@
+"""points ledger
+
+Revision ID: c7d93e15a06f
+Revises: 8a4e6c2f1b93
+Create Date: 2026-10-19 13:05:27.901446
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d93e15a06f'
+down_revision = '8a4e6c2f1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing User.total_points stay as the compacted base; the ledger
+    # starts empty with no checkpoint row (treated as 0)
+    op.create_table(
+        'points_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.String(length=30), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True
+    )
+    op.create_index('ix_points_event_user_created', 'points_event', ['user_id', 'created_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_points_event_created', 'points_event', ['created_at'], unique=False, if_not_exists=True)
+    op.create_table(
+        'ledger_checkpoint',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('ledger_checkpoint', if_exists=True)
+    op.drop_index('ix_points_event_created', table_name='points_event', if_exists=True)
+    op.drop_index('ix_points_event_user_created', table_name='points_event', if_exists=True)
+    op.drop_table('points_event', if_exists=True)
@@ -0,0 +1,37 @@
+"""quiz item analysis
+
+Revision ID: e2b58d4a9c17
+Revises: c7d93e15a06f
+Create Date: 2026-10-19 16:42:10.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b58d4a9c17'
+down_revision = 'c7d93e15a06f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created by the first analysis run of each quiz
+    op.create_table(
+        'quiz_item_analysis',
+        sa.Column('quiz_id', sa.Integer(), nullable=False),
+        sa.Column('key_fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('last_attempt_id', sa.Integer(), nullable=False),
+        sa.Column('attempt_count', sa.Integer(), nullable=False),
+        sa.Column('sums', sa.Text(), nullable=True),
+        sa.Column('results', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['quiz_id'], ['quiz.id']),
+        sa.PrimaryKeyConstraint('quiz_id'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('quiz_item_analysis', if_exists=True)
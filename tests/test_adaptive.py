@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+os.environ['BACKGROUND_WORKERS'] = '0'
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import create_app  # noqa: E402
+from app.models.models import db, User, Course, Module, Topic, Quiz, QuizQuestion, QuizAttempt  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        user = User(email='student@example.com', name='Student', password_hash='x', track='Medical')
+        course = Course(name='Pharmacology', track='Medical')
+        db.session.add_all([user, course])
+        db.session.flush()
+        module = Module(name='Basics', course_id=course.id)
+        db.session.add(module)
+        db.session.flush()
+        topic = Topic(title='Beta blockers', module_id=module.id)
+        db.session.add(topic)
+        db.session.flush()
+        quiz = Quiz(title='Beta blockers', topic_id=topic.id, passing_score=90, max_attempts=3)
+        db.session.add(quiz)
+        db.session.flush()
+        db.session.add_all([QuizQuestion(question_text=f'Question {i}', quiz_id=quiz.id, options='["a", "b"]',
+                                         correct_answer='a') for i in range(12)])
+        db.session.commit()
+        app.config['TEST_IDS'] = {'user': user.id, 'quiz': quiz.id}
+        yield app
+
+
+def test_perfect_adaptive_session_passes(app):
+    ids = app.config['TEST_IDS']
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(ids['user'])
+        session['_fresh'] = True
+
+    started = client.post(f"/courses/quiz/{ids['quiz']}/adaptive/start").get_json()
+    assert started['success'], started
+    attempt_id, question = started['attempt_id'], started['question']
+
+    for _ in range(12):
+        result = client.post(f'/courses/quiz-attempt/{attempt_id}/adaptive/answer',
+                             json={'question_id': question['id'], 'answer': 'a'}).get_json()
+        assert result['success'], result
+        if result['finished']:
+            break
+        question = result['question']
+
+    assert result['finished']
+    assert result['passed']
+    assert result['score'] == 100
+    assert db.session.get(QuizAttempt, attempt_id).score == 100
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+os.environ['BACKGROUND_WORKERS'] = '0'
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import create_app  # noqa: E402
+from app.utils.query_plans import check_query_plans  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+def test_hot_queries_use_indexes(app):
+    # the queries come from app.utils.queries, the builders the routes call
+    results = check_query_plans()
+    assert results
+    failures = {label: plan for label, (plan, problems) in results.items() if problems}
+    assert not failures, failures